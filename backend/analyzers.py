@@ -0,0 +1,172 @@
+# backend/analyzers.py
+"""
+Registry of event analyzers.
+
+Each analyzer declares the event it reports, the class labels it reads and
+the model that has to produce them, and names its code as "module:function"
+strings that are only imported once the analyzer is enabled. The enabled
+set decides which models get loaded: analyzers sharing a model share its
+forward pass, and a deployment that only watches for fire never loads the
+pose model or imports the fall logic.
+
+The built-in catalog can be changed through a JSON file (ANALYZERS_CONFIG):
+
+    {
+        "enabled": ["fall", "fire"],
+        "analyzers": {
+            "fall": {"model": "yolov8n-pose.pt"},
+            "fire": {"model": "fire-smoke.pt", "classes": ["fire"]},
+            "knife": {"classes": ["knife"], "rule": "plugins.knife:detect_knife"}
+        }
+    }
+
+Entries are merged over the built-ins, so new analyzers can be plugged in
+from any importable module.
+"""
+
+import importlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Model used by analyzers that do not name their own
+DEFAULT_MODEL = os.getenv("VISION_MODEL", "yolov8n.pt")
+# Comma-separated analyzers to run (overridden by "enabled" in the config file)
+ENABLED_ANALYZERS = os.getenv("ENABLED_ANALYZERS", "fall,fire,smoke,drowning,overdose")
+# Optional JSON file adjusting or extending the built-in analyzers
+ANALYZERS_CONFIG = os.getenv("ANALYZERS_CONFIG", "")
+
+
+def _import(target: str) -> Callable:
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+@dataclass
+class AnalyzerSpec:
+    """
+    One analyzer.
+
+    Attributes:
+        name: Event type it reports.
+        classes: Detection labels it reads.
+        model: Weights that produce those labels.
+        rule: "module:function" of its vectorized rule,
+            (detections, rows, frame_temporal) -> AnalyzeResponse or None.
+        handler: "module:function" of its per-detection handler,
+            (detection_dicts, mock) -> AnalyzeResponse, used for mock responses.
+        posture: "module:function" of a (detections) -> (N,) mask of the
+            rows lying down, which TemporalState times for the rule.
+    """
+    name: str
+    classes: Tuple[str, ...]
+    model: str = DEFAULT_MODEL
+    rule: Optional[str] = None
+    handler: Optional[str] = None
+    posture: Optional[str] = None
+    _loaded: Dict[str, Callable] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def _resolve(self, kind: str) -> Optional[Callable]:
+        target = getattr(self, kind)
+        if target is None:
+            return None
+        if kind not in self._loaded:
+            self._loaded[kind] = _import(target)
+        return self._loaded[kind]
+
+    def load_rule(self) -> Optional[Callable]:
+        return self._resolve("rule")
+
+    def load_handler(self) -> Optional[Callable]:
+        return self._resolve("handler")
+
+    def load_posture(self) -> Optional[Callable]:
+        return self._resolve("posture")
+
+
+BUILTIN_ANALYZERS: Dict[str, AnalyzerSpec] = {
+    spec.name: spec for spec in [
+        AnalyzerSpec("fall", ("person",), rule="events.fall:detect_falls", handler="events.fall:analyze_fall",
+                     posture="events.fall:horizontal_mask"),
+        AnalyzerSpec("fire", ("fire",), rule="events.fire:detect_fire", handler="events.fire:analyze_fire"),
+        AnalyzerSpec("smoke", ("smoke",), handler="events.smoke:analyze_smoke"),
+        AnalyzerSpec("drowning", ("drowning",), handler="events.drowning:analyze_drowning"),
+        AnalyzerSpec("overdose", ("overdose",), handler="events.overdose:analyze_overdose"),
+    ]
+}
+
+
+class AnalyzerRegistry:
+    """The enabled analyzers, and the models and code they need."""
+
+    def __init__(self, analyzers: Iterable[AnalyzerSpec]):
+        self.analyzers: List[AnalyzerSpec] = list(analyzers)
+        # Each label is read from one model only: the first analyzer that
+        # asks for it decides which
+        self.label_models: Dict[str, str] = {}
+        for spec in self.analyzers:
+            for label in spec.classes:
+                model = self.label_models.setdefault(label, spec.model)
+                if model != spec.model:
+                    logger.warning("Analyzer %s reads %r from %s, which already comes from %s",
+                                   spec.name, label, spec.model, model)
+
+    def models(self) -> Dict[str, List[str]]:
+        """Model -> labels it has to produce, for every model that is needed."""
+        plan: Dict[str, List[str]] = {}
+        for label, model in self.label_models.items():
+            plan.setdefault(model, []).append(label)
+        return plan
+
+    def rules(self) -> List[Tuple[AnalyzerSpec, Callable]]:
+        """Enabled analyzers that have a vectorized rule, imported on first use."""
+        return [(spec, rule) for spec in self.analyzers if (rule := spec.load_rule()) is not None]
+
+    def posture_test(self) -> Optional[Callable]:
+        """The first enabled analyzer's posture test, or None when none has one."""
+        for spec in self.analyzers:
+            posture = spec.load_posture()
+            if posture is not None:
+                return posture
+        return None
+
+    def handlers(self) -> Dict[str, Callable]:
+        """Label -> handler used for mock responses."""
+        handlers = {}
+        for spec in self.analyzers:
+            handler = spec.load_handler()
+            if handler is not None:
+                for label in spec.classes:
+                    handlers.setdefault(label, handler)
+        return handlers
+
+
+def load_registry(config_path: str = ANALYZERS_CONFIG, enabled: str = ENABLED_ANALYZERS) -> AnalyzerRegistry:
+    """
+    Builds the registry from the built-ins, the optional config file and
+    the enabled list.
+
+    Raises:
+        ValueError: An enabled analyzer is not defined anywhere.
+    """
+    catalog = dict(BUILTIN_ANALYZERS)
+    names = [name.strip() for name in enabled.split(",") if name.strip()]
+
+    if config_path:
+        with open(config_path) as f:
+            config: Dict[str, Any] = json.load(f)
+        for name, options in config.get("analyzers", {}).items():
+            if "classes" in options:
+                options = {**options, "classes": tuple(options["classes"])}
+            base = catalog.get(name)
+            catalog[name] = replace(base, **options) if base is not None else AnalyzerSpec(name=name, **options)
+        names = config.get("enabled", names)
+
+    unknown = [name for name in names if name not in catalog]
+    if unknown:
+        raise ValueError(f"Unknown analyzers: {', '.join(unknown)}")
+    return AnalyzerRegistry(catalog[name] for name in names)
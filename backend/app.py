@@ -4,20 +4,79 @@ Main API server for emergency event detection and analysis.
 """
 
 from __future__ import annotations
-from fastapi import FastAPI, File, UploadFile, Form
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple
+import cv2
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from schema import AnalyzeRequest, AnalyzeResponse
-from classifyEvent import classifyEvent, initialize_vision_engine
+from schema import (AnalyzeRequest, AnalyzeResponse, EventCount, JobStatus, StoredDetection, StoredEvent, StreamRequest,
+                    StreamStatus)
+from classifyEvent import analyze_frames, cache_stats, classifyEvent, readiness, route_detections, start_engine_loading
+from ingest import MultipartUpload, UploadTooLarge
+from executor import ExecutorBusy, InferenceExecutor, InferenceTimeout
+from jobs import JobManager, JobQueueFull
+from streams import StreamManager
+from clips import CLIP_DIR, CLIP_URL_PREFIX
+from serialization import COLUMNAR, JSON, MSGPACK, NDJSON, dumps, render
+from store import EVENT_QUERY_MAX_ROWS, EVENT_STORE_PATH, EventStore
+from metrics import CONTENT_TYPE, HTTP_LATENCY, HTTP_REQUESTS, QUEUE_DEPTH, REGISTRY, STAGE_SECONDS, STREAM_LOAD
+from tracing import PROFILER_ENDPOINTS, PROFILER_INTERVAL_MS, PROFILER_MAX_SECONDS, SamplingProfiler, Trace, wants_trace
 
 
 
 
 app = FastAPI(title="Emergency Vision Copilot", version="0.1.0")
 
-# Initialize the vision engine at startup to avoid reloading the model on every request
+# Bounded pool that runs every analysis; full pool -> 429 instead of queueing forever
+inference_executor = InferenceExecutor()
+# Background analysis of long videos (POST /jobs)
+job_manager = JobManager()
+
+# How often the job event stream checks for new events
+JOB_STREAM_POLL_S = 0.25
+# History of every stream's events and detections (GET /events, /detections)
+event_store = EventStore() if EVENT_STORE_PATH else None
+# Live cameras/files/URLs, analyzed together in batched forward passes
+stream_manager = StreamManager(analyze_frames, route_detections, store=event_store)
+
+# Queue depths are read when /metrics is scraped
+QUEUE_DEPTH.set_function(lambda: inference_executor.queue_depth, queue="analysis")
+QUEUE_DEPTH.set_function(lambda: inference_executor.in_flight - inference_executor.queue_depth,
+                         queue="analysis_running")
+QUEUE_DEPTH.set_function(lambda: job_manager.queued, queue="jobs")
+QUEUE_DEPTH.set_function(lambda: len(stream_manager.list()), queue="streams")
+if stream_manager.clips is not None:
+    QUEUE_DEPTH.set_function(stream_manager.clips.pending, queue="clips")
+if event_store is not None:
+    QUEUE_DEPTH.set_function(lambda: event_store.pending, queue="event_store")
+STREAM_LOAD.set_function(stream_manager.scheduler.load)
+
+# Profile collected through /debug/profiler (PROFILER_ENDPOINTS=1)
+profiler: Optional[SamplingProfiler] = None
+
+# Frame rate of the MJPEG preview of a live stream
+MJPEG_PREVIEW_FPS = 10.0
+# Stream started by the frontend's webcam page
+WEBCAM_STREAM_ID = "webcam"
+
+# Load the models once at startup instead of on every request. Loading and
+# warm-up run in the background so /health answers immediately; /ready
+# tells when analyses can start.
 @app.on_event("startup")
 async def startup_event():
-    initialize_vision_engine()
+    start_engine_loading()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    inference_executor.shutdown()
+    job_manager.shutdown()
+    stream_manager.shutdown()
+    if event_store is not None:
+        event_store.close()
 
 # CORS: allow local UI (Tauri/Electron/React) to call the API
 app.add_middleware(
@@ -26,26 +85,244 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+class MetricsMiddleware:
+    """Counts requests and their latency by route template and status code."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router stores the matched route in the scope; templates
+            # keep ids out of the label values
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(route=route, status=status)
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok", "service": "emergency-vision-copilot", "version": "0.1.0"}
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-def analyze(
-    source: str = Form(...),
-    mock: bool = Form(False),
-    video_file: UploadFile = File(...)
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once every model is loaded and warmed up, 503 while
+    they are loading (or failed to load), with the state of each model.
+    """
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+@app.get("/cache")
+async def cache():
+    """Hit/miss counters and sizes of the upload result and frame caches."""
+    return cache_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Request, stage, model and queue metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get(CLIP_URL_PREFIX + "/{name}")
+async def clip(name: str):
+    """An event clip or thumbnail, as linked from an event's `evidence.notes`."""
+    # Only plain file names inside CLIP_DIR; files still being written end in .partial
+    path = os.path.join(CLIP_DIR, os.path.basename(name))
+    if os.path.basename(name) != name or ".partial" in name or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Unknown clip: {name}")
+    return FileResponse(path)
+
+def _require_profiler():
+    if not PROFILER_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.post("/debug/profiler/start")
+async def start_profiler(interval_ms: float = PROFILER_INTERVAL_MS, max_seconds: float = PROFILER_MAX_SECONDS):
+    """
+    Starts sampling the stacks of every thread (replacing the previous
+    profile). Stops by itself after `max_seconds`.
+    """
+    global profiler
+    _require_profiler()
+    if profiler is None or not profiler.running:
+        profiler = SamplingProfiler(interval_ms).start(min(max_seconds, PROFILER_MAX_SECONDS))
+    return profiler.status()
+
+@app.post("/debug/profiler/stop")
+async def stop_profiler():
+    """Stops the profiler and returns its samples as collapsed stacks, for flamegraph tools."""
+    _require_profiler()
+    if profiler is None:
+        raise HTTPException(status_code=409, detail="The profiler was not started")
+    await asyncio.to_thread(profiler.stop)
+    return PlainTextResponse(profiler.collapsed())
+
+@app.get("/debug/profiler")
+async def profiler_status():
+    """Whether the profiler runs, how many samples it took and the hottest frames."""
+    _require_profiler()
+    if profiler is None:
+        return {"running": False, "samples": 0}
+    return profiler.status()
+
+def _form_bool(value: Optional[str]) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+def _multipart_body(file_field: str, **fields: Dict[str, Any]) -> Dict[str, Any]:
+    """OpenAPI description of a multipart body parsed by MultipartUpload."""
+    properties = {file_field: {"type": "string", "format": "binary"}, **fields}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "properties": properties, "required": [file_field],
+    }}}}}
+
+async def _start_upload(
+    request: Request,
+    file_field: str,
+    required_fields: Tuple[str, ...] = (),
+) -> Tuple[MultipartUpload, "asyncio.Task"]:
+    """
+    Starts receiving a multipart upload in the background and returns once
+    the file part has begun and the required form fields are known.
+    """
+    upload = MultipartUpload(request, file_field)
+    receiving = asyncio.create_task(upload.receive())
+    try:
+        await upload.wait_for_file()
+        if any(name not in upload.fields for name in required_fields):
+            # These fields were sent after the file, so wait for the whole body
+            await receiving
+        missing = [name for name in required_fields if name not in upload.fields]
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing form field(s): {', '.join(missing)}")
+    except BaseException:
+        _stop_upload(upload, receiving)
+        raise
+    return upload, receiving
+
+def _stop_upload(upload: MultipartUpload, receiving: "asyncio.Task"):
+    if not receiving.done():
+        receiving.cancel()
+    upload.buffer.close()
+
+def _observe_stage(trace: Trace, stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace.add(stage, seconds)
+
+def _set_server_timing(request: Request, response: Response, trace: Trace):
+    """Returns the trace in a Server-Timing header if the request sent `X-Trace: 1`."""
+    if wants_trace(request.headers):
+        response.headers["Server-Timing"] = trace.server_timing()
+
+async def _classify_upload(
+    request: Request,
+    file_field: str,
+    required_fields: Tuple[str, ...] = (),
+    source: str = "file",
+    trace: Optional[Trace] = None,
 ) -> AnalyzeResponse:
     """
-    Accepts a video file upload and analyzes it.
+    Streams a multipart upload into an UploadBuffer and runs classifyEvent
+    on it while the body is still arriving.
+    
+    A worker slot is reserved before the body is read, so an overloaded
+    server rejects the request (429) without receiving the upload.
+    `trace` receives the upload and queue times besides the analysis stages.
+    """
+    trace = trace if trace is not None else Trace()
+    try:
+        reservation = inference_executor.reserve()
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    with reservation:
+        started = time.perf_counter()
+        try:
+            upload, receiving = await _start_upload(request, file_field, required_fields)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        def received(task: "asyncio.Task"):
+            if not task.cancelled() and task.exception() is None:
+                _observe_stage(trace, "upload", time.perf_counter() - started)
+
+        receiving.add_done_callback(received)
+
+        cancel = threading.Event()
+        try:
+            analysis = reservation.run(
+                classifyEvent,
+                upload.buffer,
+                source=upload.fields.get("source", source),
+                mock=_form_bool(upload.fields.get("mock")),
+                cancel=cancel,
+                trace=trace,
+                on_timeout=cancel.set,
+            )
+            result, _ = await asyncio.gather(analysis, receiving)
+            _observe_stage(trace, "queue", reservation.queued_seconds)
+            return result
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InferenceTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        finally:
+            _stop_upload(upload, receiving)
+
+# Media types /jobs/{id} and /analyze answer in, chosen by Accept (see serialization.py)
+JOB_FORMATS = (JSON, COLUMNAR, MSGPACK)
+ANALYZE_FORMATS = JOB_FORMATS + (NDJSON,)
+
+def _openapi_formats(formats: Tuple[str, ...]) -> Dict[int, Any]:
+    return {200: {"content": {media_type: {} for media_type in formats if media_type != JSON}}}
+
+def _render(request: Request, content: Any, trace: Trace, offered: Tuple[str, ...] = ANALYZE_FORMATS) -> Response:
+    """Encodes `content` in the format the request accepts, timing it as the serialize stage."""
+    started = time.perf_counter()
+    response = render(content, request.headers, offered)
+    _observe_stage(trace, "serialize", time.perf_counter() - started)
+    return response
+
+@app.post(
+    "/analyze",
+    response_model=AnalyzeResponse,
+    responses=_openapi_formats(ANALYZE_FORMATS),
+    openapi_extra=_multipart_body(
+        "video_file",
+        source={"type": "string", "enum": ["webcam", "file", "stream"]},
+        mock={"type": "boolean", "default": False},
+    ),
+)
+async def analyze(request: Request) -> Response:
+    """
+    Accepts a video file upload and analyzes it. With `X-Trace: 1` the time
+    spent in each stage comes back in a Server-Timing header. The result is
+    JSON unless the Accept header asks for a compact format.
     """
+    trace = Trace()
     try:
-        file_bytes = video_file.file.read()
-        return classifyEvent(file_bytes, source=source, mock=mock)
+        result = await _classify_upload(request, "video_file", required_fields=("source",), trace=trace)
+    except HTTPException:
+        raise
     except Exception as e:
-        return AnalyzeResponse(
+        result = AnalyzeResponse(
             severity=0.0,
             explanation=f"Service error: {str(e)}",
             recommended_actions=["Contact technical support if this error persists."],
@@ -53,23 +330,28 @@ def analyze(
             categories=[],
             events=[],
         )
+    response = _render(request, result, trace)
+    _set_server_timing(request, response, trace)
+    return response
 
-@app.post("/analyze_video")
-def analyze_video(file: UploadFile = File(...)):
+@app.post("/analyze_video", openapi_extra=_multipart_body("file"))
+async def analyze_video(request: Request, response: Response):
     """
     Simplified endpoint for video analysis that matches frontend expectations.
+    Supports `X-Trace: 1` like /analyze.
     """
+    trace = Trace()
     try:
-        file_bytes = file.file.read()
-        result = classifyEvent(file_bytes, source="file", mock=False)
+        result = await _classify_upload(request, "file", source="file", trace=trace)
+        _set_server_timing(request, response, trace)
         
         # Convert AnalyzeResponse to the format expected by frontend
         events = []
         if result.events:
             for event in result.events:
                 events.append({
-                    "type": event.get("type", "Unknown"),
-                    "confidence": event.get("confidence", 0.0)
+                    "type": event.type,
+                    "confidence": event.confidence
                 })
         
         return {
@@ -78,10 +360,225 @@ def analyze_video(file: UploadFile = File(...)):
             "severity": result.severity,
             "recommended_actions": result.recommended_actions
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "events": [],
             "explanation": f"Analysis error: {str(e)}",
             "severity": 0.0,
             "recommended_actions": ["Contact technical support if this error persists."]
-        }
\ No newline at end of file
+        }
+
+@app.post(
+    "/jobs",
+    response_model=JobStatus,
+    status_code=202,
+    openapi_extra=_multipart_body(
+        "video_file",
+        source={"type": "string", "enum": ["webcam", "file", "stream"]},
+        mock={"type": "boolean", "default": False},
+    ),
+)
+async def create_job(request: Request) -> JobStatus:
+    """
+    Queues a video for background analysis and returns its job id as soon
+    as the upload is received. Analysis starts while the upload is still
+    arriving if a job worker is free.
+    """
+    try:
+        upload, receiving = await _start_upload(request, "video_file")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        job = job_manager.submit(
+            upload.buffer,
+            source=upload.fields.get("source", "file"),
+            mock=_form_bool(upload.fields.get("mock")),
+        )
+    except JobQueueFull as e:
+        _stop_upload(upload, receiving)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    try:
+        await receiving
+    except UploadTooLarge as e:
+        job_manager.discard(job.id)
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        job_manager.discard(job.id)
+        raise
+    return job.snapshot()
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=JobStatus, responses=_openapi_formats(JOB_FORMATS))
+async def get_job(job_id: str, request: Request) -> Response:
+    """
+    Reports a job's progress, the events found so far and, once it is done,
+    the final analysis. Compact formats are negotiated like /analyze.
+    """
+    return _render(request, _get_job(job_id).snapshot(), Trace(), offered=JOB_FORMATS)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Streams a job's events as newline-delimited JSON, one `Event` per line,
+    as soon as they are found. The stream ends when the job finishes.
+    """
+    job = _get_job(job_id)
+
+    async def events():
+        cursor = 0
+        while True:
+            finished = job.finished
+            while cursor < len(job.events):
+                yield job.events[cursor].model_dump_json() + "\n"
+                cursor += 1
+            if finished:
+                return
+            await asyncio.sleep(JOB_STREAM_POLL_S)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def _get_stream(stream_id: str):
+    stream = stream_manager.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"Unknown stream: {stream_id}")
+    return stream
+
+@app.post("/streams", response_model=StreamStatus, status_code=201)
+async def start_stream(req: StreamRequest) -> StreamStatus:
+    """
+    Starts continuous analysis of a webcam, video file or RTSP/HTTP URL.
+    Use `loop: true` with a local file to simulate a camera. `fps` caps how
+    often it is analyzed and `priority` weighs it against other streams;
+    `tiled` and `roi` set up tiling and zones for high-resolution cameras.
+    """
+    options = {name: value for name, value in (("detect_every", req.detect_every),
+                                               ("motion_gate", req.motion_gate),
+                                               ("motion_threshold", req.motion_threshold),
+                                               ("fps", req.fps),
+                                               ("tiled", req.tiled))
+               if value is not None}
+    try:
+        stream = stream_manager.start(req.source, stream_id=req.stream_id, loop=req.loop, mock=req.mock,
+                                      priority=req.priority, roi=req.roi, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return stream_manager.status(stream)
+
+@app.get("/streams", response_model=List[StreamStatus])
+async def list_streams() -> List[StreamStatus]:
+    return [stream_manager.status(stream) for stream in stream_manager.list()]
+
+@app.get("/streams/{stream_id}", response_model=StreamStatus)
+async def get_stream(stream_id: str) -> StreamStatus:
+    """Reports a stream's counters, sampling rate, latest analysis and recent events."""
+    return stream_manager.status(_get_stream(stream_id))
+
+@app.delete("/streams/{stream_id}", response_model=StreamStatus)
+async def delete_stream(stream_id: str) -> StreamStatus:
+    # stop() itself tells whether the stream existed, so a concurrent stop is a 404
+    stream = stream_manager.stop(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"Unknown stream: {stream_id}")
+    return stream.status()
+
+@app.get("/streams/{stream_id}/mjpeg")
+async def stream_preview(stream_id: str):
+    """MJPEG preview of the frames a stream is reading."""
+    stream = _get_stream(stream_id)
+
+    async def frames():
+        last_seq = 0
+        while stream_manager.get(stream_id) is stream and stream.reader.alive:
+            seq, frame, _ = stream.reader.latest.peek()
+            if seq != last_seq and frame is not None:
+                last_seq = seq
+                ok, jpeg = await asyncio.to_thread(cv2.imencode, ".jpg", frame)
+                if ok:
+                    yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg.tobytes() + b"\r\n"
+            await asyncio.sleep(1.0 / MJPEG_PREVIEW_FPS)
+
+    return StreamingResponse(frames(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+def _require_store() -> EventStore:
+    if event_store is None:
+        raise HTTPException(status_code=404, detail="The event store is disabled (EVENT_STORE_PATH is empty)")
+    return event_store
+
+# The history endpoints are plain functions: FastAPI runs them in its thread
+# pool, where each thread keeps its own read connection
+
+@app.get("/events", response_model=List[StoredEvent])
+def list_events(
+    source: Optional[str] = None,
+    event_type: Optional[str] = Query(None, alias="type"),
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    last: Optional[float] = Query(None, gt=0),
+    limit: int = Query(100, ge=1, le=EVENT_QUERY_MAX_ROWS),
+    order: Literal["desc", "asc"] = "desc",
+) -> Response:
+    """
+    Stored stream events, newest first, e.g. `/events?source=cam3&type=fall&last=3600`
+    for every fall on cam3 in the last hour. `since`/`until` are Unix times.
+    """
+    rows = _require_store().events(source, event_type, since=since, until=until, last=last, limit=limit,
+                                   newest_first=order == "desc")
+    return Response(dumps(rows), media_type=JSON)
+
+@app.get("/events/counts", response_model=List[EventCount])
+def count_events(
+    source: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    last: Optional[float] = Query(None, gt=0),
+) -> Response:
+    """Number of stored events per stream and type in a time range."""
+    rows = _require_store().counts(source, since=since, until=until, last=last)
+    return Response(dumps(rows), media_type=JSON)
+
+@app.get("/detections", response_model=List[StoredDetection])
+def list_detections(
+    source: str,
+    label: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    last: Optional[float] = Query(None, gt=0),
+    limit: int = Query(1000, ge=1, le=EVENT_QUERY_MAX_ROWS),
+    order: Literal["desc", "asc"] = "desc",
+) -> Response:
+    """Stored detections of one stream, filtered like /events."""
+    rows = _require_store().detections(source, label, since=since, until=until, last=last, limit=limit,
+                                       newest_first=order == "desc")
+    return Response(dumps(rows), media_type=JSON)
+
+@app.get("/store")
+def store_stats():
+    """Size, row counts, write backlog and retention state of the event store."""
+    return _require_store().stats()
+
+@app.post("/analyze_camera")
+async def analyze_camera(request: Request):
+    """
+    Starts analyzing the server's webcam; used by the frontend's live page.
+    """
+    stream = stream_manager.start("webcam", stream_id=WEBCAM_STREAM_ID)
+    return {
+        "stream_id": stream.id,
+        "video_url": str(request.url_for("stream_preview", stream_id=stream.id)),
+        "status": stream_manager.status(stream),
+    }
+
+@app.post("/stop_stream")
+async def stop_stream(stream_id: str = WEBCAM_STREAM_ID):
+    """Stops a live stream (the webcam stream by default)."""
+    stream = stream_manager.stop(stream_id)
+    return {"stream_id": stream_id, "stopped": stream is not None}
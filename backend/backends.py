@@ -0,0 +1,326 @@
+# backend/backends.py
+"""
+Inference backends for the YOLO models.
+
+Besides plain PyTorch, a model can run as an exported ONNX Runtime or
+OpenVINO graph (dynamic batch, optionally INT8-quantized), which is much
+faster on CPU-only machines. Exports are cached on disk under a key made of
+the weights' hash, the backend and the precision, so each one is built once
+per model version. If an export or its runtime is unavailable the engine
+falls back to PyTorch.
+
+Exports can also be built ahead of time, and backends compared on a site's
+own footage:
+
+    python backends.py export --model yolov8n.pt --backend openvino --int8
+    python backends.py report --model yolov8n.pt --source sample.mp4 --json report.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+# Backend VisionEngine uses unless told otherwise
+DEFAULT_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Use INT8-quantized exports
+DEFAULT_INT8 = os.getenv("INFERENCE_INT8", "0") == "1"
+# Where exported models are kept
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_cache"))
+# Dataset YAML used to calibrate OpenVINO INT8 exports
+CALIBRATION_DATA = os.getenv("EXPORT_CALIBRATION_DATA", "coco8.yaml")
+# Input size of exported graphs
+EXPORT_IMAGE_SIZE = 640
+
+
+def _yolo(path: str) -> "YOLO":
+    # ultralytics pulls in torch, which takes seconds to import: it is only
+    # imported once a model is actually loaded, so the API comes up first
+    from ultralytics import YOLO
+
+    return YOLO(path)
+
+
+def model_hash(model_name: str) -> str:
+    """SHA-256 of the weights file (of the name, if it is not a local file)."""
+    digest = hashlib.sha256()
+    if os.path.isfile(model_name):
+        with open(model_name, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(model_name.encode())
+    return digest.hexdigest()
+
+
+def cache_path(model_name: str, backend: str, int8: bool = False, cache_dir: str = MODEL_CACHE_DIR) -> str:
+    stem = os.path.splitext(os.path.basename(model_name))[0]
+    key = f"{stem}-{model_hash(model_name)[:16]}-{backend}{'-int8' if int8 else ''}"
+    # OpenVINO models are directories; ultralytics recognizes them by this suffix
+    return os.path.join(cache_dir, key + (".onnx" if backend == "onnx" else "_openvino_model"))
+
+
+def _quantize_onnx(source: str, target: str):
+    # Dynamic quantization: INT8 weights, activations quantized on the fly,
+    # so no calibration data is needed
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+
+
+def export_model(
+    model_name: str,
+    backend: str,
+    int8: bool = False,
+    batch_size: int = 1,
+    calibration_data: str = CALIBRATION_DATA,
+    cache_dir: str = MODEL_CACHE_DIR,
+) -> str:
+    """
+    Exports `model_name` for `backend`, reusing a cached export if there is one.
+
+    Args:
+        model_name: Torch weights (or a model YAML) to export.
+        backend: "onnx" or "openvino".
+        int8: Quantize to INT8 (ONNX: dynamic quantization; OpenVINO:
+            post-training quantization calibrated on `calibration_data`).
+        batch_size: Largest batch the graph is prepared for; the batch axis
+            stays dynamic.
+        calibration_data: Dataset YAML for OpenVINO INT8 calibration.
+        cache_dir: Where exports are kept.
+
+    Returns:
+        Path of the exported model.
+    """
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"Cannot export to {backend!r}")
+    target = cache_path(model_name, backend, int8, cache_dir)
+    if os.path.exists(target):
+        return target
+    os.makedirs(cache_dir, exist_ok=True)
+
+    model = _yolo(model_name)
+    options: Dict[str, Any] = {"format": backend, "dynamic": True, "batch": max(1, batch_size),
+                               "imgsz": EXPORT_IMAGE_SIZE}
+    if backend == "openvino" and int8:
+        options.update(int8=True, data=calibration_data)
+    exported = model.export(**options)
+
+    staging = target + ".partial"
+    if backend == "onnx" and int8:
+        _quantize_onnx(exported, staging)
+    else:
+        shutil.move(exported, staging)
+    # Only complete exports ever appear under the cache key
+    os.replace(staging, target)
+    return target
+
+
+def _export_in_child(model_name: str, backend: str, int8: bool, batch_size: int) -> str:
+    """
+    Runs export_model in a freshly spawned process, so exporting (which runs
+    the model) starts no threads in this one. Returns the cached export.
+    """
+    import multiprocessing
+
+    target = cache_path(model_name, backend, int8)
+    if os.path.exists(target):
+        return target
+    child = multiprocessing.get_context("spawn").Process(
+        target=export_model, args=(model_name, backend), kwargs={"int8": int8, "batch_size": batch_size})
+    child.start()
+    child.join()
+    if child.exitcode != 0 or not os.path.exists(target):
+        raise RuntimeError(f"export exited with code {child.exitcode}")
+    return target
+
+
+def load_model(
+    model_name: str,
+    backend: str = DEFAULT_BACKEND,
+    int8: bool = DEFAULT_INT8,
+    batch_size: int = 1,
+    validate: bool = True,
+) -> Tuple["YOLO", str]:
+    """
+    Loads `model_name` on `backend`, falling back to torch when the export
+    or its runtime is not available.
+
+    Args:
+        validate: Run a blank frame through an exported model, so a missing
+            runtime makes it fall back here. Pass False in a process that
+            forks workers afterwards: then no runtime session (and its
+            thread pool) is created, a missing export is built in a spawned
+            child process, and the runtime is first used, and checked, by
+            VisionEngine.warmup in each worker.
+
+    Returns:
+        The model and the backend actually used.
+    """
+    if backend == "torch":
+        return _yolo(model_name), "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend!r}")
+    try:
+        if validate:
+            path = export_model(model_name, backend, int8=int8, batch_size=batch_size)
+        else:
+            path = _export_in_child(model_name, backend, int8, batch_size)
+        # Exports carry their task and class names in their metadata
+        model = _yolo(path)
+        if validate:
+            # The runtime is only loaded on the first call; make it fail here
+            model(np.zeros((EXPORT_IMAGE_SIZE, EXPORT_IMAGE_SIZE, 3), dtype=np.uint8), verbose=False)
+        return model, backend
+    except Exception as e:
+        logger.warning("%s backend unavailable for %s (%s); using torch", backend, model_name, e)
+        return _yolo(model_name), "torch"
+
+
+# --- accuracy / latency report ---------------------------------------------
+
+def _sample_frames(source: str, count: int) -> List[np.ndarray]:
+    from pipeline import SamplingConfig, iter_frames
+
+    frames = []
+    for sample in iter_frames(source, SamplingConfig(mode="fps", target_fps=2.0)):
+        frames.append(sample.frame)
+        if len(frames) >= count:
+            break
+    if not frames:
+        raise ValueError(f"No frames could be read from {source}")
+    return frames
+
+
+def _agreement(reference, candidate, iou_threshold: float = 0.5) -> Tuple[int, int, int, float]:
+    """(matches, reference boxes, candidate boxes, summed IoU of matches) of one frame."""
+    from tracker import _assign, iou_matrix
+
+    ref_boxes, ref_cls = reference.boxes.xyxy.cpu().numpy(), reference.boxes.cls.cpu().numpy()
+    cand_boxes, cand_cls = candidate.boxes.xyxy.cpu().numpy(), candidate.boxes.cls.cpu().numpy()
+    iou = iou_matrix(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0.0
+    rows, cols = _assign(iou, iou_threshold)
+    return len(rows), len(ref_boxes), len(cand_boxes), float(iou[rows, cols].sum())
+
+
+def compare_backends(
+    model_name: str,
+    frames: List[np.ndarray],
+    batch_size: int = 8,
+    repeats: int = 3,
+    configs: Optional[List[Tuple[str, bool]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Measures every backend's latency and how closely its detections match
+    torch's on the same frames.
+
+    Returns:
+        One row per (backend, int8) configuration. Unavailable ones carry
+        an "error" instead of measurements.
+    """
+    configs = configs or [("torch", False), ("onnx", False), ("onnx", True), ("openvino", False), ("openvino", True)]
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    reference: List[Any] = []
+    rows = []
+    for backend, int8 in configs:
+        row: Dict[str, Any] = {"backend": backend, "int8": int8}
+        try:
+            model, used = load_model(model_name, backend, int8=int8, batch_size=batch_size)
+            if used != backend:
+                raise RuntimeError("export or runtime not available")
+            results = [r for batch in batches for r in model(batch, verbose=False)]
+            started = time.perf_counter()
+            for _ in range(repeats):
+                for batch in batches:
+                    model(batch, verbose=False)
+            row["ms_per_frame"] = (time.perf_counter() - started) * 1000 / (repeats * len(frames))
+        except Exception as e:
+            row["error"] = str(e)
+            rows.append(row)
+            continue
+
+        if not reference:
+            reference = results
+        matched = total_reference = total_candidate = 0
+        iou_sum = 0.0
+        for ref, cand in zip(reference, results):
+            m, n_ref, n_cand, s = _agreement(ref, cand)
+            matched, total_reference, total_candidate, iou_sum = (
+                matched + m, total_reference + n_ref, total_candidate + n_cand, iou_sum + s)
+        row.update(
+            detections=total_candidate,
+            recall_vs_reference=matched / total_reference if total_reference else 1.0,
+            precision_vs_reference=matched / total_candidate if total_candidate else 1.0,
+            mean_iou=iou_sum / matched if matched else None,
+        )
+        rows.append(row)
+
+    fastest = [row for row in rows if "ms_per_frame" in row]
+    if fastest:
+        base = fastest[0]["ms_per_frame"]
+        for row in fastest:
+            row["speedup"] = base / row["ms_per_frame"]
+    return rows
+
+
+def _print_report(rows: List[Dict[str, Any]]):
+    print(f"{'backend':<10} {'int8':<5} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'precision':>9} {'mIoU':>6}")
+    for row in rows:
+        name = f"{row['backend']:<10} {str(row['int8']).lower():<5}"
+        if "error" in row:
+            print(f"{name} unavailable: {row['error']}")
+            continue
+        mean_iou = f"{row['mean_iou']:.3f}" if row["mean_iou"] is not None else "-"
+        print(f"{name} {row['ms_per_frame']:>9.1f} {row['speedup']:>7.2f}x "
+              f"{row['recall_vs_reference']:>7.3f} {row['precision_vs_reference']:>9.3f} {mean_iou:>6}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export YOLO models and compare inference backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="build (or reuse) a cached export")
+    export.add_argument("--model", default="yolov8n.pt")
+    export.add_argument("--backend", choices=("onnx", "openvino"), required=True)
+    export.add_argument("--int8", action="store_true")
+    export.add_argument("--data", default=CALIBRATION_DATA, help="calibration dataset YAML (OpenVINO INT8)")
+    export.add_argument("--batch", type=int, default=8)
+
+    report = commands.add_parser("report", help="accuracy vs latency of every backend, relative to torch")
+    report.add_argument("--model", default="yolov8n.pt")
+    report.add_argument("--source", required=True, help="video file with representative footage")
+    report.add_argument("--frames", type=int, default=32)
+    report.add_argument("--batch", type=int, default=8)
+    report.add_argument("--json", help="also write the rows to this file")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        print(export_model(args.model, args.backend, int8=args.int8, batch_size=args.batch,
+                           calibration_data=args.data))
+        return 0
+
+    rows = compare_backends(args.model, _sample_frames(args.source, args.frames), batch_size=args.batch)
+    _print_report(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"model": args.model, "source": args.source, "frames": args.frames, "results": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
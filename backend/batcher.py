@@ -0,0 +1,133 @@
+# backend/batcher.py
+"""
+Micro-batching front end for the VisionEngine.
+
+Frames submitted from any thread (concurrent requests, sampled clip frames,
+live streams) are collected for a few milliseconds and pushed through the
+model together, so the per-call overhead of inference is amortized over a
+whole batch instead of being paid for every frame.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+import numpy as np
+
+from detections import Detections
+from metrics import DETECTIONS, MODEL_BATCH_SIZE, MODEL_LATENCY, STAGE_ERRORS
+
+# How long the batcher waits for more frames before running a partial batch
+DEFAULT_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Merges single-frame requests into batched `analyze_frames` calls.
+
+    A single worker thread owns the engine, which also keeps inference
+    serialized: the model is never called from two threads at once.
+    """
+
+    def __init__(self, engine, batch_size: Optional[int] = None, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        """
+        Args:
+            engine: Object exposing `analyze_frames(frames)` (a VisionEngine).
+            batch_size: Largest batch to build. Defaults to the engine's own.
+            max_wait_ms: Longest time the first frame of a batch waits for company.
+        """
+        self.engine = engine
+        self.batch_size = max(1, batch_size or getattr(engine, "batch_size", 8))
+        self.max_wait = max_wait_ms / 1000.0
+        # Label of the model in the metrics
+        self.model = os.path.basename(str(getattr(engine, "model_name", type(engine).__name__)))
+        self._pending: "queue.Queue" = queue.Queue()
+        self._closed = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    @property
+    def pending(self) -> int:
+        """Frames waiting for the model."""
+        return self._pending.qsize()
+
+    def submit(self, frame) -> Future:
+        """Queues one frame and returns a Future resolving to its detections."""
+        if self._closed.is_set():
+            raise RuntimeError("MicroBatcher is closed")
+        future: Future = Future()
+        self._pending.put((frame, future))
+        return future
+
+    def analyze_frame(self, frame) -> Detections:
+        """Blocking single-frame call with the same shape as VisionEngine.analyze_frame."""
+        return self.submit(frame).result()
+
+    def analyze_frames(self, frames: List[Any]) -> List[Detections]:
+        """
+        Blocking multi-frame call. All frames are queued before waiting, so
+        they can share a forward pass with each other and with frames from
+        other callers.
+        """
+        futures = [self.submit(frame) for frame in frames]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stops the worker after the frames already queued are processed."""
+        self._closed.set()
+        self._pending.put(None)
+        self._worker.join(timeout=5.0)
+
+    def _collect(self, first) -> List:
+        """Gathers up to `batch_size` items, waiting at most `max_wait` for them."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Past the deadline only frames that are already waiting join
+                if remaining > 0:
+                    item = self._pending.get(timeout=remaining)
+                else:
+                    item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the shutdown marker back for the main loop
+                self._pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._pending.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            frames = [frame for frame, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = self.engine.analyze_frames(frames)
+            except Exception as e:
+                STAGE_ERRORS.inc(stage="model")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            MODEL_LATENCY.observe(time.perf_counter() - started, model=self.model)
+            MODEL_BATCH_SIZE.observe(len(frames), model=self.model)
+            self._count_detections(results)
+            for (_, future), detections in zip(batch, results):
+                future.set_result(detections)
+
+    @staticmethod
+    def _count_detections(results: List[Detections]):
+        labels = [detections.labels for detections in results if len(detections)]
+        if not labels:
+            return
+        names, counts = np.unique(np.concatenate(labels), return_counts=True)
+        for label, count in zip(names.tolist(), counts.tolist()):
+            DETECTIONS.inc(count, label=label)
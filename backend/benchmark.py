@@ -0,0 +1,485 @@
+# backend/benchmark.py
+"""
+Benchmarks of the vision pipeline on synthetic clips.
+
+Clips are generated locally (resolution, length and number of moving
+objects are configurable), so the suite needs neither footage nor network.
+By default the model is replaced with a stub that does the real input
+preprocessing and then sleeps for a fixed time per frame, which measures
+everything around the model on any CPU-only machine; `--model` runs a real
+(ideally tiny, local) model instead.
+
+For every clip it measures, each with its peak RSS:
+
+- decode: frames decoded per second
+- inference: frames per second through the engine, and latency per batch
+- postprocess: the rule engine's time per frame
+- end_to_end: classify_upload latency percentiles and clips per second, at
+  each concurrency level
+- http: the same through POST /analyze_video (with `--http`)
+
+Results are written as JSON and can be checked against a stored baseline:
+
+    python benchmark.py --json baseline.json
+    python benchmark.py --baseline baseline.json   # exits 1 on a regression
+    python benchmark.py --model yolov8n.pt --resolutions 1280x720 --concurrency 1,2,4
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from detections import Detections
+
+# Where generated clips are kept between runs
+BENCH_DIR = os.getenv("BENCH_DIR", os.path.join(tempfile.gettempdir(), "safesight-bench"))
+DEFAULT_RESOLUTIONS = "640x360,1280x720,1920x1080"
+DEFAULT_OBJECTS = "1,8"
+DEFAULT_CONCURRENCY = "1,4"
+DEFAULT_SECONDS = 4.0
+DEFAULT_FPS = 15
+# Simulated forward pass of the stub engine
+DEFAULT_STUB_MS = 5.0
+# Relative change of a metric that counts as a regression
+REGRESSION_TOLERANCE = 0.2
+
+# Labels the stub engine reports, cycling through the objects of a frame
+STUB_NAMES = {0: "person", 1: "fire", 2: "smoke"}
+# Metrics where more is better; every other *_ms / *_mb metric is better lower
+_HIGHER_IS_BETTER = ("fps", "clips_per_s")
+_LOWER_IS_BETTER = ("p50_ms", "p90_ms", "p99_ms", "mean_ms", "peak_rss_mb")
+
+
+# --- synthetic clips -------------------------------------------------------
+
+def make_clip(path: str, width: int, height: int, seconds: float = DEFAULT_SECONDS, fps: int = DEFAULT_FPS,
+              objects: int = 1, seed: int = 0) -> str:
+    """
+    Writes an MJPG clip of `objects` rectangles moving over a textured
+    background, unless `path` already exists.
+
+    Returns:
+        `path`.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    # Static texture, so the encoder and decoder do realistic work
+    background = rng.integers(40, 90, size=(height, width, 3), dtype=np.uint8)
+    sizes = rng.uniform(0.08, 0.25, size=(objects, 2)) * (width, height)
+    starts = rng.uniform(0, 1, size=(objects, 2)) * (width, height)
+    velocities = rng.uniform(-0.02, 0.02, size=(objects, 2)) * (width, height)
+    colors = rng.integers(0, 256, size=(objects, 3))
+
+    # OpenCV picks the container from the extension
+    base, extension = os.path.splitext(path)
+    staging = f"{base}.partial{extension}"
+    writer = cv2.VideoWriter(staging, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV cannot write MJPG video")
+    try:
+        for index in range(max(1, int(seconds * fps))):
+            frame = background.copy()
+            positions = (starts + velocities * index) % (width, height)
+            for (x, y), (w, h), color in zip(positions, sizes, colors):
+                cv2.rectangle(frame, (int(x), int(y)), (int(x + w), int(y + h)), tuple(int(c) for c in color), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    os.replace(staging, path)
+    return path
+
+
+def clip_path(width: int, height: int, seconds: float, fps: int, objects: int) -> str:
+    return os.path.join(BENCH_DIR, f"clip-{width}x{height}-{seconds:g}s-{fps}fps-{objects}obj.avi")
+
+
+# --- stub engine -----------------------------------------------------------
+
+class StubEngine:
+    """
+    Stands in for VisionEngine: letterboxes the frames like the real engine
+    does, sleeps `ms_per_frame` per frame in place of the forward pass, and
+    reports `objects` fixed detections per frame.
+    """
+
+    def __init__(self, objects: int = 1, ms_per_frame: float = DEFAULT_STUB_MS, batch_size: int = 8,
+                 preprocess: bool = True):
+        from preprocess import Letterboxer
+
+        self.batch_size = max(1, batch_size)
+        self.ms_per_frame = ms_per_frame
+        self.letterboxer = Letterboxer(self.batch_size) if preprocess else None
+        rng = np.random.default_rng(1)
+        corners = rng.uniform(0.0, 0.7, size=(objects, 2))
+        extents = rng.uniform(0.1, 0.3, size=(objects, 2))
+        # Fractions of the frame size, scaled to each frame
+        self._boxes = np.hstack([corners, corners + extents]).astype(np.float32)
+        self._cls = (np.arange(objects) % len(STUB_NAMES)).astype(np.int32)
+        self._conf = np.full(objects, 0.9, dtype=np.float32)
+
+    def analyze_frames(self, frames: List[np.ndarray]) -> List[Detections]:
+        for start in range(0, len(frames), self.batch_size):
+            if self.letterboxer is not None:
+                self.letterboxer.prepare(frames[start:start + self.batch_size])
+        time.sleep(self.ms_per_frame * len(frames) / 1000.0)
+        detections = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            detections.append(Detections(
+                boxes=self._boxes * np.array([width, height, width, height], dtype=np.float32),
+                conf=self._conf,
+                cls=self._cls,
+                names=STUB_NAMES,
+                image_size=(height, width),
+            ))
+        return detections
+
+
+def install_engine(engine) -> Any:
+    """
+    Routes classifyEvent's inference through `engine` and turns its caches
+    off, so repeated runs measure real work.
+
+    Returns:
+        The MicroBatcher in front of the engine (close it when done).
+    """
+    import classifyEvent
+    from batcher import MicroBatcher
+    from cache import LRUCache, ResultCache
+
+    batcher = MicroBatcher(engine)
+    classifyEvent.frame_batchers.clear()
+    classifyEvent.frame_batchers["benchmark"] = batcher
+    classifyEvent.engines_ready.set()
+    classifyEvent.result_cache = ResultCache(max_bytes=0)
+    classifyEvent.frame_cache = LRUCache(0)
+    return batcher
+
+
+# --- measurement helpers ---------------------------------------------------
+
+class PeakRSS:
+    """
+    Peak resident memory of the process while the block runs, in MiB.
+
+    On Linux the high-water mark is reset on entry, so each block gets its
+    own peak; elsewhere it is the process-wide peak so far (`reset` False).
+    """
+
+    def __init__(self):
+        self.mb = 0.0
+        self.reset = False
+
+    def __enter__(self) -> "PeakRSS":
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self.reset = True
+        except OSError:
+            self.reset = False
+        return self
+
+    def __exit__(self, *exc):
+        self.mb = _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def latency_stats(seconds: Sequence[float]) -> Dict[str, float]:
+    """p50/p90/p99/mean/max of a list of durations, in milliseconds."""
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"p50_ms": float(p50), "p90_ms": float(p90), "p99_ms": float(p99),
+            "mean_ms": float(ms.mean()), "max_ms": float(ms.max())}
+
+
+def _concurrent(task: Callable[[], Any], concurrency: int, runs: int) -> Tuple[List[float], int, float]:
+    """Runs `task` `runs` times on `concurrency` threads: (latencies, errors, wall seconds)."""
+    def timed(_):
+        started = time.perf_counter()
+        try:
+            task()
+            return time.perf_counter() - started, False
+        except Exception:
+            return time.perf_counter() - started, True
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(runs)))
+    wall = time.perf_counter() - started
+    return [seconds for seconds, failed in outcomes if not failed], sum(failed for _, failed in outcomes), wall
+
+
+# --- stages ----------------------------------------------------------------
+
+def bench_decode(path: str) -> Tuple[Dict[str, Any], List[np.ndarray]]:
+    """Decodes every frame of the clip. Returns the row and the frames."""
+    from pipeline import SamplingConfig, iter_frames
+
+    frames = []
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        for sample in iter_frames(path, SamplingConfig(mode="every_n", every_n=1)):
+            frames.append(sample.frame)
+        seconds = time.perf_counter() - started
+    return {"frames": len(frames), "fps": len(frames) / seconds, "peak_rss_mb": rss.mb}, frames
+
+
+def bench_inference(engine, frames: List[np.ndarray], repeats: int = 1) -> Tuple[Dict[str, Any], List[Detections]]:
+    """Runs the frames through the engine in batches. Returns the row and the detections."""
+    batch_size = getattr(engine, "batch_size", 8)
+    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
+    engine.analyze_frames(batches[0])  # warm-up
+    latencies, detections = [], []
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            detections = []
+            for batch in batches:
+                batch_started = time.perf_counter()
+                detections.extend(engine.analyze_frames(batch))
+                latencies.append(time.perf_counter() - batch_started)
+        seconds = time.perf_counter() - started
+    row = {"frames": len(frames) * repeats, "batch_size": batch_size,
+           "fps": len(frames) * repeats / seconds, "peak_rss_mb": rss.mb}
+    row.update(latency_stats(latencies))
+    return row, detections
+
+
+def bench_postprocess(detections: List[Detections], fps: float = DEFAULT_FPS) -> Dict[str, Any]:
+    """Runs the rule engine (with temporal state) over every frame's detections."""
+    from classifyEvent import route_detections
+    from temporal import TemporalState
+
+    temporal = TemporalState()
+    latencies = []
+    with PeakRSS() as rss:
+        for index, frame_detections in enumerate(detections):
+            started = time.perf_counter()
+            route_detections(frame_detections, False, temporal, index / fps)
+            latencies.append(time.perf_counter() - started)
+    row = {"frames": len(detections), "fps": len(latencies) / max(sum(latencies), 1e-9), "peak_rss_mb": rss.mb}
+    row.update(latency_stats(latencies))
+    return row
+
+
+def bench_end_to_end(data: bytes, concurrency: int, runs: int) -> Dict[str, Any]:
+    """classify_upload on the clip's bytes, `runs` times from `concurrency` threads."""
+    from classifyEvent import classify_upload
+
+    with PeakRSS() as rss:
+        latencies, errors, wall = _concurrent(lambda: classify_upload(data, source="file"), concurrency, runs)
+    row = {"runs": runs, "errors": errors, "clips_per_s": len(latencies) / wall, "peak_rss_mb": rss.mb}
+    row.update(latency_stats(latencies))
+    return row
+
+
+def bench_http(client, data: bytes, concurrency: int, runs: int) -> Dict[str, Any]:
+    """POST /analyze_video with the clip, `runs` times from `concurrency` threads."""
+    def post():
+        response = client.post("/analyze_video", files={"file": ("clip.avi", data, "video/x-msvideo")})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+    with PeakRSS() as rss:
+        latencies, errors, wall = _concurrent(post, concurrency, runs)
+    row = {"runs": runs, "errors": errors, "clips_per_s": len(latencies) / wall, "peak_rss_mb": rss.mb}
+    row.update(latency_stats(latencies))
+    return row
+
+
+# --- suite -----------------------------------------------------------------
+
+def _parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for item in value.split(","):
+        width, _, height = item.strip().lower().partition("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def _parse_ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def run_suite(
+    resolutions: Iterable[Tuple[int, int]],
+    objects: Iterable[int],
+    concurrency: Iterable[int],
+    seconds: float = DEFAULT_SECONDS,
+    fps: int = DEFAULT_FPS,
+    runs: int = 4,
+    model: Optional[str] = None,
+    stub_ms: float = DEFAULT_STUB_MS,
+    batch_size: int = 8,
+    http: bool = False,
+) -> Dict[str, Any]:
+    """
+    Benchmarks every stage on every (resolution, objects) clip.
+
+    Returns:
+        {"meta": {...}, "results": [row, ...]}, each row naming its
+        scenario, stage and concurrency.
+    """
+    from vision import VisionEngine
+
+    rows: List[Dict[str, Any]] = []
+    real_engine = VisionEngine(model, batch_size=batch_size) if model else None
+    client = None
+    if http:
+        from fastapi.testclient import TestClient
+
+        from app import app
+
+        client = TestClient(app)
+        client.__enter__()
+    try:
+        for width, height in resolutions:
+            for count in objects:
+                scenario = f"{width}x{height}-{count}obj"
+                path = make_clip(clip_path(width, height, seconds, fps, count), width, height, seconds, fps, count)
+                engine = real_engine or StubEngine(count, stub_ms, batch_size)
+                batcher = install_engine(engine)
+                try:
+                    decode, frames = bench_decode(path)
+                    rows.append({"scenario": scenario, "stage": "decode", "concurrency": 1, **decode})
+                    inference, detections = bench_inference(engine, frames)
+                    rows.append({"scenario": scenario, "stage": "inference", "concurrency": 1, **inference})
+                    del frames
+                    postprocess = bench_postprocess(detections, fps)
+                    rows.append({"scenario": scenario, "stage": "postprocess", "concurrency": 1, **postprocess})
+
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    for level in concurrency:
+                        row = bench_end_to_end(data, level, max(runs, level))
+                        rows.append({"scenario": scenario, "stage": "end_to_end", "concurrency": level, **row})
+                        if client is not None:
+                            row = bench_http(client, data, level, max(runs, level))
+                            rows.append({"scenario": scenario, "stage": "http", "concurrency": level, **row})
+                finally:
+                    batcher.close()
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+
+    return {
+        "meta": {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "engine": model or f"stub ({stub_ms:g} ms/frame)",
+            "seconds": seconds,
+            "fps": fps,
+            # False: peak_rss_mb is the process-wide peak, not per stage
+            "per_stage_rss": os.path.exists("/proc/self/clear_refs"),
+        },
+        "results": rows,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Lists the metrics that got worse than the baseline by more than
+    `tolerance` (relative), for rows present in both.
+    """
+    def key(row):
+        return row["scenario"], row["stage"], row["concurrency"]
+
+    reference = {key(row): row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results["results"]:
+        base = reference.get(key(row))
+        if base is None:
+            continue
+        for metric in _HIGHER_IS_BETTER + _LOWER_IS_BETTER:
+            if metric not in row or not base.get(metric):
+                continue
+            change = (row[metric] - base[metric]) / base[metric]
+            worse = -change if metric in _HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f"{'/'.join(map(str, key(row)))} {metric}: "
+                                   f"{base[metric]:.2f} -> {row[metric]:.2f} ({change:+.0%})")
+        if row.get("errors", 0) > base.get("errors", 0):
+            regressions.append(f"{'/'.join(map(str, key(row)))} errors: {base.get('errors', 0)} -> {row['errors']}")
+    return regressions
+
+
+def _print_results(results: Dict[str, Any]):
+    print(f"{'scenario':<18} {'stage':<12} {'conc':>4} {'fps':>9} {'clips/s':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'rss MiB':>8}")
+    for row in results["results"]:
+        def fmt(metric, width):
+            value = row.get(metric)
+            return f"{value:>{width}.1f}" if value is not None else f"{'-':>{width}}"
+        print(f"{row['scenario']:<18} {row['stage']:<12} {row['concurrency']:>4} {fmt('fps', 9)} "
+              f"{fmt('clips_per_s', 8)} {fmt('p50_ms', 8)} {fmt('p99_ms', 8)} {fmt('peak_rss_mb', 8)}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the vision pipeline on synthetic clips.")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--objects", default=DEFAULT_OBJECTS, help="comma-separated objects per clip")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated concurrent requests")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="length of each clip")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS)
+    parser.add_argument("--runs", type=int, default=4, help="end-to-end requests per concurrency level")
+    parser.add_argument("--model", help="real weights to run instead of the stub engine")
+    parser.add_argument("--stub-ms", type=float, default=DEFAULT_STUB_MS, help="stub forward pass per frame")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--http", action="store_true", help="also benchmark POST /analyze_video")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_suite(
+        _parse_sizes(args.resolutions), _parse_ints(args.objects), _parse_ints(args.concurrency),
+        seconds=args.seconds, fps=args.fps, runs=args.runs, model=args.model, stub_ms=args.stub_ms,
+        batch_size=args.batch, http=args.http,
+    )
+    _print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+# backend/cache.py
+"""
+Content-addressed caches for analysis results.
+
+Re-uploading the same clip (operators retrying, the frontend resending)
+should not decode and infer it again. Two caches cover this:
+
+- results: the final AnalyzeResponse of an upload, keyed by the SHA-256 of
+  its bytes, the analysis options and the model/analyzer versions. An
+  in-memory LRU bounded in bytes sits in front of an optional SQLite file
+  whose entries expire after a TTL, so results also survive restarts.
+- frames: the detections of a sampled frame, keyed by a digest of its
+  decoded pixels. A clip that was trimmed or re-sent with other container
+  metadata has different bytes but the same frames, and those skip the
+  model. The match is exact: a perceptual hash would also match a frame
+  that differs only by a small object (a distant person, a new flame), and
+  hand it the detections of the frame without it. Off by default: every
+  frame (and tile) pays for a SHA-256 of its pixels, about 2.4 ms at 720p,
+  while exact repeats are rare outside whole re-uploads, which the result
+  cache already answers.
+
+Keys always include a namespace derived from the loaded models and enabled
+analyzers, so changing either never serves stale results.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+# Memory budget of cached upload results (0 disables the cache)
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+# SQLite file backing the result cache; empty keeps it in memory only
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+# How long results stay in the SQLite file
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Memory budget of cached per-frame detections (0, the default, disables the cache)
+FRAME_CACHE_BYTES = int(os.getenv("FRAME_CACHE_BYTES", "0"))
+# Expired rows are deleted every this many writes
+_PURGE_EVERY = 100
+
+
+def content_key(*parts: Any) -> str:
+    """SHA-256 over the string form of `parts`, usable as a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def frame_digest(frame: np.ndarray) -> str:
+    """SHA-256 of a frame's shape, dtype and pixels: equal only for identical frames."""
+    digest = hashlib.sha256(f"{frame.shape}{frame.dtype}".encode())
+    digest.update(memoryview(np.ascontiguousarray(frame)).cast("B"))
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total size of
+    its values, as reported by the caller.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """Stores `value`, evicting the least recently used entries to fit it."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    Byte values in a SQLite file, each expiring `ttl` seconds after it was
+    written. Expired rows are skipped on read and deleted in bulk now and
+    then on write.
+    """
+
+    def __init__(self, path: str, ttl: float = RESULT_CACHE_TTL_S):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, value, time.time() + self.ttl))
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+
+    def purge(self) -> int:
+        """Deletes expired rows and returns how many there were."""
+        with self._lock:
+            return self._db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results WHERE expires > ?", (time.time(),)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResultCache:
+    """
+    Serialized results in a memory LRU, optionally backed by a SQLite file.
+
+    Args:
+        max_bytes: Memory budget; 0 disables the cache entirely.
+        path: SQLite file for the second tier, or empty for memory only.
+        ttl: Lifetime of entries in the SQLite file.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_BYTES, path: str = RESULT_CACHE_PATH,
+                 ttl: float = RESULT_CACHE_TTL_S):
+        self.memory = LRUCache(max_bytes)
+        self.disk = SQLiteCache(path, ttl) if path and max_bytes > 0 else None
+        self.disk_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory.max_bytes > 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.put(key, value, len(value))
+        return value
+
+    def put(self, key: str, value: bytes):
+        if not self.enabled:
+            return
+        self.memory.put(key, value, len(value))
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        # A disk hit is first counted as a memory miss
+        stats["misses"] -= self.disk_hits
+        stats["hits"] += self.disk_hits
+        stats["disk_hits"] = self.disk_hits
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        if self.disk is not None:
+            stats["disk_entries"] = len(self.disk)
+            stats["disk_path"] = self.disk.path
+        return stats
@@ -1,106 +1,483 @@
 # backend/classifyEvent.py
 
-from typing import List, Dict, Any, Callable
-import cv2
+import logging
+import os
+import threading
+import time
+from contextlib import closing
+from typing import List, Dict, Any, Callable, Optional, Tuple
+
 import numpy as np
 # Absolute imports for backend modules
-from schema import AnalyzeRequest, AnalyzeResponse
+from schema import AnalyzeRequest, AnalyzeResponse, Event, Evidence
 from vision import VisionEngine
-from events.fall import analyze_fall
-from events.fire import analyze_fire
-from events.drowning import analyze_drowning
-from events.overdose import analyze_overdose
-from events.smoke import analyze_smoke
+from batcher import MicroBatcher
+from detections import Detections
+from temporal import FrameTemporal, TemporalState
+from tracker import TRACK_DETECT_EVERY, Tracker
+from motion import MOTION_GATE, MotionGate
+from pipeline import PipelineStats, SamplingConfig, stream_detections
+from ingest import VideoUpload, upload_hash, video_source
+from analyzers import AnalyzerRegistry, load_registry
+from backends import DEFAULT_INT8, model_hash
+from cache import FRAME_CACHE_BYTES, LRUCache, ResultCache, content_key, frame_digest
+from metrics import EVENTS, FRAMES, QUEUE_DEPTH, STAGE_ERRORS, STAGE_SECONDS
+from tracing import Trace
+from tiling import TILE_FULL_FRAME, TILE_MERGE_IOS, TILE_MIN_SIDE, TILE_OVERLAP, TILE_SIZE, TILED_INFERENCE, TiledInference
 
-# Initialize the vision engine globally to avoid reloading the model on every request
-vision_engine = None
+logger = logging.getLogger(__name__)
 
-def initialize_vision_engine():
-    """Initialize the vision engine once at startup."""
-    global vision_engine
-    if vision_engine is None:
-        vision_engine = VisionEngine()
+# The enabled analyzers decide which models are loaded and which event
+# modules are imported (see analyzers.py)
+analyzer_registry: AnalyzerRegistry = load_registry()
 
-# Map detection types to their corresponding analysis functions
-# Note: The functions now take a list of detections, not the full request.
-EVENT_ANALYZE_FUNCTIONS: Dict[str, Callable[[List[Dict[str, Any]], bool], AnalyzeResponse]] = {
-    "person": analyze_fall, # This maps YOLO's "person" detection to a fall analysis
-    "fire": analyze_fire, # This maps YOLO's "fire" detection to a fire analysis
-    "smoke": analyze_smoke, # This maps YOLO's "smoke" detection to a smoke analysis
-    "drowning": analyze_drowning, # This maps YOLO's "drowning" detection to a drowning analysis
-    "overdose": analyze_overdose, # This maps YOLO's "overdose" detection to an overdose analysis
-}
+# Run a blank frame through each model before reporting ready
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1") == "1"
 
+# One engine per model the enabled analyzers need, loaded once instead of on every request
+vision_engines: Dict[str, VisionEngine] = {}
+# All inference goes through one batcher per model so frames from concurrent
+# requests share forward passes
+frame_batchers: Dict[str, MicroBatcher] = {}
+# Load state of every model ("loading", "loaded", "ready" or "failed"), for /ready
+engine_status: Dict[str, Dict[str, Any]] = {}
+# Set once every model is loaded, warmed up and has its batcher
+engines_ready = threading.Event()
+_init_lock = threading.Lock()
 
+def load_vision_engines():
+    """
+    Load the weights of every model the enabled analyzers need.
+    
+    No threads are started and nothing is run through the models (a missing
+    ONNX/OpenVINO export is built in a spawned child process), so this is
+    safe to call in a process that forks workers afterwards (serve.py).
+    """
+    with _init_lock:
+        for model_name, labels in analyzer_registry.models().items():
+            if model_name in vision_engines:
+                continue
+            status = engine_status[model_name] = {"state": "loading"}
+            started = time.monotonic()
+            try:
+                # Exported runtimes are checked by warmup, in the process that serves
+                engine = VisionEngine(model_name, classes=labels, validate=False)
+            except Exception as e:
+                status.update(state="failed", error=str(e))
+                raise
+            vision_engines[model_name] = engine
+            status.update(state="loaded", backend=engine.backend, load_seconds=time.monotonic() - started)
 
-def classifyEvent(file_bytes: bytes, source: str = "webcam", mock: bool = False) -> AnalyzeResponse:
+def initialize_vision_engine(warmup: bool = MODEL_WARMUP):
+    """Load the models the enabled analyzers need, warm them up and start their batchers."""
+    if engines_ready.is_set():
+        return
+    load_vision_engines()
+    with _init_lock:
+        for model_name, engine in vision_engines.items():
+            if model_name in frame_batchers:
+                continue
+            status = engine_status.setdefault(model_name, {"backend": engine.backend})
+            # Exported runtimes were not checked while loading: warm-up does it
+            if warmup or engine.backend != "torch":
+                started = time.monotonic()
+                try:
+                    engine.warmup()
+                except Exception as e:
+                    status.update(state="failed", error=str(e))
+                    raise
+                status["warmup_seconds"] = time.monotonic() - started
+                # Warm-up may have fallen back to torch
+                status["backend"] = engine.backend
+            batcher = frame_batchers[model_name] = MicroBatcher(engine)
+            QUEUE_DEPTH.set_function(lambda batcher=batcher: batcher.pending, queue=f"batcher:{batcher.model}")
+            status["state"] = "ready"
+        engines_ready.set()
+
+def start_engine_loading() -> threading.Thread:
+    """Initializes the engines on a background thread; failures end up in engine_status."""
+    def load():
+        try:
+            initialize_vision_engine()
+        except Exception:
+            # Recorded in engine_status; the next analysis retries the load
+            pass
+    thread = threading.Thread(target=load, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+def readiness() -> Dict[str, Any]:
+    """Whether analyses can run right away, and the load state of each model."""
+    return {"ready": engines_ready.is_set(), "models": {name: dict(status) for name, status in engine_status.items()}}
+
+def analyze_frames(frames: List[Any]) -> List[Detections]:
+    """
+    Runs frames through every model's micro-batcher, initializing them if
+    needed, and merges each frame's detections from all models.
+    """
+    if not engines_ready.is_set():
+        initialize_vision_engine()
+    batchers = list(frame_batchers.values())
+    if len(batchers) == 1:
+        return batchers[0].analyze_frames(frames)
+    # Queue the frames on every model before waiting, so the models run side by side
+    futures = [[batcher.submit(frame) for frame in frames] for batcher in batchers]
+    return [Detections.concat([per_model[i].result() for per_model in futures]) for i in range(len(frames))]
+
+def inference_batch_size() -> int:
+    """Largest batch every loaded model accepts."""
+    if not engines_ready.is_set():
+        initialize_vision_engine()
+    return min((batcher.batch_size for batcher in frame_batchers.values()), default=1)
+
+
+# Results of earlier uploads, and detections of sampled frames seen before
+# (see cache.py)
+result_cache = ResultCache()
+frame_cache = LRUCache(FRAME_CACHE_BYTES)
+# Bump whenever a code change alters what an analysis returns, so cached
+# results from older versions are not served
+RESULT_CACHE_VERSION = 1
+# Bookkeeping of one frame_cache entry on top of its arrays
+_FRAME_ENTRY_OVERHEAD = 512
+_cache_namespace: Optional[str] = None
+
+def cache_namespace() -> str:
+    """
+    Version of everything that shapes a result: the weights and backend of
+    every loaded model, the enabled analyzers and the tiling setup. Part of
+    every cache key.
+    """
+    global _cache_namespace
+    if _cache_namespace is None:
+        if not engines_ready.is_set():
+            initialize_vision_engine()
+        models = sorted((name, model_hash(name), engine.backend) for name, engine in vision_engines.items())
+        analyzers = [(spec.name, spec.classes, spec.model, spec.rule, spec.handler)
+                     for spec in analyzer_registry.analyzers]
+        tiling = ((TILE_SIZE, TILE_OVERLAP, TILE_MIN_SIDE, TILE_FULL_FRAME, TILE_MERGE_IOS)
+                  if TILED_INFERENCE else None)
+        _cache_namespace = content_key(RESULT_CACHE_VERSION, models, DEFAULT_INT8, analyzers, tiling)
+    return _cache_namespace
+
+def cached_analyze_frames(frames: List[Any]) -> List[Detections]:
+    """
+    Same as analyze_frames, but frames whose pixels are identical to a
+    frame analyzed before reuse its detections instead of going through
+    the models.
+    """
+    if frame_cache.max_bytes == 0:
+        return analyze_frames(frames)
+    namespace = cache_namespace()
+    keys = [(namespace, frame_digest(frame)) for frame in frames]
+    results = [frame_cache.get(key) for key in keys]
+    missing = [i for i, detections in enumerate(results) if detections is None]
+    if missing:
+        for i, detections in zip(missing, analyze_frames([frames[i] for i in missing])):
+            frame_cache.put(keys[i], detections, detections.nbytes + _FRAME_ENTRY_OVERHEAD)
+            results[i] = detections
+    return results
+
+# Uploads are tiled when TILED_INFERENCE is set (see tiling.py); tiles go
+# through the frame cache like whole frames
+tiled_analyze_frames = TiledInference(cached_analyze_frames)
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and sizes of the result and frame caches."""
+    return {"results": result_cache.stats(), "frames": frame_cache.stats()}
+
+def _result_key(upload: VideoUpload, *options: Any) -> Optional[str]:
+    """Cache key of an upload's result, or None while its bytes are still arriving."""
+    if not result_cache.enabled:
+        return None
+    digest = upload_hash(upload)
+    if digest is None:
+        return None
+    return content_key(cache_namespace(), digest, *options)
+
+def _cached_result(key: Optional[str]) -> Optional[AnalyzeResponse]:
+    if key is None:
+        return None
+    data = result_cache.get(key)
+    return AnalyzeResponse.model_validate_json(data) if data is not None else None
+
+
+def _group_rows(detections: Detections) -> Dict[str, np.ndarray]:
+    """Row indices of each class present in the frame."""
+    classes, inverse = np.unique(detections.cls, return_inverse=True)
+    return {
+        detections.names.get(int(class_id), str(class_id)): np.flatnonzero(inverse == i)
+        for i, class_id in enumerate(classes.tolist())
+    }
+
+
+def _route_mock(detections: Detections, frame: Optional[FrameTemporal]) -> List[AnalyzeResponse]:
+    """Mock mode: one handler call per detection type present."""
+    handlers = analyzer_registry.handlers()
+    dicts = detections.to_dicts()
+    if frame is not None:
+        # Annotations line up with the box rows, which come first
+        for detection, annotation in zip(dicts, frame.annotations(detections.labels)):
+            detection.update(annotation)
+    by_type: Dict[str, List[Dict[str, Any]]] = {}
+    for detection in dicts:
+        by_type.setdefault(detection.get("type", "none"), []).append(detection)
+    return [
+        handlers[detection_type](group, True)
+        for detection_type, group in by_type.items()
+        if detection_type in handlers
+    ]
+
+
+def route_detections(
+    raw_detections: Detections,
+    mock: bool = False,
+    temporal: Optional[TemporalState] = None,
+    timestamp: float = 0.0,
+) -> List[AnalyzeResponse]:
+    """
+    Runs the enabled analyzers' rules over one frame.
+    
+    Detections are grouped by class once and each rule evaluates its
+    thresholds over all rows of its classes as arrays, so Pydantic objects
+    are only built for the events that qualify.
+    
+    Args:
+        raw_detections: The frame's detections.
+        mock: If True, handlers return mock responses.
+        temporal: The stream's temporal state. When given, the frame is folded
+            into it first and rules see durations/trends.
+        timestamp: Time of the frame in seconds.
+    
+    Returns:
+        One response per event type found, most severe first, each holding
+        every qualifying event of that type.
+    """
+    frame = None
+    if temporal is not None:
+        posture = analyzer_registry.posture_test()
+        horizontal = posture(raw_detections) if posture is not None else None
+        frame = temporal.update(raw_detections, timestamp, horizontal)
+    if mock:
+        return _route_mock(raw_detections, frame)
+    
+    groups = _group_rows(raw_detections)
+    responses = []
+    for spec, rule in analyzer_registry.rules():
+        present = [groups[label] for label in spec.classes if label in groups]
+        if not present:
+            continue
+        rows = present[0] if len(present) == 1 else np.sort(np.concatenate(present))
+        response = rule(raw_detections, rows, frame)
+        if response is not None:
+            responses.append(response)
+    responses.sort(key=lambda response: response.severity, reverse=True)
+    return responses
+
+
+def classifyEvent(
+    upload: VideoUpload,
+    source: str = "webcam",
+    mock: bool = False,
+    **options: Any,
+) -> AnalyzeResponse:
     """
     Classifies emergency events based on real-time vision analysis.
     
     This function acts as the central orchestrator, handling multiple input sources.
     
     Args:
-        file_bytes: Raw video file bytes
+        upload: Raw video file bytes, or an UploadBuffer that may still be
+            receiving the upload
         source: Source type (webcam, file, stream)
         mock: If True, returns mock responses for testing
+        **options: Passed through to classify_upload
         
     Returns:
         Analysis response with detected events and recommendations.
     """
     try:
-        # Ensure vision engine is initialized
-        if vision_engine is None:
-            initialize_vision_engine()
-        
-        # Step 1: Perception - Process file bytes and get raw detections from the Vision Engine
-        # Optimize video processing by using memory buffer instead of temporary file
-        import tempfile
-        import os
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(file_bytes)
-            temp_file_path = temp_file.name
+        return classify_upload(upload, source=source, mock=mock, **options)
+    except Exception as e:
+        # Return a safe fallback response for any errors
+        logger.exception("Analysis of a %s upload failed", source)
+        STAGE_ERRORS.inc(stage="analysis")
+        if options.get("trace") is not None:
+            options["trace"].error = str(e)
+        return AnalyzeResponse(
+            severity=0.0,
+            explanation=f"Analysis error: {str(e)}. Check technical logs.",
+            recommended_actions=["Contact technical support if this error persists."],
+            evidence=[],
+            categories=[],
+            events=[],
+        )
+
+
+def classify_upload(
+    upload: VideoUpload,
+    source: str = "webcam",
+    mock: bool = False,
+    sampling: Optional[SamplingConfig] = None,
+    cancel: Optional[threading.Event] = None,
+    on_event: Optional[Callable[[Event], None]] = None,
+    stats: Optional[PipelineStats] = None,
+    detect_every: int = TRACK_DETECT_EVERY,
+    motion_gate: bool = MOTION_GATE,
+    trace: Optional[Trace] = None,
+) -> AnalyzeResponse:
+    """
+    Same as classifyEvent, but errors are raised instead of being turned
+    into a fallback response.
+    
+    Args:
+        upload: Raw video file bytes, or an UploadBuffer that may still be
+            receiving the upload
+        source: Source type (webcam, file, stream)
+        mock: If True, returns mock responses for testing
+        sampling: Which frames of the clip to analyze (defaults to the
+            SAMPLE_* environment configuration)
+        cancel: When set, analysis stops at the next sampled frame
+        on_event: Called with each event as soon as it is found (once per
+            run of consecutive sampled frames showing that event type)
+        stats: Progress counters kept up to date while the clip is analyzed
+        detect_every: Run the model on every n-th sampled frame and let the
+            tracker follow objects in between (1 = every sampled frame)
+        motion_gate: Reuse the previous detections for sampled frames that
+            barely differ from the last analyzed one
+        trace: Receives the time spent in each stage of the analysis
         
-        try:
-            # Use VideoCapture to read the video file
-            cap = cv2.VideoCapture(temp_file_path)
-            if not cap.isOpened():
-                raise ValueError("Could not open video file")
-            
-            # Read the first frame
-            ret, frame = cap.read()
-            cap.release()
+    Returns:
+        Analysis response with detected events and recommendations. An
+        upload analyzed before with the same options and models is answered
+        from the result cache as soon as its bytes are all in.
+    """
+    stats = stats if stats is not None else PipelineStats()
+    try:
+        result = _classify_upload(upload, source, mock, sampling, cancel, on_event, stats, detect_every,
+                                  motion_gate)
+    finally:
+        _record_stages(stats, trace)
+    for event in result.events:
+        EVENTS.inc(type=event.type)
+    return result
+
+
+def _record_stages(stats: PipelineStats, trace: Optional[Trace]):
+    """Adds the stage times and frame counts of one analysis to the metrics and `trace`."""
+    stages = (("open", stats.open_seconds), ("decode", stats.decode_seconds),
+              ("inference", stats.inference_seconds), ("reasoning", stats.reasoning_seconds))
+    for stage, seconds in stages:
+        # A result served from the cache never opened the clip
+        if stats.frames_sampled or seconds:
+            STAGE_SECONDS.observe(seconds, stage=stage)
+            if trace is not None:
+                trace.add(stage, seconds)
+    frames_detected = stats.frames_analyzed - stats.frames_tracked - stats.frames_skipped
+    kinds = (("decoded", stats.frames_decoded), ("detected", frames_detected),
+             ("tracked", stats.frames_tracked), ("skipped", stats.frames_skipped))
+    for kind, count in kinds:
+        if count:
+            FRAMES.inc(count, source="upload", kind=kind)
+
+
+def _classify_upload(
+    upload: VideoUpload,
+    source: str,
+    mock: bool,
+    sampling: Optional[SamplingConfig],
+    cancel: Optional[threading.Event],
+    on_event: Optional[Callable[[Event], None]],
+    stats: PipelineStats,
+    detect_every: int,
+    motion_gate: bool,
+) -> AnalyzeResponse:
+    # Step 0: Cache - Bytes analyzed before with the same options come back
+    # from the result cache. A still-arriving upload is looked up again on
+    # every sampled frame until its hash is known.
+    cache_options = (mock, sampling or SamplingConfig(), detect_every, motion_gate)
+    cache_key = _result_key(upload, *cache_options)
+    cached = _cached_result(cache_key)
+    emitted_types: set = set()
+    if cached is not None:
+        return _replay(cached, on_event, emitted_types)
+    
+    # Step 1: Perception - Stream the clip through the sampling pipeline.
+    # The upload is decoded straight from memory (or from the buffer it
+    # is still being written to), not from a temporary file.
+    
+    # Most severe response seen so far; per event type, its most confident
+    # event with the response it came from, and when the type was first and
+    # last observed in the clip
+    best_response: Optional[AnalyzeResponse] = None
+    best_events: Dict[str, Tuple[Event, AnalyzeResponse]] = {}
+    first_seen: Dict[str, float] = {}
+    last_seen: Dict[str, float] = {}
+    frames_analyzed = 0
+    sample_interval = 0.0
+    previous_timestamp: Optional[float] = None
+    previous_types: set = set()
+    temporal = TemporalState()
+    
+    with video_source(upload) as clip, closing(stream_detections(
+        clip,
+        tiled_analyze_frames,
+        config=sampling,
+        batch_size=inference_batch_size(),
+        stats=stats,
+        tracker=Tracker(),
+        detect_every=detect_every,
+        motion_gate=MotionGate() if motion_gate else None,
+    )) as samples:
+        for sample, raw_detections in samples:
+            if cancel is not None and cancel.is_set():
+                raise TimeoutError("Analysis cancelled")
+            if cache_key is None:
+                cache_key = _result_key(upload, *cache_options)
+                cached = _cached_result(cache_key)
+                if cached is not None:
+                    return _replay(cached, on_event, emitted_types)
+            frames_analyzed += 1
+            if previous_timestamp is not None:
+                sample_interval = sample.timestamp - previous_timestamp
+            previous_timestamp = sample.timestamp
             
-            if not ret or frame is None:
-                raise ValueError("Could not read frame from video file")
+            # Step 2: Reasoning - Route each detection to its event handler
+            frame_types = set()
+            started = time.perf_counter()
+            try:
+                responses = route_detections(raw_detections, mock, temporal, sample.timestamp)
+            except Exception:
+                STAGE_ERRORS.inc(stage="reasoning")
+                raise
+            stats.reasoning_seconds += time.perf_counter() - started
+            for response in responses:
+                for event in response.events:
+                    event.timestamp = sample.timestamp
+                    first_seen.setdefault(event.type, sample.timestamp)
+                    last_seen[event.type] = sample.timestamp
+                    kept = best_events.get(event.type)
+                    if kept is None or event.confidence > kept[0].confidence:
+                        best_events[event.type] = (event, response)
+                    if on_event is not None and event.type not in previous_types | frame_types:
+                        on_event(event.model_copy(deep=True))
+                        emitted_types.add(event.type)
+                    frame_types.add(event.type)
                 
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+                # The most severe response explains the clip
+                if best_response is None or response.severity > best_response.severity:
+                    best_response = response
             
-        raw_detections = vision_engine.analyze_frame(frame)
-        
-        # Initialize an empty list to store all detected event responses
-        all_event_responses: List[AnalyzeResponse] = []
-        
-        # Step 2: Reasoning - Iterate through detections and call relevant event handlers
-        for detection in raw_detections:
-            detection_type = detection.get("type", "none")
-            
-            if detection_type in EVENT_ANALYZE_FUNCTIONS:
-                # Route the specific detection to its corresponding event function
-                response = EVENT_ANALYZE_FUNCTIONS[detection_type]([detection], mock)
-                all_event_responses.append(response)
-                
-        # Return the most severe response if any were found
-        if all_event_responses:
-            # Sort by severity and return the highest one.
-            all_event_responses.sort(key=lambda resp: resp.severity, reverse=True)
-            return all_event_responses[0]
-
+            previous_types = frame_types
+    
+    if frames_analyzed == 0:
+        raise ValueError("Could not read frame from video file")
+    
+    if best_response is not None:
+        result = _clip_result(best_response, best_events, first_seen, last_seen, sample_interval)
+    else:
         # No detections found - return a neutral response
-        return AnalyzeResponse(
+        result = AnalyzeResponse(
             severity=0.05,
             explanation="No high-risk event or specific object detected in the current window.",
             recommended_actions=["Continue monitoring."],
@@ -108,14 +485,57 @@ def classifyEvent(file_bytes: bytes, source: str = "webcam", mock: bool = False)
             categories=[],
             events=[],
         )
-        
-    except Exception as e:
-        # Return a safe fallback response for any errors
-        return AnalyzeResponse(
-            severity=0.0,
-            explanation=f"Analysis error: {str(e)}. Check technical logs.",
-            recommended_actions=["Contact technical support if this error persists."],
-            evidence=[],
-            categories=[],
-            events=[],
-        )
\ No newline at end of file
+    
+    # The decoder has read the whole upload by now, so its hash is known
+    cache_key = cache_key or _result_key(upload, *cache_options)
+    if cache_key is not None:
+        result_cache.put(cache_key, result.model_dump_json().encode())
+    return result
+
+
+def _clip_result(
+    best_response: AnalyzeResponse,
+    best_events: Dict[str, Tuple[Event, AnalyzeResponse]],
+    first_seen: Dict[str, float],
+    last_seen: Dict[str, float],
+    sample_interval: float,
+) -> AnalyzeResponse:
+    """
+    One response for a whole clip: every event type seen in it (its most
+    confident event, covering at least the span of sampled frames it was
+    seen in), with the evidence and categories of the responses they came
+    from. The most severe response gives the explanation and actions.
+    """
+    events: List[Event] = []
+    evidence: List[Evidence] = list(best_response.evidence)
+    categories: List[str] = list(best_response.categories)
+    for event_type in sorted(best_events, key=first_seen.__getitem__):
+        event, response = best_events[event_type]
+        span = last_seen[event_type] - first_seen[event_type] + sample_interval
+        event.window_seconds = max(event.window_seconds, span)
+        events.append(event)
+        if response is not best_response:
+            evidence.extend(item for item in response.evidence if all(item is not kept for kept in evidence))
+            categories.extend(category for category in response.categories if category not in categories)
+    return AnalyzeResponse(
+        severity=best_response.severity,
+        explanation=best_response.explanation,
+        recommended_actions=best_response.recommended_actions,
+        evidence=evidence,
+        categories=categories,
+        events=events,
+    )
+
+
+def _replay(
+    cached: AnalyzeResponse,
+    on_event: Optional[Callable[[Event], None]],
+    emitted_types: set,
+) -> AnalyzeResponse:
+    """Reports the events of a cached result that were not reported yet."""
+    if on_event is not None:
+        for event in cached.events:
+            if event.type not in emitted_types:
+                on_event(event.model_copy(deep=True))
+                emitted_types.add(event.type)
+    return cached
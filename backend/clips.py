@@ -0,0 +1,352 @@
+# backend/clips.py
+"""
+Event clips and evidence snapshots for live streams.
+
+Every stream keeps the last few seconds of its frames in a ring buffer of
+JPEG-encoded frames, bounded in seconds and bytes (a 720p frame is tens of
+kilobytes as JPEG instead of 2.7 MB as an array). Frames are encoded on the
+stream's reader thread at CLIP_BUFFER_FPS, so the analysis loop never pays
+for it.
+
+When an event starts, the recorder notes the clip it wants (CLIP_PRE_ROLL_S
+before the event to CLIP_POST_ROLL_S after) and returns at once. Once the
+reader has buffered the post-roll, the clip's frames are handed to a single
+writer thread that encodes the video and an annotated thumbnail to
+CLIP_DIR. The event's `Evidence.notes` points at both files (served under
+/clips) from the start; `clip_ready` turns true once they are written. If
+the writer falls behind, clips are dropped rather than queued without bound;
+a clip that is dropped, has no buffered frames or fails to write gets its
+URLs cleared and a `clip_error` instead.
+"""
+
+import collections
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from schema import Event
+
+logger = logging.getLogger(__name__)
+
+# Record a clip and a thumbnail for every event on a live stream
+EVENT_CLIPS = os.getenv("EVENT_CLIPS", "1") == "1"
+# Where clips and thumbnails are written
+CLIP_DIR = os.getenv("CLIP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".event_clips"))
+# Seconds kept before and after the start of an event
+CLIP_PRE_ROLL_S = float(os.getenv("CLIP_PRE_ROLL_S", "5"))
+CLIP_POST_ROLL_S = float(os.getenv("CLIP_POST_ROLL_S", "5"))
+# Frames per second kept in the ring buffer
+CLIP_BUFFER_FPS = float(os.getenv("CLIP_BUFFER_FPS", "5"))
+# Memory budget of one stream's ring buffer
+CLIP_BUFFER_BYTES = int(os.getenv("CLIP_BUFFER_BYTES", str(16 * 1024 * 1024)))
+# Buffered frames are shrunk to this longest side (0 keeps the source size)
+CLIP_MAX_SIDE = int(os.getenv("CLIP_MAX_SIDE", "960"))
+CLIP_JPEG_QUALITY = int(os.getenv("CLIP_JPEG_QUALITY", "75"))
+# Video codec of written clips; MJPG/.avi is used when it is not available
+CLIP_CODEC = os.getenv("CLIP_CODEC", "mp4v")
+# Oldest clips are deleted once the directory holds more than this
+CLIP_RETENTION_BYTES = int(os.getenv("CLIP_RETENTION_BYTES", str(1024 * 1024 * 1024)))
+# Clips waiting for the writer; more are dropped
+CLIP_QUEUE_SIZE = 16
+# URL prefix the files are served under (app.py)
+CLIP_URL_PREFIX = "/clips"
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+@dataclass
+class EncodedFrame:
+    timestamp: float
+    jpeg: bytes
+    scale: float  # buffered size / source size
+
+
+class EncodedRing:
+    """
+    Recent JPEG frames, dropping the oldest beyond `max_seconds` or `max_bytes`.
+    """
+
+    def __init__(self, max_seconds: float, max_bytes: int = CLIP_BUFFER_BYTES):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self._frames: Deque[EncodedFrame] = collections.deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def append(self, frame: EncodedFrame):
+        with self._lock:
+            self._frames.append(frame)
+            self._bytes += len(frame.jpeg)
+            while self._frames and (self._bytes > self.max_bytes
+                                    or frame.timestamp - self._frames[0].timestamp > self.max_seconds):
+                self._bytes -= len(self._frames.popleft().jpeg)
+
+    def between(self, start: float, end: float) -> List[EncodedFrame]:
+        with self._lock:
+            return [frame for frame in self._frames if start <= frame.timestamp <= end]
+
+
+@dataclass
+class ClipJob:
+    """One clip to write: its frames and where the files go."""
+    event: Event
+    start: float
+    end: float
+    clip_path: str
+    thumbnail_path: str
+    frames: List[EncodedFrame] = field(default_factory=list)
+
+
+class ClipWriter:
+    """
+    Writes clips on one background thread, started on first use.
+
+    Args:
+        directory: Where clips and thumbnails go.
+        retention_bytes: Oldest files are deleted beyond this total.
+        queue_size: Clips that may wait for the writer before new ones are dropped.
+    """
+
+    def __init__(self, directory: str = CLIP_DIR, retention_bytes: int = CLIP_RETENTION_BYTES,
+                 queue_size: int = CLIP_QUEUE_SIZE):
+        self.directory = directory
+        self.retention_bytes = retention_bytes
+        self.written = 0
+        # Clips given up on: writer full, no buffered frames or a failed write
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[ClipJob]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def pending(self) -> int:
+        """Clips waiting to be written."""
+        return self._queue.qsize()
+
+    def submit(self, job: ClipJob) -> bool:
+        """Queues `job` without waiting; returns False if the writer is full."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            logger.warning("Clip writer is behind; dropped the clip of a %s event", job.event.type)
+            self.abandon(job, "clip writer is behind")
+            return False
+
+    def abandon(self, job: ClipJob, reason: str):
+        """Counts `job` as dropped and points its event's notes at no files."""
+        self.dropped += 1
+        # Only keys set by `trigger` are updated (see `write`)
+        notes = job.event.evidence.notes
+        if notes is not None:
+            notes["clip_url"] = notes["thumbnail_url"] = None
+            notes["clip_error"] = reason
+
+    def shutdown(self, timeout: float = 10.0):
+        """Writes the queued clips and stops the thread."""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout=timeout)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self.write(job)
+                self.written += 1
+                self._prune()
+            except Exception as e:
+                logger.exception("Could not write the clip of a %s event", job.event.type)
+                self.abandon(job, f"could not write the clip: {e}")
+
+    def write(self, job: ClipJob):
+        if not job.frames:
+            raise ValueError("no frames to write")
+        frames = [cv2.imdecode(np.frombuffer(frame.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                  for frame in job.frames]
+        height, width = frames[0].shape[:2]
+        duration = job.frames[-1].timestamp - job.frames[0].timestamp
+        fps = (len(frames) - 1) / duration if len(frames) > 1 and duration > 0 else CLIP_BUFFER_FPS
+        job.clip_path = _write_video(job.clip_path, frames, fps, (width, height))
+
+        # The thumbnail is the buffered frame closest to the start of the event
+        index = min(range(len(job.frames)), key=lambda i: abs(job.frames[i].timestamp - job.event.timestamp))
+        thumbnail = annotate(frames[index], job.event, job.frames[index].scale)
+        _write_atomic(job.thumbnail_path, cv2.imencode(".jpg", thumbnail)[1].tobytes())
+
+        # Only keys set by `trigger` are updated, so the notes can be
+        # serialized by a request meanwhile
+        notes = job.event.evidence.notes
+        if notes is not None:
+            notes["clip_url"] = f"{CLIP_URL_PREFIX}/{os.path.basename(job.clip_path)}"
+            notes["clip_frames"] = len(frames)
+            notes["clip_ready"] = True
+
+    def _prune(self):
+        if self.retention_bytes <= 0:
+            return
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".partial"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.retention_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def _write_atomic(path: str, data: bytes):
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def _write_video(path: str, frames: List[np.ndarray], fps: float, size: Tuple[int, int]) -> str:
+    """Encodes `frames` to `path` (or an .avi next to it with MJPG); returns the path written."""
+    base, ext = os.path.splitext(path)
+    for codec, target in ((CLIP_CODEC, path), ("MJPG", base + ".avi")):
+        # OpenCV picks the container from the extension, so it stays last
+        partial = f"{base}.partial{os.path.splitext(target)[1]}"
+        writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*codec), fps, size)
+        if not writer.isOpened():
+            writer.release()
+            continue
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        os.replace(partial, target)
+        return target
+    raise RuntimeError(f"No video codec available for {path}")
+
+
+def annotate(frame: np.ndarray, event: Event, scale: float = 1.0) -> np.ndarray:
+    """Draws the event's boxes and label on a copy of `frame`."""
+    out = frame.copy()
+    color = (0, 0, 255)
+    for box in event.evidence.boxes or []:
+        x1, y1 = int(box.x * scale), int(box.y * scale)
+        x2, y2 = int((box.x + box.w) * scale), int((box.y + box.h) * scale)
+        cv2.rectangle(out, (x1, y1), (x2, y2), color, 2)
+    label = f"{event.type} {event.confidence:.2f}"
+    cv2.putText(out, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
+    return out
+
+
+class ClipRecorder:
+    """
+    Ring buffer and pending clips of one stream.
+
+    `push` runs on the reader thread; `trigger` runs on the analysis loop
+    and only records what to cut.
+
+    Args:
+        name: Stream id, used in file names.
+        writer: Shared writer the finished clips go to.
+    """
+
+    def __init__(self, name: str, writer: ClipWriter, pre_roll: float = CLIP_PRE_ROLL_S,
+                 post_roll: float = CLIP_POST_ROLL_S, buffer_fps: float = CLIP_BUFFER_FPS,
+                 max_bytes: int = CLIP_BUFFER_BYTES, max_side: int = CLIP_MAX_SIDE,
+                 quality: int = CLIP_JPEG_QUALITY):
+        self.name = _UNSAFE.sub("_", name)
+        self.writer = writer
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.interval = 1.0 / max(buffer_fps, 1e-3)
+        self.max_side = max_side
+        self.quality = quality
+        # The post-roll of a clip must still be buffered when it is cut
+        self.ring = EncodedRing(pre_roll + post_roll + 1.0, max_bytes)
+        self._pending: List[ClipJob] = []
+        self._lock = threading.Lock()
+        self._last_buffered = 0.0
+
+    def push(self, frame: np.ndarray, timestamp: float):
+        """Buffers `frame` if it is time to, and hands finished clips to the writer."""
+        if timestamp - self._last_buffered >= self.interval:
+            self._last_buffered = timestamp
+            height, width = frame.shape[:2]
+            scale = 1.0
+            if self.max_side and max(height, width) > self.max_side:
+                scale = self.max_side / max(height, width)
+                frame = cv2.resize(frame, (round(width * scale), round(height * scale)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if ok:
+                self.ring.append(EncodedFrame(timestamp, jpeg.tobytes(), scale))
+        if self._pending:
+            self._finish(lambda job: timestamp >= job.end)
+
+    def trigger(self, event: Event) -> Event:
+        """
+        Schedules the clip of an event that starts at `event.timestamp` and
+        points its evidence notes at the files to come. Never blocks.
+        """
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(event.timestamp))
+        stem = f"{self.name}-{event.type}-{stamp}-{int(event.timestamp * 1000) % 1000:03d}"
+        clip_path = os.path.join(self.writer.directory, f"{stem}.mp4")
+        thumbnail_path = os.path.join(self.writer.directory, f"{stem}.jpg")
+        job = ClipJob(event, event.timestamp - self.pre_roll, event.timestamp + self.post_roll,
+                      clip_path, thumbnail_path)
+        notes = event.evidence.notes if event.evidence.notes is not None else {}
+        notes.update(
+            clip_url=f"{CLIP_URL_PREFIX}/{os.path.basename(clip_path)}",
+            thumbnail_url=f"{CLIP_URL_PREFIX}/{os.path.basename(thumbnail_path)}",
+            clip_start=job.start,
+            clip_end=job.end,
+            clip_frames=0,
+            clip_ready=False,
+            clip_error=None,
+        )
+        event.evidence.notes = notes
+        with self._lock:
+            self._pending.append(job)
+        return event
+
+    def flush(self):
+        """Hands every pending clip to the writer with the frames buffered so far."""
+        self._finish(lambda job: True)
+
+    def _finish(self, ready):
+        with self._lock:
+            done = [job for job in self._pending if ready(job)]
+            if not done:
+                return
+            self._pending = [job for job in self._pending if not ready(job)]
+        for job in done:
+            job.frames = self.ring.between(job.start, job.end)
+            if job.frames:
+                self.writer.submit(job)
+            else:
+                self.writer.abandon(job, "no frames were buffered around the event")
@@ -0,0 +1,209 @@
+# backend/detections.py
+"""
+Compact, struct-of-arrays representation of one frame's detections.
+
+The model output is copied off the device and into NumPy exactly once per
+frame. Everything downstream works on the arrays; the per-detection dicts
+the event handlers understand are only built when `to_dicts()` is called.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class Detections:
+    """
+    Detections for a single frame.
+
+    Attributes:
+        boxes: (N, 4) float32 array of x1, y1, x2, y2 pixel coordinates.
+        conf: (N,) float32 confidences.
+        cls: (N,) int32 class ids, resolved through `names`.
+        names: Class id -> label mapping of the model that produced them.
+        keypoints: Optional (N, K, 3) float32 array of normalized x, y and
+            score for each keypoint of each box (pose models only).
+        track_ids: Optional (N,) int64 array of stable per-object ids, set
+            when the detections come from a tracker.
+        image_size: (height, width) of the frame, needed to turn normalized
+            keypoints back into pixels.
+    """
+    boxes: np.ndarray
+    conf: np.ndarray
+    cls: np.ndarray
+    names: Dict[int, str]
+    keypoints: Optional[np.ndarray] = None
+    track_ids: Optional[np.ndarray] = None
+    image_size: Optional[Tuple[int, int]] = None
+    _labels: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def empty(cls, names: Optional[Dict[int, str]] = None) -> "Detections":
+        return cls(
+            boxes=np.zeros((0, 4), dtype=np.float32),
+            conf=np.zeros(0, dtype=np.float32),
+            cls=np.zeros(0, dtype=np.int32),
+            names=dict(names or {}),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the arrays."""
+        arrays = (self.boxes, self.conf, self.cls, self.keypoints, self.track_ids)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def rescale(self, factor: float) -> "Detections":
+        """
+        The same detections on a frame `factor` times larger (e.g. back on
+        the source resolution of a frame shrunk while decoding). Keypoints
+        are normalized and stay as they are.
+        """
+        image_size = None
+        if self.image_size is not None:
+            image_size = (round(self.image_size[0] * factor), round(self.image_size[1] * factor))
+        return Detections(
+            boxes=self.boxes * np.float32(factor),
+            conf=self.conf,
+            cls=self.cls,
+            names=self.names,
+            keypoints=self.keypoints,
+            track_ids=self.track_ids,
+            image_size=image_size,
+        )
+
+    @classmethod
+    def from_result(cls, r, names: Dict[int, str]) -> "Detections":
+        """
+        Builds the container from one ultralytics Results object with a
+        single host copy per tensor.
+        """
+        if r.boxes is None or len(r.boxes) == 0:
+            return cls.empty(names)
+
+        # data is (N, 6) - or (N, 7) with a track id - ending in conf, cls
+        data = r.boxes.data.cpu().numpy()
+        keypoints = None
+        if r.keypoints is not None and len(r.keypoints):
+            xyn = r.keypoints.xyn.cpu().numpy()
+            if r.keypoints.conf is not None:
+                scores = r.keypoints.conf.cpu().numpy()
+            else:
+                scores = np.ones(xyn.shape[:2], dtype=np.float32)
+            keypoints = np.concatenate([xyn, scores[..., None]], axis=-1).astype(np.float32, copy=False)
+
+        return cls(
+            boxes=data[:, :4].astype(np.float32, copy=False),
+            conf=data[:, -2].astype(np.float32, copy=False),
+            cls=data[:, -1].astype(np.int32),
+            names=names,
+            keypoints=keypoints,
+            track_ids=data[:, 4].astype(np.int64) if data.shape[1] == 7 else None,
+            image_size=tuple(r.orig_shape[:2]) if r.orig_shape is not None else None,
+        )
+
+    @classmethod
+    def concat(cls, parts: List["Detections"]) -> "Detections":
+        """
+        Stacks the detections several models produced for the same frame.
+        Class ids are renumbered into one merged `names` mapping; rows from
+        models without keypoints get all-zero keypoints when others have them.
+        """
+        if len(parts) == 1:
+            return parts[0]
+        names: Dict[int, str] = {}
+        ids: Dict[str, int] = {}
+        cls_parts = []
+        for part in parts:
+            lookup = np.array([ids.setdefault(label, len(ids)) for label in
+                               (part.names.get(i, str(i)) for i in range(int(part.cls.max(initial=-1)) + 1))],
+                              dtype=np.int32)
+            cls_parts.append(lookup[part.cls] if len(part) else np.zeros(0, dtype=np.int32))
+        for label, class_id in ids.items():
+            names[class_id] = label
+
+        keypoints = None
+        shapes = [part.keypoints.shape[1:] for part in parts if part.keypoints is not None]
+        if shapes:
+            keypoints = np.concatenate([
+                part.keypoints if part.keypoints is not None else np.zeros((len(part), *shapes[0]), dtype=np.float32)
+                for part in parts
+            ])
+        return cls(
+            boxes=np.concatenate([part.boxes for part in parts]),
+            conf=np.concatenate([part.conf for part in parts]),
+            cls=np.concatenate(cls_parts),
+            names=names,
+            keypoints=keypoints,
+            image_size=next((part.image_size for part in parts if part.image_size is not None), None),
+        )
+
+    def __len__(self) -> int:
+        return int(self.conf.shape[0])
+
+    @property
+    def labels(self) -> np.ndarray:
+        """(N,) array of class labels, resolved once and cached."""
+        if self._labels is None:
+            lookup = np.array([self.names.get(i, str(i)) for i in range(int(self.cls.max(initial=-1)) + 1)], dtype=object)
+            self._labels = lookup[self.cls] if len(self) else np.zeros(0, dtype=object)
+        return self._labels
+
+    @property
+    def wh(self) -> np.ndarray:
+        """(N, 2) array of box widths and heights."""
+        return self.boxes[:, 2:4] - self.boxes[:, 0:2]
+
+    @property
+    def centers(self) -> np.ndarray:
+        """(N, 2) array of box centers."""
+        return (self.boxes[:, 0:2] + self.boxes[:, 2:4]) / 2
+
+    def select(self, mask) -> "Detections":
+        """Returns the subset of rows picked by a boolean mask or index array."""
+        return Detections(
+            boxes=self.boxes[mask],
+            conf=self.conf[mask],
+            cls=self.cls[mask],
+            names=self.names,
+            keypoints=self.keypoints[mask] if self.keypoints is not None else None,
+            track_ids=self.track_ids[mask] if self.track_ids is not None else None,
+            image_size=self.image_size,
+        )
+
+    def of_type(self, label: str) -> "Detections":
+        """Rows whose class label is `label`."""
+        return self.select(self.labels == label)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """
+        Materializes the legacy detection dicts consumed by `events/*`.
+
+        Each row becomes a box detection; rows with keypoints additionally
+        produce a "pose" detection whose points are named point_0..point_K.
+        """
+        # One bulk conversion to Python scalars instead of one per field
+        boxes = self.boxes.astype(np.int32).tolist()
+        conf = self.conf.tolist()
+        labels = self.labels.tolist()
+
+        detections = []
+        for (x1, y1, x2, y2), score, label in zip(boxes, conf, labels):
+            detections.append({
+                "type": label,
+                "confidence": score,
+                "box": {"x": x1, "y": y1, "w": x2 - x1, "h": y2 - y1}
+            })
+
+        if self.keypoints is not None:
+            for score, points in zip(conf, self.keypoints.tolist()):
+                detections.append({
+                    "type": "pose",
+                    "confidence": score,
+                    "pose": {
+                        f"point_{j}": {"name": f"point_{j}", "x": x, "y": y, "score": s}
+                        for j, (x, y, s) in enumerate(points)
+                    }
+                })
+        return detections
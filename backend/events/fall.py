@@ -1,50 +1,141 @@
 # backend/events/fall.py
 
-from schema import AnalyzeResponse
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from detections import Detections
+from schema import AnalyzeResponse, Evidence, Event, Box, PosePoint
+
+if TYPE_CHECKING:
+    from temporal import FrameTemporal
 
 # The aspect ratio threshold for a "fall"
 FALL_ASPECT_RATIO_THRESHOLD = 1.5
 FALL_CONFIDENCE_THRESHOLD = 0.5
+# With temporal context, the person must stay horizontal this long (seconds)
+FALL_MIN_SECONDS = 2.0
+# Lying motionless this long after a fall makes it more severe (seconds)
+FALL_MOTIONLESS_SECONDS = 5.0
+# With pose keypoints, a torso tilted further than this from vertical is lying down
+FALL_TORSO_ANGLE_DEG = 60.0
+FALL_KEYPOINT_CONFIDENCE = 0.5
+# COCO keypoint indices of the shoulders and hips
+_SHOULDERS, _HIPS = [5, 6], [11, 12]
 
-def analyze_fall(detections: list, mock: bool = False) -> AnalyzeResponse:
+
+def horizontal_mask(detections: Detections) -> np.ndarray:
+    """
+    (N,) mask of confident detections lying horizontally.
+
+    Rows whose shoulders and hips were all found by a pose model are judged
+    by the angle of the torso; all others by the box being wider than tall.
     """
-    Analyzes raw detections to determine if a fall event has occurred.
+    wh = detections.wh
+    horizontal = wh[:, 0] / np.maximum(wh[:, 1], 1e-6) > FALL_ASPECT_RATIO_THRESHOLD
+
+    keypoints = detections.keypoints
+    if keypoints is not None and detections.image_size is not None and keypoints.shape[1] > max(_HIPS):
+        height, width = detections.image_size
+        torso = keypoints[:, _SHOULDERS + _HIPS]
+        visible = (torso[:, :, 2] > FALL_KEYPOINT_CONFIDENCE).all(axis=1)
+        # Shoulder midpoint minus hip midpoint, in pixels
+        dx = (torso[:, :2, 0].mean(axis=1) - torso[:, 2:, 0].mean(axis=1)) * width
+        dy = (torso[:, :2, 1].mean(axis=1) - torso[:, 2:, 1].mean(axis=1)) * height
+        lying = np.abs(dx) > np.abs(dy) * np.tan(np.radians(FALL_TORSO_ANGLE_DEG))
+        horizontal = np.where(visible, lying, horizontal)
+
+    return (detections.conf > FALL_CONFIDENCE_THRESHOLD) & horizontal
+
+
+def _pose_points(points: np.ndarray) -> Dict[str, PosePoint]:
+    return {
+        f"point_{j}": PosePoint(name=f"point_{j}", x=x, y=y, score=score)
+        for j, (x, y, score) in enumerate(points.tolist())
+    }
+
+
+def detect_falls(detections: Detections, rows: np.ndarray, temporal: Optional["FrameTemporal"] = None) -> Optional[AnalyzeResponse]:
+    """
+    Vectorized fall rule over the person rows of one frame.
     
     Args:
-        detections: A list of structured dictionaries from the VisionEngine.
-        mock: If True, returns a mock response for testing.
+        detections: The frame's detections.
+        rows: Indices of its person rows.
+        temporal: The frame's temporal annotations, when there is a TemporalState.
         
     Returns:
-        An AnalyzeResponse object.
+        One response with an event per fallen person, or None.
     """
-    if mock:
-        return AnalyzeResponse(
-            severity=0.7,
-            explanation="[MOCK] A fall has been detected.",
-            recommended_actions=["Call emergency services.", "Check on the individual."]
+    qualifying = horizontal_mask(detections)[rows]
+    if temporal is not None:
+        # A single horizontal frame is not enough: it has to last
+        qualifying &= temporal.horizontal_seconds[rows] >= FALL_MIN_SECONDS
+    if not qualifying.any():
+        return None
+
+    # Pydantic objects are only built for the fallen persons
+    fallen = rows[qualifying]
+    wh = detections.wh[fallen]
+    aspect_ratios = (wh[:, 0] / np.maximum(wh[:, 1], 1e-6)).tolist()
+    boxes = detections.boxes[fallen].astype(np.int32).tolist()
+    confidences = detections.conf[fallen].tolist()
+    if temporal is not None:
+        horizontal_seconds = temporal.horizontal_seconds[fallen].tolist()
+        motionless_seconds = temporal.motionless_seconds[fallen].tolist()
+        track_ids = [track_id if track_id >= 0 else None for track_id in temporal.track_ids[fallen].tolist()]
+    else:
+        horizontal_seconds = motionless_seconds = [0.0] * len(fallen)
+        track_ids = [None] * len(fallen)
+
+    evidence, events = [], []
+    for i, row in enumerate(fallen.tolist()):
+        x1, y1, x2, y2 = boxes[i]
+        evid = Evidence(
+            boxes=[Box(x=x1, y=y1, w=x2 - x1, h=y2 - y1)],
+            pose=_pose_points(detections.keypoints[row]) if detections.keypoints is not None else None,
+            scene="unknown",
+            notes={
+                "model": "YOLOv8",
+                "why": "Person lying horizontally",
+                "aspect_ratio": aspect_ratios[i],
+                "track_id": track_ids[i],
+                "motionless_seconds": motionless_seconds[i],
+            },
         )
+        evidence.append(evid)
+        events.append(Event(
+            type="fall",
+            confidence=confidences[i],
+            evidence=evid,
+            window_seconds=horizontal_seconds[i],
+            timestamp=0.0,
+        ))
 
-    for detection in detections:
-        # We only care about detections with a bounding box and person type
-        if detection.get("type") == "person" and "box" in detection:
-            box = detection["box"]
-            confidence = detection["confidence"]
-            
-            if confidence > FALL_CONFIDENCE_THRESHOLD:
-                # Calculate the aspect ratio (width / height)
-                aspect_ratio = box["w"] / box["h"]
-                
-                # If the person is horizontal (e.g., on the ground)
-                if aspect_ratio > FALL_ASPECT_RATIO_THRESHOLD:
-                    return AnalyzeResponse(
-                        severity=0.8,
-                        explanation="Potential fall detected. The person appears to be on the ground.",
-                        recommended_actions=["Review the camera feed immediately.", "Alert a team member."]
-                    )
-    
-    # If no fall is detected after checking all detections
+    longest_still = max(motionless_seconds)
+    motionless = longest_still >= FALL_MOTIONLESS_SECONDS
+    explanation = ("Potential fall detected. The person appears to be on the ground." if len(events) == 1
+                   else f"Potential falls detected. {len(events)} people appear to be on the ground.")
+    if motionless:
+        explanation += f" Someone has not moved for {longest_still:.0f} seconds."
+    return AnalyzeResponse(
+        severity=0.9 if motionless else 0.8,
+        explanation=explanation,
+        recommended_actions=["Review the camera feed immediately.", "Alert a team member."],
+        evidence=evidence,
+        categories=["fall"],
+        events=events,
+    )
+
+def analyze_fall(detections: list, mock: bool = False) -> AnalyzeResponse:
+    """
+    Mock-mode handler of the fall analyzer (see classifyEvent._route_mock).
+
+    Real frames never reach it: they go through detect_falls, which works
+    on the Detections arrays and the stream's temporal context.
+    """
     return AnalyzeResponse(
-        severity=0.05,
-        explanation="No fall event detected. The area is clear.",
-        recommended_actions=["Continue monitoring."]
-    )
\ No newline at end of file
+        severity=0.7,
+        explanation="[MOCK] A fall has been detected.",
+        recommended_actions=["Call emergency services.", "Check on the individual."]
+    )
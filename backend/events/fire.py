@@ -1,10 +1,76 @@
 # backend/events/fire.py
 
 from schema import AnalyzeResponse, Evidence, Event, Box
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+
+import numpy as np
+
+from detections import Detections
+
+if TYPE_CHECKING:
+    from temporal import FrameTemporal
 
 # Define a confidence threshold for fire detection
 FIRE_CONFIDENCE_THRESHOLD = 0.5
+# Fire area growing faster than this (fraction of its size per second) is spreading
+FIRE_SPREAD_RATE = 0.05
+
+
+def detect_fire(detections: Detections, rows: np.ndarray, temporal: Optional["FrameTemporal"] = None) -> Optional[AnalyzeResponse]:
+    """
+    Vectorized fire rule over the fire rows of one frame.
+    
+    Args:
+        detections: The frame's detections.
+        rows: Indices of its fire rows.
+        temporal: The frame's temporal annotations, when there is a TemporalState.
+        
+    Returns:
+        One response with an event per confident fire box, or None.
+    """
+    burning = rows[detections.conf[rows] > FIRE_CONFIDENCE_THRESHOLD]
+    if not len(burning):
+        return None
+
+    # Growth of the total fire area, when temporal context is available
+    trend = temporal.fire if temporal is not None else {}
+    growth_rate = trend.get("fire_growth_rate", 0.0)
+    fire_area = trend.get("fire_area") or 0.0
+    spreading = fire_area > 0 and growth_rate / fire_area > FIRE_SPREAD_RATE
+    notes = {"model": "YOLOv8", "why": "Detected fire object"}
+    if trend:
+        notes.update(
+            fire_area=fire_area,
+            fire_growth_rate=growth_rate,
+            fire_growth_ratio=trend.get("fire_growth_ratio"),
+        )
+
+    evidence, events = [], []
+    for (x1, y1, x2, y2), confidence in zip(detections.boxes[burning].astype(np.int32).tolist(),
+                                             detections.conf[burning].tolist()):
+        evid = Evidence(boxes=[Box(x=x1, y=y1, w=x2 - x1, h=y2 - y1)], scene="indoor", notes=notes)
+        evidence.append(evid)
+        events.append(Event(
+            type="fire",
+            confidence=confidence,
+            evidence=evid,
+            window_seconds=trend.get("fire_window_seconds", 0.0),
+            timestamp=0.0,
+        ))
+
+    return AnalyzeResponse(
+        severity=0.95 if spreading else 0.85,
+        explanation=("Fire detected and spreading. The burning area is growing."
+                     if spreading else "Fire detected. Visible flames are present."),
+        recommended_actions=[
+            "Call emergency services.",
+            "Evacuate immediately."
+        ],
+        evidence=evidence,
+        categories=["fire"],
+        events=events,
+    )
+
 
 def analyze_fire(detections: List[Dict[str, Any]], mock: bool = False) -> AnalyzeResponse:
     """
@@ -29,11 +95,23 @@ def analyze_fire(detections: List[Dict[str, Any]], mock: bool = False) -> Analyz
                     h=box_data["h"]
                 )
                 
+                # Growth of the total fire area, when temporal context is available
+                growth_rate = det.get("fire_growth_rate", 0.0)
+                fire_area = det.get("fire_area") or 0.0
+                spreading = fire_area > 0 and growth_rate / fire_area > FIRE_SPREAD_RATE
+                
                 # Build the evidence object with the real bounding box
+                notes = {"model": "YOLOv8", "why": "Detected fire object"}
+                if "fire_growth_rate" in det:
+                    notes.update(
+                        fire_area=fire_area,
+                        fire_growth_rate=growth_rate,
+                        fire_growth_ratio=det.get("fire_growth_ratio"),
+                    )
                 evid = Evidence(
                     boxes=[detected_box],
                     scene="indoor",
-                    notes={"model": "YOLOv8", "why": "Detected fire object"},
+                    notes=notes,
                 )
                 
                 # Build the event object with real confidence
@@ -41,13 +119,14 @@ def analyze_fire(detections: List[Dict[str, Any]], mock: bool = False) -> Analyz
                     type="fire",
                     confidence=det.get("confidence"),
                     evidence=evid,
-                    window_seconds=0.0,
+                    window_seconds=det.get("fire_window_seconds", 0.0),
                     timestamp=0.0,
                 )
                 
                 return AnalyzeResponse(
-                    severity=0.85,
-                    explanation="Fire detected. Visible flames are present.",
+                    severity=0.95 if spreading else 0.85,
+                    explanation=("Fire detected and spreading. The burning area is growing."
+                                 if spreading else "Fire detected. Visible flames are present."),
                     recommended_actions=[
                         "Call emergency services.",
                         "Evacuate immediately."
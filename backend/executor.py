@@ -0,0 +1,175 @@
+# backend/executor.py
+"""
+Bounded worker pool for analysis jobs.
+
+Request handlers never decode or run inference on the event loop or on the
+shared FastAPI threadpool. They reserve a slot here first: if every worker
+is busy and the admission queue is full the request is turned away at once
+(HTTP 429 + Retry-After) instead of piling up and dragging p99 latency, and
+/health and friends stay responsive.
+"""
+
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Analyses running at the same time (decode + reasoning; model calls are
+# serialized through the micro-batcher)
+DEFAULT_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+# Admitted requests allowed to wait for a free worker
+DEFAULT_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", str(2 * DEFAULT_WORKERS)))
+# Longest a request may wait for its analysis
+DEFAULT_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", "120"))
+# Intra-op threads torch may use; 0 leaves torch's own default alone
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised when the admission queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceTimeout(TimeoutError):
+    """Raised when an analysis does not finish within its timeout."""
+
+
+def _pin_torch_threads(threads: int):
+    if threads <= 0:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+class Reservation:
+    """An admitted slot in the executor. Released when its work finishes."""
+
+    def __init__(self, executor: "InferenceExecutor"):
+        self._executor = executor
+        self._used = False
+        # Seconds the work waited for a free worker, once it has started
+        self.queued_seconds = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None,
+                  on_timeout: Optional[Callable[[], None]] = None, **kwargs) -> Any:
+        """
+        Runs `fn(*args, **kwargs)` on a worker and awaits its result.
+
+        Args:
+            timeout: Seconds to wait before giving up (default INFERENCE_TIMEOUT_S).
+            on_timeout: Called when the timeout fires, to ask `fn` to stop early.
+
+        Raises:
+            InferenceTimeout: The work did not finish in time. Its slot stays
+                taken until the worker actually returns.
+        """
+        if self._used:
+            raise RuntimeError("Reservation already used")
+        self._used = True
+        executor = self._executor
+        limit = executor.timeout if timeout is None else timeout
+        started = time.monotonic()
+        work = functools.partial(fn, *args, **kwargs)
+
+        def call():
+            self.queued_seconds = time.monotonic() - started
+            return work()
+
+        future = executor._pool.submit(call)
+        # The slot is freed when the worker is done, not when the caller
+        # stops waiting, so timed-out work still counts against capacity.
+        future.add_done_callback(lambda _: self._finish(started))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=limit)
+        except asyncio.TimeoutError:
+            if on_timeout is not None:
+                on_timeout()
+            raise InferenceTimeout(f"Analysis did not finish within {limit:.0f}s")
+
+    def release(self):
+        """Gives back a slot that was never used to run anything."""
+        if not self._used:
+            self._used = True
+            self._executor._release()
+
+    def _finish(self, started: float):
+        self._executor._record(time.monotonic() - started)
+        self._executor._release()
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class InferenceExecutor:
+    """
+    Fixed-size thread pool with an admission limit of
+    `workers + queue_size` in-flight analyses.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        timeout: float = DEFAULT_TIMEOUT_S,
+        torch_threads: int = TORCH_THREADS,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        _pin_torch_threads(torch_threads)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Exponentially weighted average analysis time, for Retry-After
+        self._avg_seconds = 1.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Admitted analyses still waiting for a worker."""
+        return max(0, self._in_flight - self.workers)
+
+    def reserve(self) -> Reservation:
+        """
+        Admits one analysis.
+
+        Raises:
+            ExecutorBusy: Every worker and queue slot is taken.
+        """
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                raise ExecutorBusy(self.retry_after())
+            self._in_flight += 1
+        return Reservation(self)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up."""
+        waiting = max(1, self._in_flight - self.workers + 1)
+        return max(1, math.ceil(self._avg_seconds * waiting / self.workers))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, seconds: float):
+        with self._lock:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * seconds
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
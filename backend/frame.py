@@ -1,31 +1,43 @@
 #Helper function to capture frame and process it 
-import cv2
+import time
+from typing import Dict
+
 import numpy as np
 
-def _get_frame(source: str) -> np.ndarray:
+from streams import StreamReader
+
+# Long-lived readers, one per source, so a capture is opened only once
+_readers: Dict[str, StreamReader] = {}
+
+def _get_frame(source: str, timeout: float = 5.0) -> np.ndarray:
     """
-    Captures a single frame from the specified source.
+    Returns the most recent frame from the specified source.
+    
+    The capture stays open between calls (video files loop), so only the
+    first call pays for opening the device or file.
     
     Args:
         source: The source of the video feed (e.g., "webcam", "file").
+        timeout: Seconds to wait for the first frame of a new source.
     
     Returns:
         A single video frame as a numpy array.
     """
-    if source == "webcam":
-        cap = cv2.VideoCapture(0)
-    elif source.endswith(('.mp4', '.avi')):  # Check for common video file extensions
-        cap = cv2.VideoCapture(source)
-    else:
+    if source != "webcam" and not source.endswith(('.mp4', '.avi')):  # Check for common video file extensions
         raise ValueError("Unsupported video source type.")
 
-    if not cap.isOpened():
-        raise IOError(f"Could not open video source: {source}")
-
-    ret, frame = cap.read()
-    cap.release()
-    
-    if not ret:
-        raise IOError("Failed to read frame from video source.")
+    reader = _readers.get(source)
+    if reader is None or not reader.alive:
+        reader = StreamReader(source, loop=True).start()
+        _readers[source] = reader
 
-    return frame
\ No newline at end of file
+    deadline = time.monotonic() + timeout
+    while True:
+        seq, frame, _ = reader.latest.peek()
+        if seq > 0:
+            return frame
+        if reader.status == "error":
+            raise IOError(f"Could not open video source: {source}")
+        if time.monotonic() > deadline:
+            raise IOError("Failed to read frame from video source.")
+        time.sleep(0.01)
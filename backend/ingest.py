@@ -0,0 +1,327 @@
+# backend/ingest.py
+"""
+Bounded-memory ingest of video uploads.
+
+The multipart body is parsed as it arrives and the file part is appended,
+chunk by chunk, to an UploadBuffer. The buffer keeps small uploads in RAM,
+rolls large ones over to an anonymous temporary file, and can be read by the
+decoder while it is still being written, so analysis starts before the
+upload has finished.
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Union
+
+import cv2
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Uploads larger than this are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+# Uploads up to this size never touch the disk
+SPOOL_MEMORY_BYTES = int(os.getenv("SPOOL_MEMORY_BYTES", str(16 * 1024 * 1024)))
+# Size of the chunks copied out of file-like uploads
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Non-file form fields are tiny; anything bigger is a malformed request
+MAX_FIELD_BYTES = 64 * 1024
+
+# OpenCV >= 4.10 can decode straight from a Python stream; older builds need a path
+STREAM_DECODE_SUPPORTED = hasattr(cv2, "IStreamReader")
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+class UploadBuffer:
+    """
+    Append-only byte buffer that one thread writes while others read.
+
+    Reads past the current end block until more data arrives or the upload
+    is finished, which lets the decoder follow the upload as it streams in.
+    """
+
+    def __init__(self, max_bytes: int = MAX_UPLOAD_BYTES, memory_bytes: int = SPOOL_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self._file = tempfile.SpooledTemporaryFile(max_size=memory_bytes)
+        self._size = 0
+        # Hashed as it is written, so the content key is ready the moment
+        # the upload finishes
+        self._sha256 = hashlib.sha256()
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_file(cls, fileobj, max_bytes: int = MAX_UPLOAD_BYTES) -> "UploadBuffer":
+        """Copies a file-like object into a finished buffer, one chunk at a time."""
+        buffer = cls(max_bytes=max_bytes)
+        try:
+            while True:
+                chunk = fileobj.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+        except BaseException as e:
+            buffer.abort(e)
+            raise
+        buffer.finish()
+        return buffer
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def write(self, data: bytes):
+        with self._cond:
+            if self._done:
+                raise ValueError("UploadBuffer is already finished")
+            if self._size + len(data) > self.max_bytes:
+                raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+            self._file.seek(0, io.SEEK_END)
+            self._file.write(data)
+            self._sha256.update(data)
+            self._size += len(data)
+            self._cond.notify_all()
+
+    def finish(self):
+        """Marks the upload as complete."""
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def abort(self, error: BaseException):
+        """Fails every pending and future read with `error`."""
+        with self._cond:
+            self._error = error
+            self._done = True
+            self._cond.notify_all()
+
+    def close(self):
+        self.abort(ValueError("UploadBuffer is closed"))
+        with self._cond:
+            self._file.close()
+
+    def wait_until_done(self) -> int:
+        """Blocks until the upload is complete and returns its size."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._done)
+            if self._error is not None:
+                raise self._error
+            return self._size
+
+    def content_hash(self) -> Optional[str]:
+        """SHA-256 of the upload, or None while it is still arriving (or failed)."""
+        with self._cond:
+            if not self._done or self._error is not None:
+                return None
+            return self._sha256.hexdigest()
+
+    def read_at(self, position: int, size: int = -1) -> bytes:
+        """Reads up to `size` bytes at `position`, waiting for them to arrive."""
+        with self._cond:
+            if size < 0:
+                self._cond.wait_for(lambda: self._done)
+            else:
+                self._cond.wait_for(lambda: self._done or self._size >= position + size)
+            if self._error is not None:
+                raise self._error
+            self._file.seek(position)
+            return self._file.read(size)
+
+    def reader(self) -> "UploadReader":
+        """Returns an independent, seekable file-like view of the buffer."""
+        return UploadReader(self)
+
+
+class UploadReader(io.BufferedIOBase):
+    """Seekable reader over an UploadBuffer, usable by OpenCV and PyAV."""
+
+    def __init__(self, buffer: UploadBuffer):
+        super().__init__()
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        data = self._buffer.read_at(self._position, -1 if size is None else size)
+        self._position += len(data)
+        return data
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            # The end is only known once the upload has finished
+            self._position = self._buffer.wait_until_done() + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+VideoUpload = Union[bytes, bytearray, memoryview, UploadBuffer]
+
+
+def upload_hash(upload: VideoUpload) -> Optional[str]:
+    """SHA-256 of an upload, or None if it is an UploadBuffer still being received."""
+    if isinstance(upload, UploadBuffer):
+        return upload.content_hash()
+    return hashlib.sha256(upload).hexdigest()
+
+
+@contextmanager
+def video_source(upload: VideoUpload) -> Iterator[Union[str, io.BufferedIOBase]]:
+    """
+    Yields something the decode pipeline can open for `upload`: a stream
+    when OpenCV supports stream decoding, otherwise a temporary file path.
+    """
+    if STREAM_DECODE_SUPPORTED:
+        if isinstance(upload, UploadBuffer):
+            yield upload.reader()
+        else:
+            yield io.BytesIO(upload)
+        return
+
+    # Older OpenCV: the decoder can only open paths
+    reader = upload.reader() if isinstance(upload, UploadBuffer) else io.BytesIO(upload)
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
+        while True:
+            chunk = reader.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            temp_file.write(chunk)
+        temp_file_path = temp_file.name
+    try:
+        yield temp_file_path
+    finally:
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+
+
+class MultipartUpload:
+    """
+    Incremental multipart/form-data receiver for a single file field.
+
+    Text fields are collected into `fields`; the bytes of `file_field` go
+    straight into `buffer` as they come off the socket.
+    """
+
+    def __init__(self, request, file_field: str, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.request = request
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.buffer = UploadBuffer(max_bytes=max_bytes)
+        self._file_seen = False
+        self._file_started = asyncio.Event()
+        # State of the part currently being parsed
+        self._header_field = b""
+        self._header_value = b""
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._part_data = bytearray()
+
+    async def wait_for_file(self):
+        """Returns once the file part has started (or the body has ended)."""
+        await self._file_started.wait()
+
+    async def receive(self):
+        """
+        Reads the whole request body, feeding the buffer as it goes.
+
+        Raises:
+            UploadTooLarge: The body is larger than the configured limit.
+            ValueError: The body is not multipart or lacks the file field.
+        """
+        try:
+            content_length = self.request.headers.get("content-length")
+            if content_length and int(content_length) > self.buffer.max_bytes + MAX_FIELD_BYTES:
+                raise UploadTooLarge(f"Upload exceeds the {self.buffer.max_bytes} byte limit")
+
+            content_type, params = parse_options_header(self.request.headers.get("content-type"))
+            boundary = params.get(b"boundary")
+            if content_type != b"multipart/form-data" or not boundary:
+                raise ValueError("Expected a multipart/form-data body")
+
+            parser = MultipartParser(boundary, {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+            })
+            async for chunk in self.request.stream():
+                parser.write(chunk)
+            parser.finalize()
+
+            if not self._file_seen:
+                raise ValueError(f"Missing file field '{self.file_field}'")
+            self.buffer.finish()
+        except BaseException as e:
+            self.buffer.abort(e)
+            raise
+        finally:
+            self._file_started.set()
+
+    def _on_part_begin(self):
+        self._part_name = None
+        self._part_is_file = False
+        self._part_data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._part_name = options.get(b"name", b"").decode("latin-1")
+            if self._part_name == self.file_field and not self._file_seen:
+                self._part_is_file = True
+                self._file_seen = True
+                self.filename = options.get(b"filename", b"").decode("latin-1") or None
+                self._file_started.set()
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part_is_file:
+            self.buffer.write(data[start:end])
+            return
+        self._part_data += data[start:end]
+        if len(self._part_data) > MAX_FIELD_BYTES:
+            raise ValueError(f"Form field '{self._part_name}' is too large")
+
+    def _on_part_end(self):
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = self._part_data.decode("utf-8")
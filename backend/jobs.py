@@ -0,0 +1,170 @@
+# backend/jobs.py
+"""
+Background analysis jobs for long videos.
+
+A job is created as soon as its upload starts arriving and is processed by a
+small local worker pool fed from an in-process queue. While it runs, its
+progress counters and the events found so far can be polled or streamed, so
+clients learn about a fire in second 4 without waiting for the whole clip.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from classifyEvent import classify_upload
+from ingest import UploadBuffer
+from pipeline import PipelineStats
+from schema import AnalyzeResponse, Event, JobStatus
+
+# Jobs processed at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs allowed to wait for a worker before POST /jobs answers 429
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+# How long finished jobs stay queryable
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "3600"))
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when no more jobs can be queued."""
+
+
+class Job:
+    """State of one analysis job, shared between its worker and the API."""
+
+    def __init__(self, upload: UploadBuffer, source: str = "file", mock: bool = False):
+        self.id = uuid.uuid4().hex
+        self.upload = upload
+        self.source = source
+        self.mock = mock
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.status = "queued"
+        self.stats = PipelineStats()
+        # Append-only, so readers can follow it with a cursor
+        self.events: List[Event] = []
+        self.result: Optional[AnalyzeResponse] = None
+        self.error: Optional[str] = None
+        self.cancel = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def snapshot(self) -> JobStatus:
+        return JobStatus(
+            id=self.id,
+            status=self.status,
+            source=self.source,
+            created_at=self.created_at,
+            frames_decoded=self.stats.frames_decoded,
+            frames_analyzed=self.stats.frames_analyzed,
+            frames_skipped=self.stats.frames_skipped,
+            events=list(self.events),
+            result=self.result,
+            error=self.error,
+        )
+
+
+class JobManager:
+    """Owns the job table, the job queue and the worker threads."""
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, ttl: float = JOB_TTL_S):
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._worker_count = max(1, workers)
+        # Started with the first job, so importing the app (e.g. in a
+        # pre-fork master) creates no threads
+        self._workers: List[threading.Thread] = []
+
+    @property
+    def queued(self) -> int:
+        """Jobs waiting for a worker."""
+        return self._queue.qsize()
+
+    def submit(self, upload: UploadBuffer, source: str = "file", mock: bool = False) -> Job:
+        """
+        Queues a job for `upload`, which may still be receiving data.
+
+        Raises:
+            JobQueueFull: Every queue slot is taken.
+        """
+        self._prune()
+        self._ensure_workers()
+        job = Job(upload, source=source, mock=mock)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull("Job queue is full")
+        return job
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+            self._workers = [
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                for i in range(self._worker_count)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id: str):
+        """Cancels a job and forgets it (e.g. when its upload failed)."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.cancel.set()
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel.set()
+        for _ in self._workers:
+            self._queue.put(None)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                if job.cancel.is_set():
+                    continue
+                job.status = "running"
+                job.result = classify_upload(
+                    job.upload,
+                    source=job.source,
+                    mock=job.mock,
+                    cancel=job.cancel,
+                    on_event=job.events.append,
+                    stats=job.stats,
+                )
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.upload.close()
@@ -0,0 +1,672 @@
+# backend/loadtest.py
+"""
+Load test of the whole API against a local fake camera farm, ramped until
+it breaks.
+
+The server runs in its own process (by default with benchmark.py's stub
+engine in place of the model, or `--model` for real weights), so its CPU
+and memory are measured apart from the load generator. Against it run:
+
+- uploaders: an open-loop stream of POST /analyze_video (or /analyze)
+  requests with a synthetic clip, arriving at a given rate (Poisson or
+  evenly spaced). Open loop means a slow server does not slow the arrivals
+  down, so queueing shows up in the latencies instead of being hidden.
+- cameras: live streams (POST /streams) that replay the clip in a loop, each
+  with its FPS budget.
+
+Each step holds one load for `--step-seconds`. With `--ramp uploads` the
+upload rate grows by `--growth` per step (cameras fixed); with `--ramp
+cameras` the camera count does (upload rate fixed). A step breaks the SLO
+when its p99 upload latency exceeds `--slo-p99-ms`, more than
+`--max-error-rate` of its uploads fail (errors, timeouts and 429s), it
+completes less than THROUGHPUT_RATIO of the uploads it actually sent (random
+arrivals rarely hit the nominal rate), or the cameras
+analyze less than CAMERA_FPS_RATIO of their FPS budget. The ramp stops
+there; the last step that met the SLO is the saturation point, reported
+for upload ramps at the rate uploads were actually sent.
+
+Every step reports throughput, latency percentiles, error/timeout/rejection
+rates, camera FPS, and the server's CPU, RSS and queue depths (from
+/metrics); a timeline sampled every `--sample-seconds` is kept too. Results
+are written as JSON and can be checked against a stored baseline:
+
+    python loadtest.py --json capacity.json
+    python loadtest.py --baseline capacity.json   # exits 1 if capacity dropped
+    python loadtest.py --ramp cameras --rate 0.5 --camera-fps 5
+    python loadtest.py --url http://host:8000 --pid 1234   # an already running server
+    python loadtest.py --serve 8000                        # just the stub server
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from benchmark import (
+    BENCH_DIR, DEFAULT_FPS, DEFAULT_STUB_MS, REGRESSION_TOLERANCE, StubEngine, clip_path, install_engine,
+    latency_stats, make_clip,
+)
+
+# Load of the first step: uploads per second (--ramp uploads) or cameras (--ramp cameras)
+DEFAULT_START_RATE = 1.0
+DEFAULT_START_CAMERAS = 1
+# Factor the ramped load grows by per step
+DEFAULT_GROWTH = 1.5
+DEFAULT_MAX_STEPS = 12
+DEFAULT_STEP_SECONDS = 20.0
+# Seconds between configuring a step's cameras and measuring it
+DEFAULT_WARMUP_SECONDS = 3.0
+DEFAULT_SAMPLE_SECONDS = 1.0
+# Client-side limit of one upload
+DEFAULT_TIMEOUT_S = 60.0
+DEFAULT_SLO_P99_MS = 5000.0
+DEFAULT_MAX_ERROR_RATE = 0.01
+# Share of the rate uploads were sent at that a step must complete to meet the SLO
+THROUGHPUT_RATIO = 0.9
+# Share of their FPS budget the cameras must analyze to meet the SLO
+CAMERA_FPS_RATIO = 0.9
+DEFAULT_CAMERA_FPS = 2.0
+DEFAULT_CLIP = "640x360"
+DEFAULT_CLIP_SECONDS = 4.0
+DEFAULT_OBJECTS = 2
+# Stream ids of the fake cameras start with this
+CAMERA_PREFIX = "loadtest-cam"
+# Fields of the upload form, per endpoint
+_UPLOAD_FORMS = {
+    "/analyze_video": ("file", {}),
+    "/analyze": ("video_file", {"source": "file"}),
+}
+# Explanations of a 200 response that report a failed analysis
+_ERROR_EXPLANATIONS = ("Analysis error", "Service error")
+
+
+# --- server under test -----------------------------------------------------
+
+def serve_stub(port: int, host: str = "127.0.0.1", model: Optional[str] = None, stub_ms: float = DEFAULT_STUB_MS,
+               objects: int = DEFAULT_OBJECTS, batch_size: int = 8):
+    """
+    Runs the API on `port` with the stub engine (or `model`) in place of the
+    configured models, until interrupted.
+    """
+    import uvicorn
+
+    import classifyEvent
+
+    # app calls this on startup; the engine is installed here instead
+    classifyEvent.start_engine_loading = lambda: None
+    if model:
+        from vision import VisionEngine
+        engine = VisionEngine(model, batch_size=batch_size)
+    else:
+        engine = StubEngine(objects=objects, ms_per_frame=stub_ms, batch_size=batch_size)
+    install_engine(engine)
+
+    from app import app
+
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(model: Optional[str], stub_ms: float, objects: int, batch_size: int,
+                 timeout: float = 60.0) -> Tuple[subprocess.Popen, str]:
+    """
+    Starts `python loadtest.py --serve` in a child process and waits for
+    /health. Its event store and clips go to a scratch directory.
+
+    Returns:
+        The process and its base URL.
+    """
+    port = _free_port()
+    scratch = tempfile.mkdtemp(prefix="loadtest-", dir=_ensure_dir(BENCH_DIR))
+    env = dict(os.environ)
+    env.setdefault("EVENT_STORE_PATH", os.path.join(scratch, "events.db"))
+    env.setdefault("CLIP_DIR", os.path.join(scratch, "clips"))
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(port),
+               "--stub-ms", str(stub_ms), "--objects", str(objects), "--batch", str(batch_size)]
+    if model:
+        command += ["--model", model]
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(url + "/health", timeout=1.0).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not answer /health within {timeout:g}s")
+
+
+def stop_server(process: subprocess.Popen, timeout: float = 15.0):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _ensure_dir(path: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# --- measurements ----------------------------------------------------------
+
+class ProcessSampler:
+    """CPU (percent of one core, since the previous sample) and RSS of a process, from /proc."""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self._tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._last: Optional[Tuple[float, float]] = None
+
+    def _cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # The command name may contain spaces; the fields after it do not
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        # utime and stime, fields 14 and 15 of stat
+        return (int(fields[11]) + int(fields[12])) / self._tick
+
+    def _rss_mb(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024.0
+        except OSError:
+            pass
+        return None
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        if self.pid is None:
+            return {"cpu_percent": None, "rss_mb": None}
+        now, cpu = time.monotonic(), self._cpu_seconds()
+        percent = None
+        if cpu is not None and self._last is not None and now > self._last[0]:
+            percent = 100.0 * (cpu - self._last[1]) / (now - self._last[0])
+        if cpu is not None:
+            self._last = (now, cpu)
+        return {"cpu_percent": percent, "rss_mb": self._rss_mb()}
+
+
+def parse_queue_depths(text: str) -> Dict[str, float]:
+    """safesight_queue_depth per queue from a /metrics page."""
+    depths = {}
+    for line in text.splitlines():
+        if not line.startswith("safesight_queue_depth{"):
+            continue
+        labels, _, value = line.rpartition(" ")
+        queue = labels.partition('queue="')[2].partition('"')[0]
+        try:
+            depths[queue] = float(value)
+        except ValueError:
+            continue
+    return depths
+
+
+class StepStats:
+    """Outcomes of the uploads sent during one step."""
+
+    def __init__(self):
+        self.sent = 0
+        self.latencies: List[float] = []
+        self.rejected = 0  # 429: the server shed the request
+        self.errors = 0  # other failures, including 200s reporting a failed analysis
+        self.timeouts = 0
+        self.in_flight = 0
+        self.last_done = 0.0
+
+
+# --- load generation -------------------------------------------------------
+
+class LoadTest:
+    """
+    Runs the ramp against `url`.
+
+    Args:
+        url: Base URL of the server.
+        clip: Path of the clip uploaded and replayed by the cameras (the
+            cameras read it on the server, so it must exist there too).
+        pid: Server process to sample CPU and RSS of (None: not sampled).
+    """
+
+    def __init__(self, url: str, clip: str, pid: Optional[int] = None, endpoint: str = "/analyze_video",
+                 arrival: str = "poisson", timeout: float = DEFAULT_TIMEOUT_S, camera_fps: float = DEFAULT_CAMERA_FPS,
+                 step_seconds: float = DEFAULT_STEP_SECONDS, warmup_seconds: float = DEFAULT_WARMUP_SECONDS,
+                 sample_seconds: float = DEFAULT_SAMPLE_SECONDS, slo_p99_ms: float = DEFAULT_SLO_P99_MS,
+                 max_error_rate: float = DEFAULT_MAX_ERROR_RATE, seed: int = 0):
+        if endpoint not in _UPLOAD_FORMS:
+            raise ValueError(f"Unsupported endpoint {endpoint}; use one of {', '.join(_UPLOAD_FORMS)}")
+        self.url = url.rstrip("/")
+        self.clip = os.path.abspath(clip)
+        with open(clip, "rb") as f:
+            self.data = f.read()
+        self.endpoint = endpoint
+        self.arrival = arrival
+        self.timeout = timeout
+        self.camera_fps = camera_fps
+        self.step_seconds = step_seconds
+        self.warmup_seconds = warmup_seconds
+        self.sample_seconds = sample_seconds
+        self.slo_p99_ms = slo_p99_ms
+        self.max_error_rate = max_error_rate
+        self.sampler = ProcessSampler(pid)
+        self.random = random.Random(seed)
+        self.timeline: List[Dict[str, Any]] = []
+        self._cameras: List[str] = []
+        self._step: Optional[StepStats] = None
+        self._step_index = -1
+        self._started = 0.0
+
+    # -- uploads --
+
+    async def _upload(self, client: httpx.AsyncClient, stats: StepStats):
+        field, form = _UPLOAD_FORMS[self.endpoint]
+        stats.sent += 1
+        stats.in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post(self.endpoint, data=form, timeout=self.timeout,
+                                         files={field: ("clip.avi", self.data, "video/x-msvideo")})
+            if response.status_code == 429:
+                stats.rejected += 1
+            elif response.status_code != 200 or str(response.json().get("explanation", "")).startswith(
+                    _ERROR_EXPLANATIONS):
+                stats.errors += 1
+            else:
+                stats.latencies.append(time.perf_counter() - started)
+        except httpx.TimeoutException:
+            stats.timeouts += 1
+        except (httpx.HTTPError, ValueError):
+            stats.errors += 1
+        finally:
+            stats.in_flight -= 1
+            stats.last_done = time.perf_counter()
+
+    def _gaps(self, rate: float):
+        while True:
+            yield self.random.expovariate(rate) if self.arrival == "poisson" else 1.0 / rate
+
+    async def _offer(self, client: httpx.AsyncClient, rate: float, stats: StepStats) -> List[asyncio.Task]:
+        """Sends uploads at `rate` per second for one step, without waiting for them."""
+        tasks = []
+        if rate <= 0:
+            await asyncio.sleep(self.step_seconds)
+            return tasks
+        loop = asyncio.get_running_loop()
+        end = loop.time() + self.step_seconds
+        due = loop.time()
+        for gap in self._gaps(rate):
+            due += gap
+            if due >= end:
+                break
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            tasks.append(asyncio.create_task(self._upload(client, stats)))
+        await asyncio.sleep(max(0.0, end - loop.time()))
+        return tasks
+
+    # -- cameras --
+
+    async def _set_cameras(self, client: httpx.AsyncClient, count: int):
+        while len(self._cameras) < count:
+            stream_id = f"{CAMERA_PREFIX}{len(self._cameras)}"
+            response = await client.post("/streams", json={
+                "source": self.clip, "stream_id": stream_id, "loop": True, "fps": self.camera_fps,
+            })
+            if response.status_code not in (200, 201):
+                raise RuntimeError(f"Could not start camera {stream_id}: HTTP {response.status_code} {response.text}")
+            self._cameras.append(stream_id)
+        while len(self._cameras) > count:
+            await client.delete(f"/streams/{self._cameras.pop()}")
+
+    async def _camera_counters(self, client: httpx.AsyncClient) -> Dict[str, Dict[str, Any]]:
+        if not self._cameras:
+            return {}
+        response = await client.get("/streams")
+        return {stream["id"]: stream for stream in response.json() if stream["id"] in self._cameras}
+
+    # -- sampling --
+
+    async def _sample_forever(self, client: httpx.AsyncClient):
+        while True:
+            row = {"t": round(time.monotonic() - self._started, 3), "step": self._step_index}
+            row.update(self.sampler.sample())
+            try:
+                row["queues"] = parse_queue_depths((await client.get("/metrics", timeout=5.0)).text)
+            except httpx.HTTPError:
+                row["queues"] = None
+            row["in_flight"] = self._step.in_flight if self._step is not None else 0
+            row["cameras"] = len(self._cameras)
+            self.timeline.append(row)
+            await asyncio.sleep(self.sample_seconds)
+
+    # -- steps --
+
+    async def _run_step(self, client: httpx.AsyncClient, rate: float, cameras: int) -> Dict[str, Any]:
+        await self._set_cameras(client, cameras)
+        if cameras:
+            await asyncio.sleep(self.warmup_seconds)
+        stats = self._step = StepStats()
+        self._step_index += 1
+        first_sample = len(self.timeline)
+        before = await self._camera_counters(client)
+        started = time.perf_counter()
+        tasks = await self._offer(client, rate, stats)
+        elapsed = time.perf_counter() - started
+        after = await self._camera_counters(client)
+        # Requests still running finish (or time out) before the next step
+        if tasks:
+            await asyncio.gather(*tasks)
+        duration = max(elapsed, stats.last_done - started)
+        row = self._summarize(rate, cameras, stats, duration, elapsed, before, after)
+        row.update(self._resources(self.timeline[first_sample:]))
+        row["slo_met"], row["violations"] = self._check(row)
+        return row
+
+    def _summarize(self, rate: float, cameras: int, stats: StepStats, duration: float, elapsed: float,
+                   before: Dict[str, Dict[str, Any]], after: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        failed = stats.errors + stats.timeouts + stats.rejected
+        row: Dict[str, Any] = {
+            "step": self._step_index,
+            "offered_rps": rate,
+            # What the arrival process actually produced, which the server is measured against
+            "sent_rps": stats.sent / elapsed if elapsed else 0.0,
+            "cameras": cameras,
+            "duration_s": duration,
+            "sent": stats.sent,
+            "ok": len(stats.latencies),
+            "errors": stats.errors,
+            "timeouts": stats.timeouts,
+            "rejected": stats.rejected,
+            "throughput_rps": len(stats.latencies) / duration if duration else 0.0,
+            "error_rate": failed / stats.sent if stats.sent else 0.0,
+            "timeout_rate": stats.timeouts / stats.sent if stats.sent else 0.0,
+        }
+        row.update(latency_stats(stats.latencies))
+        if cameras:
+            analyzed = shed = 0
+            rates = []
+            for stream_id, end in after.items():
+                start = before.get(stream_id, {})
+                frames = end["frames_analyzed"] - start.get("frames_analyzed", 0)
+                analyzed += frames
+                shed += end["frames_shed"] - start.get("frames_shed", 0)
+                rates.append(frames / elapsed)
+            row["camera_frames_analyzed"] = analyzed
+            row["camera_frames_shed"] = shed
+            row["camera_fps_mean"] = sum(rates) / len(rates) if rates else 0.0
+            row["camera_fps_min"] = min(rates) if rates else 0.0
+            row["camera_fps_ratio"] = row["camera_fps_mean"] / self.camera_fps
+            row["camera_errors"] = sum(1 for stream in after.values() if stream["status"] == "error")
+        return row
+
+    @staticmethod
+    def _resources(samples: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        cpu = [sample["cpu_percent"] for sample in samples if sample.get("cpu_percent") is not None]
+        rss = [sample["rss_mb"] for sample in samples if sample.get("rss_mb") is not None]
+        queues: Dict[str, float] = {}
+        for sample in samples:
+            for queue, depth in (sample.get("queues") or {}).items():
+                queues[queue] = max(queues.get(queue, 0.0), depth)
+        return {
+            "cpu_percent_mean": sum(cpu) / len(cpu) if cpu else None,
+            "cpu_percent_max": max(cpu) if cpu else None,
+            "rss_mb_max": max(rss) if rss else None,
+            "queue_depth_max": queues,
+        }
+
+    def _check(self, row: Dict[str, Any]) -> Tuple[bool, List[str]]:
+        violations = []
+        if row.get("p99_ms", 0.0) > self.slo_p99_ms:
+            violations.append(f"p99 {row['p99_ms']:.0f} ms > {self.slo_p99_ms:.0f} ms")
+        if row["sent"] and row["error_rate"] > self.max_error_rate:
+            violations.append(f"error rate {row['error_rate']:.1%} > {self.max_error_rate:.1%}")
+        if row["sent"] and row["throughput_rps"] < THROUGHPUT_RATIO * row["sent_rps"]:
+            violations.append(f"throughput {row['throughput_rps']:.2f}/s < {THROUGHPUT_RATIO:.0%} of "
+                              f"{row['sent_rps']:.2f}/s sent")
+        if row["cameras"] and row["camera_fps_ratio"] < CAMERA_FPS_RATIO:
+            violations.append(f"cameras at {row['camera_fps_ratio']:.0%} of their FPS budget")
+        if row["cameras"] and row["camera_errors"]:
+            violations.append(f"{row['camera_errors']} camera(s) failed")
+        return not violations, violations
+
+    async def ramp(self, loads: Sequence[Tuple[float, int]]) -> List[Dict[str, Any]]:
+        """
+        Runs one step per (upload rate, cameras) pair until one breaks the SLO.
+
+        Returns:
+            A row per step run, the breaking one last.
+        """
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+        steps = []
+        async with httpx.AsyncClient(base_url=self.url, limits=limits, timeout=self.timeout) as client:
+            self._started = time.monotonic()
+            sampler = asyncio.create_task(self._sample_forever(client))
+            try:
+                for rate, cameras in loads:
+                    row = await self._run_step(client, rate, cameras)
+                    steps.append(row)
+                    _print_step(row)
+                    if not row["slo_met"]:
+                        break
+            finally:
+                sampler.cancel()
+                await self._set_cameras(client, 0)
+        return steps
+
+
+def ramp_loads(ramp: str, start: float, growth: float, steps: int, rate: float,
+               cameras: int) -> List[Tuple[float, int]]:
+    """(upload rate, cameras) of each step of a ramp."""
+    loads = []
+    value = start
+    for _ in range(steps):
+        if ramp == "uploads":
+            loads.append((round(value, 3), cameras))
+        else:
+            count = int(round(value))
+            if loads and count <= loads[-1][1]:
+                count = loads[-1][1] + 1
+            loads.append((rate, count))
+            value = count
+        value *= growth
+    return loads
+
+
+def saturation(steps: Sequence[Dict[str, Any]], ramp: str) -> Dict[str, Any]:
+    """The last step that met the SLO, and why the next one did not."""
+    passed = [row for row in steps if row["slo_met"]]
+    broken = next((row for row in steps if not row["slo_met"]), None)
+    # Upload rates are the ones actually sent, not the nominal step rate:
+    # random arrivals over a short step rarely hit it exactly
+    key = "sent_rps" if ramp == "uploads" else "cameras"
+
+    def value(row):
+        return round(row[key], 2) if ramp == "uploads" else row[key]
+
+    return {
+        "ramp": ramp,
+        # None when even the first step broke the SLO
+        "max_sustained": value(passed[-1]) if passed else None,
+        "max_sustained_offered_rps": passed[-1]["offered_rps"] if passed else None,
+        "max_sustained_throughput_rps": passed[-1]["throughput_rps"] if passed else None,
+        # False when the ramp ended before the SLO broke: capacity is at least max_sustained
+        "reached": broken is not None,
+        "broken_at": value(broken) if broken else None,
+        "violations": broken["violations"] if broken else [],
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any],
+            tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Lists regressions of the saturation point, and of the latency and
+    resources of steps at the same load, beyond `tolerance` (relative).
+    """
+    regressions = []
+    current, base = results["saturation"], baseline.get("saturation", {})
+    if (base.get("ramp") == current["ramp"] and base.get("max_sustained")
+            and (current["max_sustained"] or 0) < base["max_sustained"] * (1 - tolerance)):
+        regressions.append(f"max sustained {current['ramp']}: {base['max_sustained']} -> {current['max_sustained']}")
+
+    def key(row):
+        return row["offered_rps"], row["cameras"]
+
+    reference = {key(row): row for row in baseline.get("steps", [])}
+    for row in results["steps"]:
+        old = reference.get(key(row))
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p99_ms", "rss_mb_max", "cpu_percent_mean"):
+            if row.get(metric) is None or not old.get(metric):
+                continue
+            change = (row[metric] - old[metric]) / old[metric]
+            if change > tolerance:
+                regressions.append(f"{row['offered_rps']}/s x {row['cameras']} cameras {metric}: "
+                                   f"{old[metric]:.1f} -> {row[metric]:.1f} ({change:+.0%})")
+    return regressions
+
+
+def _fmt(value: Optional[float], width: int, spec: str = ".1f") -> str:
+    return f"{value:>{width}{spec}}" if value is not None else f"{'-':>{width}}"
+
+
+def _print_step(row: Dict[str, Any]):
+    if row["step"] == 0:
+        print(f"{'step':>4} {'req/s':>7} {'sent/s':>7} {'cams':>5} {'done/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'fail':>6} "
+              f"{'cam fps':>8} {'cpu %':>6} {'rss MiB':>8}  slo")
+    print(f"{row['step']:>4} {row['offered_rps']:>7.2f} {row['sent_rps']:>7.2f} {row['cameras']:>5} {row['throughput_rps']:>7.2f} "
+          f"{_fmt(row.get('p50_ms'), 8)} {_fmt(row.get('p99_ms'), 8)} {row['error_rate']:>6.1%} "
+          f"{_fmt(row.get('camera_fps_mean'), 8, '.2f')} {_fmt(row['cpu_percent_mean'], 6)} "
+          f"{_fmt(row['rss_mb_max'], 8)}  {'ok' if row['slo_met'] else '; '.join(row['violations'])}", flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ramp uploads or fake cameras until the API breaks its SLO.")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="only run the stub server on PORT")
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="process of the --url server to sample CPU and RSS of")
+    parser.add_argument("--model", help="real weights for the started server instead of the stub engine")
+    parser.add_argument("--stub-ms", type=float, default=DEFAULT_STUB_MS, help="stub forward pass per frame")
+    parser.add_argument("--objects", type=int, default=DEFAULT_OBJECTS, help="objects per clip and stub frame")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--clip", default=DEFAULT_CLIP, help="WIDTHxHEIGHT of the synthetic clip, or a video file")
+    parser.add_argument("--clip-seconds", type=float, default=DEFAULT_CLIP_SECONDS)
+    parser.add_argument("--endpoint", choices=sorted(_UPLOAD_FORMS), default="/analyze_video")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--ramp", choices=("uploads", "cameras"), default="uploads")
+    parser.add_argument("--start", type=float, help="first step's uploads/s or cameras (default: "
+                        f"{DEFAULT_START_RATE:g} or {DEFAULT_START_CAMERAS})")
+    parser.add_argument("--growth", type=float, default=DEFAULT_GROWTH, help="load factor per step")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS)
+    parser.add_argument("--rate", type=float, default=0.0, help="fixed uploads/s while ramping cameras")
+    parser.add_argument("--cameras", type=int, default=0, help="fixed cameras while ramping uploads")
+    parser.add_argument("--camera-fps", type=float, default=DEFAULT_CAMERA_FPS, help="FPS budget of each camera")
+    parser.add_argument("--step-seconds", type=float, default=DEFAULT_STEP_SECONDS)
+    parser.add_argument("--warmup-seconds", type=float, default=DEFAULT_WARMUP_SECONDS)
+    parser.add_argument("--sample-seconds", type=float, default=DEFAULT_SAMPLE_SECONDS)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S, help="client timeout per upload")
+    parser.add_argument("--slo-p99-ms", type=float, default=DEFAULT_SLO_P99_MS)
+    parser.add_argument("--max-error-rate", type=float, default=DEFAULT_MAX_ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve_stub(args.serve, model=args.model, stub_ms=args.stub_ms, objects=args.objects, batch_size=args.batch)
+        return 0
+
+    if os.path.isfile(args.clip):
+        clip = args.clip
+    else:
+        width, _, height = args.clip.lower().partition("x")
+        clip = make_clip(clip_path(int(width), int(height), args.clip_seconds, DEFAULT_FPS, args.objects),
+                         int(width), int(height), args.clip_seconds, DEFAULT_FPS, args.objects)
+
+    start = args.start if args.start is not None else (
+        DEFAULT_START_RATE if args.ramp == "uploads" else DEFAULT_START_CAMERAS)
+    loads = ramp_loads(args.ramp, start, args.growth, args.max_steps, args.rate, args.cameras)
+
+    process, url, pid = None, args.url, args.pid
+    if url is None:
+        process, url = start_server(args.model, args.stub_ms, args.objects, args.batch)
+        pid = process.pid
+    try:
+        test = LoadTest(url, clip, pid=pid, endpoint=args.endpoint, arrival=args.arrival, timeout=args.timeout,
+                        camera_fps=args.camera_fps, step_seconds=args.step_seconds,
+                        warmup_seconds=args.warmup_seconds, sample_seconds=args.sample_seconds,
+                        slo_p99_ms=args.slo_p99_ms, max_error_rate=args.max_error_rate, seed=args.seed)
+        steps = asyncio.run(test.ramp(loads))
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    results = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "url": args.url,
+            "engine": args.model or f"stub {args.stub_ms:g} ms/frame",
+            "clip": os.path.basename(clip),
+            "endpoint": args.endpoint,
+            "arrival": args.arrival,
+            "camera_fps": args.camera_fps,
+            "step_seconds": args.step_seconds,
+            "slo": {"p99_ms": args.slo_p99_ms, "max_error_rate": args.max_error_rate,
+                    "throughput_ratio": THROUGHPUT_RATIO, "camera_fps_ratio": CAMERA_FPS_RATIO},
+        },
+        "saturation": saturation(steps, args.ramp),
+        "steps": steps,
+        "timeline": test.timeline,
+    }
+    point = results["saturation"]
+    unit = "uploads/s" if args.ramp == "uploads" else "cameras"
+    if point["reached"]:
+        print(f"Saturation: {point['max_sustained']} {unit} sustained, SLO broken at {point['broken_at']} "
+              f"({'; '.join(point['violations'])})")
+    else:
+        print(f"SLO held for the whole ramp: at least {point['max_sustained']} {unit}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+# backend/metrics.py
+"""
+Process metrics in the Prometheus text format, served at /metrics.
+
+A small self-contained registry (counters, gauges read at scrape time and
+histograms, all with labels) so no client library is needed. The metrics
+the pipeline records are defined at the bottom of this module; each one is
+updated by the component that owns the numbers:
+
+- pipeline.py: per-stage time (open, decode, inference) and stage errors
+- batcher.py: model batch latency and size, detections per class
+- classifyEvent.py: per-analysis stage times, frames per kind, events,
+  analysis errors
+- streams.py: the same for live streams
+- app.py: request latency and status, upload and queue times, queue depths
+- serialization.py: response sizes per format
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time (queue depths and the like)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._callbacks: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set_function(self, function: Callable[[], float], **labels: object):
+        with self._lock:
+            self._callbacks[self._key(labels)] = function
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            callbacks = sorted(self._callbacks.items())
+        for key, function in callbacks:
+            try:
+                value = float(function())
+            except Exception:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count in each bucket (non-cumulative, +Inf last), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: object) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+# Content type of Registry.render() output
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "safesight_http_requests_total", "HTTP requests by route and status code.", ("route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "safesight_http_request_seconds", "HTTP request latency by route.", ("route",))
+STAGE_SECONDS = REGISTRY.histogram(
+    "safesight_stage_seconds",
+    "Time spent per analysis in each stage (open, decode, inference, reasoning, upload, queue, serialize).",
+    ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "safesight_stage_errors_total", "Errors by the stage they were raised in.", ("stage",))
+FRAMES = REGISTRY.counter(
+    "safesight_frames_total", "Frames by what happened to them (decoded, detected, tracked, skipped, shed).",
+    ("source", "kind"))
+DETECTIONS = REGISTRY.counter(
+    "safesight_detections_total", "Detections returned by the models, per class.", ("label",))
+EVENTS = REGISTRY.counter(
+    "safesight_events_total", "Events reported, per type.", ("type",))
+MODEL_LATENCY = REGISTRY.histogram(
+    "safesight_model_batch_seconds", "Latency of one batched model call.", ("model",))
+MODEL_BATCH_SIZE = REGISTRY.histogram(
+    "safesight_model_batch_frames", "Frames per batched model call.", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "safesight_queue_depth", "Items waiting in each queue.", ("queue",))
+STREAM_LOAD = REGISTRY.gauge(
+    "safesight_stream_load", "Share of the engine's time the live streams' current sampling rates need.")
+RESPONSE_BYTES = REGISTRY.histogram(
+    "safesight_response_bytes", "Size of encoded analysis responses, per media type and content encoding.",
+    ("format", "encoding"), buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
@@ -0,0 +1,101 @@
+# backend/motion.py
+"""
+Motion gate in front of the model.
+
+Most camera footage is a static scene. Each frame is shrunk to a small
+blurred grayscale thumbnail and compared with the thumbnail of the last
+frame that was analyzed; when too few pixels changed, the previous
+detections are reused instead of running the model again. Comparing against
+the last analyzed frame (rather than the previous one) means slow changes
+still add up and open the gate, and a forced refresh bounds how long the
+same detections can be reused.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+# Gate uploaded clips and new streams by default (streams can override it)
+MOTION_GATE = os.getenv("MOTION_GATE", "0") == "1"
+# Fraction of thumbnail pixels that must change for a frame to be analyzed
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.005"))
+# Frames that may reuse detections in a row before one is analyzed anyway
+MOTION_REFRESH_FRAMES = int(os.getenv("MOTION_REFRESH_FRAMES", "10"))
+# Gray-level difference for a thumbnail pixel to count as changed
+MOTION_PIXEL_DELTA = 25
+# Width of the comparison thumbnail
+MOTION_THUMBNAIL_WIDTH = 160
+
+
+class MotionGate:
+    """
+    Decides, frame by frame, whether a stream's frame needs the model.
+
+    Args:
+        threshold: Changed-pixel fraction that opens the gate.
+        refresh_frames: Most consecutive frames the gate keeps closed.
+        pixel_delta: Gray-level change counted as a changed pixel.
+        width: Thumbnail width the comparison runs at.
+    """
+
+    def __init__(
+        self,
+        threshold: float = MOTION_THRESHOLD,
+        refresh_frames: int = MOTION_REFRESH_FRAMES,
+        pixel_delta: int = MOTION_PIXEL_DELTA,
+        width: int = MOTION_THUMBNAIL_WIDTH,
+    ):
+        self.threshold = threshold
+        self.refresh_frames = max(0, refresh_frames)
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        # Changed-pixel fraction of the most recent comparison
+        self.last_change = 0.0
+        self._reference = None
+        self._closed_in_row = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        """Fraction of the frames seen that reused earlier detections."""
+        return self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        # A strided view first, so the resize never touches every pixel
+        step = max(1, frame.shape[1] // (2 * self.width))
+        small = frame[::step, ::step]
+        height = max(1, round(small.shape[0] * self.width / small.shape[1]))
+        small = cv2.resize(small, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def reset(self):
+        """Forgets the reference frame, so the next frame goes through the model."""
+        self._reference = None
+        self._closed_in_row = 0
+
+    def check(self, frame: np.ndarray) -> bool:
+        """
+        Returns True when `frame` should go through the model, False when
+        the previous detections can be reused.
+        """
+        self.frames_seen += 1
+        thumbnail = self._thumbnail(frame)
+        if (self._reference is None or thumbnail.shape != self._reference.shape
+                or self._closed_in_row >= self.refresh_frames):
+            moving = True
+        else:
+            diff = cv2.absdiff(thumbnail, self._reference)
+            self.last_change = np.count_nonzero(diff > self.pixel_delta) / diff.size
+            moving = self.last_change >= self.threshold
+
+        if moving:
+            self._reference = thumbnail
+            self._closed_in_row = 0
+        else:
+            self._closed_in_row += 1
+            self.frames_skipped += 1
+        return moving
@@ -0,0 +1,402 @@
+# backend/pipeline.py
+"""
+Streaming decode -> inference -> reasoning pipeline for uploaded clips.
+
+Frames are sampled while the clip is decoded and handed between stages
+through bounded queues, so only a handful of frames are ever alive at once
+no matter how long the clip is.
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from metrics import STAGE_ERRORS
+from motion import MotionGate
+from preprocess import INPUT_SIZE
+from tiling import TILED_INFERENCE
+from tracker import Tracker
+
+try:  # PyAV is optional: it is only needed for true keyframe-only decoding
+    import av
+except ImportError:  # pragma: no cover - depends on the deployment
+    av = None
+
+# Default sampling, overridable per deployment through the environment
+DEFAULT_SAMPLE_MODE = os.getenv("SAMPLE_MODE", "fps")  # "every_n", "fps" or "keyframes"
+DEFAULT_SAMPLE_EVERY_N = int(os.getenv("SAMPLE_EVERY_N", "15"))
+DEFAULT_SAMPLE_FPS = float(os.getenv("SAMPLE_FPS", "2.0"))
+# Sampled frames are shrunk to this longest side while decoding (0 keeps the
+# source resolution); detections are still reported in source pixels. By
+# default that is the model's input size, which the letterbox would shrink
+# them to anyway; tiled inference needs the full resolution and keeps it
+DEFAULT_DECODE_MAX_SIDE = int(os.getenv("DECODE_MAX_SIDE", "0" if TILED_INFERENCE else str(INPUT_SIZE)))
+# How many frames may wait between two stages before the producer blocks
+DEFAULT_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+# Used when a container does not report its frame rate
+FALLBACK_FPS = 30.0
+
+_SENTINEL = object()
+# What the inference stage does with a sampled frame
+_DETECT, _TRACK, _REUSE = "detect", "track", "reuse"
+
+
+def shrink_size(width: int, height: int, max_side: int) -> Optional[Tuple[int, int]]:
+    """(width, height) with the longest side at `max_side`, or None when the frame fits (or `max_side` is 0)."""
+    longest = max(width, height)
+    if max_side <= 0 or longest <= max_side:
+        return None
+    scale = max_side / longest
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+@dataclass
+class SamplingConfig:
+    """
+    Describes which frames of a clip get analyzed.
+
+    mode:
+        "every_n"   - every `every_n`-th decoded frame
+        "fps"       - roughly `target_fps` frames per second of video
+        "keyframes" - only the encoder's keyframes (needs PyAV; otherwise
+                      falls back to one frame per second)
+
+    max_side:
+        Longest side of the frames handed to inference; larger sources are
+        shrunk while decoding (0 keeps the source resolution).
+    """
+    mode: str = DEFAULT_SAMPLE_MODE
+    every_n: int = DEFAULT_SAMPLE_EVERY_N
+    target_fps: float = DEFAULT_SAMPLE_FPS
+    max_side: int = DEFAULT_DECODE_MAX_SIDE
+
+    def decode_size(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """(width, height) to decode a source frame at, or None to keep its size."""
+        return shrink_size(width, height, self.max_side)
+
+    def stride(self, source_fps: float) -> int:
+        """Number of decoded frames between two samples for the cv2 decoder."""
+        if self.mode == "every_n":
+            return max(1, int(self.every_n))
+        if self.mode == "fps":
+            return max(1, int(round(source_fps / max(self.target_fps, 1e-6))))
+        # "keyframes" without PyAV: one frame per second of video
+        return max(1, int(round(source_fps)))
+
+
+@dataclass
+class PipelineStats:
+    """Progress counters, each updated by the stage that owns it."""
+    frames_decoded: int = 0
+    frames_sampled: int = 0
+    frames_analyzed: int = 0
+    frames_tracked: int = 0  # analyzed from tracker predictions, without the model
+    frames_skipped: int = 0  # static frames that reused the previous detections
+    # Wall time spent opening the clip, decoding sampled frames, in model
+    # calls and (timed by the consumer) turning detections into events
+    open_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    inference_seconds: float = 0.0
+    reasoning_seconds: float = 0.0
+
+    @property
+    def skip_ratio(self) -> float:
+        """Fraction of the analyzed frames the motion gate skipped."""
+        return self.frames_skipped / self.frames_analyzed if self.frames_analyzed else 0.0
+
+
+@dataclass
+class FrameSample:
+    """A decoded frame together with its position in the clip."""
+    index: int
+    timestamp: float
+    frame: Optional[np.ndarray]
+    # Source pixels per frame pixel, > 1 when the frame was shrunk while decoding
+    scale: float = 1.0
+
+
+VideoSource = Union[str, io.BufferedIOBase]
+
+
+def _open_capture(source: VideoSource) -> cv2.VideoCapture:
+    if isinstance(source, str):
+        return cv2.VideoCapture(source)
+    # In-memory / still-uploading stream (OpenCV >= 4.10)
+    return cv2.VideoCapture(source, cv2.CAP_FFMPEG, [])
+
+
+def _iter_cv2_frames(source: VideoSource, config: SamplingConfig, stats: PipelineStats) -> Iterator[FrameSample]:
+    started = time.perf_counter()
+    cap = _open_capture(source)
+    stats.open_seconds += time.perf_counter() - started
+    if not cap.isOpened():
+        raise ValueError("Could not open video file")
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or FALLBACK_FPS
+        stride = config.stride(fps)
+        source_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        size = config.decode_size(*source_size) if all(source_size) else None
+        scale = source_size[0] / size[0] if size is not None else 1.0
+        # Full-size frames that get shrunk right away are decoded into one
+        # reused buffer; only the small copy travels down the pipeline
+        scratch: Optional[np.ndarray] = None
+        index = 0
+        # grab() only demuxes/decodes; retrieve() does the (costly) colour
+        # conversion, so skipped frames never get turned into arrays.
+        while cap.grab():
+            stats.frames_decoded += 1
+            if index % stride == 0:
+                ret, frame = cap.retrieve(scratch) if size is not None else cap.retrieve()
+                if ret and frame is not None:
+                    if size is not None:
+                        scratch = frame
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    yield FrameSample(index=index, timestamp=index / fps, frame=frame, scale=scale)
+            index += 1
+    finally:
+        cap.release()
+
+
+def _iter_keyframes(source: VideoSource, config: SamplingConfig, stats: PipelineStats) -> Iterator[FrameSample]:
+    started = time.perf_counter()
+    container = av.open(source)
+    stats.open_seconds += time.perf_counter() - started
+    try:
+        stream = container.streams.video[0]
+        # Let the decoder drop every non-key frame before it is decoded
+        stream.codec_context.skip_frame = "NONKEY"
+        fps = float(stream.average_rate or FALLBACK_FPS)
+        width, height = stream.codec_context.width, stream.codec_context.height
+        size = config.decode_size(width, height) if width and height else None
+        # swscale shrinks the frame during the colour conversion it does anyway
+        resize = {"width": size[0], "height": size[1]} if size is not None else {}
+        for frame in container.decode(stream):
+            stats.frames_decoded += 1
+            if frame.pts is not None and stream.time_base is not None:
+                timestamp = float(frame.pts * stream.time_base)
+            else:
+                timestamp = float(frame.time or 0.0)
+            yield FrameSample(
+                index=int(round(timestamp * fps)),
+                timestamp=timestamp,
+                frame=frame.to_ndarray(format="bgr24", **resize),
+                scale=width / size[0] if size is not None else 1.0,
+            )
+    finally:
+        container.close()
+
+
+def iter_frames(
+    source: VideoSource,
+    config: Optional[SamplingConfig] = None,
+    stats: Optional[PipelineStats] = None,
+) -> Iterator[FrameSample]:
+    """
+    Decodes a clip and yields only the frames selected by `config`.
+
+    Args:
+        source: A path, or a seekable binary stream such as an UploadReader.
+        config: Sampling strategy. Defaults to the environment configuration.
+        stats: Counters to update with the number of decoded frames.
+
+    Yields:
+        FrameSample objects in presentation order.
+    """
+    config = config or SamplingConfig()
+    stats = stats if stats is not None else PipelineStats()
+    if config.mode == "keyframes" and av is not None:
+        return _iter_keyframes(source, config, stats)
+    return _iter_cv2_frames(source, config, stats)
+
+
+def _put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is being torn down."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _decode_stage(frames: Iterator[FrameSample], out_q: "queue.Queue", stop: threading.Event, stats: PipelineStats):
+    try:
+        while True:
+            # Only the decoder's own time; waiting on a full queue is not decoding
+            started = time.perf_counter()
+            sample = next(frames, None)
+            stats.decode_seconds += time.perf_counter() - started
+            if sample is None:
+                break
+            stats.frames_sampled += 1
+            if not _put(out_q, sample, stop):
+                return
+    except Exception as e:
+        STAGE_ERRORS.inc(stage="decode")
+        _put(out_q, e, stop)
+        return
+    _put(out_q, _SENTINEL, stop)
+
+
+def _inference_stage(
+    infer: Callable[[List[np.ndarray]], List[Detections]],
+    batch_size: int,
+    in_q: "queue.Queue",
+    out_q: "queue.Queue",
+    stop: threading.Event,
+    tracker: Optional[Tracker] = None,
+    detect_every: int = 1,
+    stats: Optional[PipelineStats] = None,
+    motion_gate: Optional[MotionGate] = None,
+):
+    detect_every = max(1, detect_every) if tracker is not None else 1
+    stats = stats if stats is not None else PipelineStats()
+    position = 0
+    previous: Optional[Detections] = None
+    while not stop.is_set():
+        try:
+            item = in_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        # Whatever the decoder has already produced joins the same batch
+        batch: List[FrameSample] = []
+        while isinstance(item, FrameSample):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                item = None
+                break
+            try:
+                item = in_q.get_nowait()
+            except queue.Empty:
+                item = None
+
+        if batch:
+            # Static frames reuse the previous detections; of the others only
+            # every `detect_every`-th goes through the model and the tracker
+            # fills in the ones in between
+            plans = []
+            for sample in batch:
+                if motion_gate is not None and not motion_gate.check(sample.frame):
+                    plans.append(_REUSE)
+                else:
+                    plans.append(_DETECT if position % detect_every == 0 else _TRACK)
+                    position += 1
+            frames = [sample.frame for sample, plan in zip(batch, plans) if plan is _DETECT]
+            started = time.perf_counter()
+            try:
+                inferred = iter(infer(frames) if frames else [])
+            except Exception as e:
+                STAGE_ERRORS.inc(stage="inference")
+                _put(out_q, e, stop)
+                return
+            stats.inference_seconds += time.perf_counter() - started
+            for sample, plan in zip(batch, plans):
+                # Drop the pixels as soon as inference is done with them
+                sample.frame = None
+                if plan is _REUSE:
+                    frame_detections = previous
+                    stats.frames_skipped += 1
+                elif plan is _TRACK:
+                    frame_detections = tracker.predict()
+                    stats.frames_tracked += 1
+                else:
+                    frame_detections = next(inferred)
+                    if sample.scale != 1.0:
+                        # Back to source pixels, so tracks and events never
+                        # depend on the decode resolution
+                        frame_detections = frame_detections.rescale(sample.scale)
+                    if tracker is not None:
+                        frame_detections = tracker.update(frame_detections)
+                previous = frame_detections
+                if not _put(out_q, (sample, frame_detections), stop):
+                    return
+
+        if item is not None:
+            # End of clip or a decoder error
+            _put(out_q, item, stop)
+            return
+
+
+def stream_detections(
+    source: VideoSource,
+    infer: Callable[[List[np.ndarray]], List[Detections]],
+    config: Optional[SamplingConfig] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    batch_size: int = 1,
+    stats: Optional[PipelineStats] = None,
+    tracker: Optional[Tracker] = None,
+    detect_every: int = 1,
+    motion_gate: Optional[MotionGate] = None,
+) -> Iterator[Tuple[FrameSample, Detections]]:
+    """
+    Runs decoding and inference on background threads and yields
+    per-timestamp detections to the caller, which does the event reasoning.
+
+    The three stages overlap and are connected by queues of at most
+    `queue_size` items, so memory stays flat for arbitrarily long clips.
+
+    Args:
+        source: The clip to analyze, as a path or a seekable binary stream.
+        infer: Function mapping a list of BGR frames to one Detections
+            per frame (e.g. VisionEngine.analyze_frames).
+        config: Frame sampling strategy.
+        queue_size: Capacity of each inter-stage queue.
+        batch_size: Most frames handed to `infer` at once. Frames are only
+            batched when the decoder is ahead of inference.
+        stats: Progress counters to keep up to date while the clip runs.
+        tracker: When given, detections get stable track ids, and frames the
+            model skips are answered with the tracker's predictions.
+        detect_every: With a tracker, run the model on every n-th sampled
+            frame only.
+        motion_gate: When given, frames it finds static reuse the previous
+            frame's detections instead of being analyzed.
+
+    Yields:
+        (FrameSample, detections) pairs in presentation order. The sample's
+        `frame` has already been released.
+    """
+    stats = stats if stats is not None else PipelineStats()
+    stop = threading.Event()
+    decoded_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    results_q: "queue.Queue" = queue.Queue(maxsize=queue_size)
+
+    workers = [
+        threading.Thread(
+            target=_decode_stage, args=(iter_frames(source, config, stats), decoded_q, stop, stats),
+            name="pipeline-decode", daemon=True,
+        ),
+        threading.Thread(
+            target=_inference_stage,
+            args=(infer, batch_size, decoded_q, results_q, stop, tracker, detect_every, stats, motion_gate),
+            name="pipeline-infer", daemon=True,
+        ),
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            item = results_q.get()
+            if item is _SENTINEL:
+                return
+            if isinstance(item, Exception):
+                raise item
+            stats.frames_analyzed += 1
+            yield item
+    finally:
+        # Also reached when the consumer stops iterating early
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5.0)
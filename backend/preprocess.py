@@ -0,0 +1,176 @@
+# backend/preprocess.py
+"""
+Model input preparation into reused buffers.
+
+Handed a list of BGR frames, ultralytics letterboxes each one into a new
+array, stacks them into another and converts that into a new tensor, on
+every call. Letterboxer does the same work into one input tensor that is
+allocated once per engine (pinned when a GPU is present, so the host to
+device copy can use DMA) and only viewed at the shape each batch needs.
+Frames are resized straight into that tensor's memory, and the detections
+are mapped back to the original frame afterwards.
+
+The letterbox geometry matches ultralytics' own (minimum rectangle padded
+to the stride, centered, gray 114 border), so results are the same as with
+plain frames.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from detections import Detections
+
+if TYPE_CHECKING:
+    import torch
+
+# Feed the models pre-letterboxed tensors from reused buffers
+PREPROCESS_BUFFERS = os.getenv("PREPROCESS_BUFFERS", "1") == "1"
+# Model input size (longest side)
+INPUT_SIZE = 640
+# Letterboxed sides are padded to a multiple of the model stride
+INPUT_STRIDE = 32
+# Gray level of the letterbox border, as in ultralytics
+PAD_VALUE = 114
+
+
+@dataclass
+class LetterboxGeometry:
+    """Where a frame ended up inside its letterboxed input."""
+    scale: float
+    left: int
+    top: int
+    image_size: Tuple[int, int]  # (height, width) of the original frame
+    input_size: Tuple[int, int]  # (height, width) of the letterboxed input
+
+
+def letterbox_geometry(shape: Tuple[int, int], size: int = INPUT_SIZE, stride: int = INPUT_STRIDE,
+                       rect: bool = True) -> Tuple[Tuple[int, int], Tuple[int, int], LetterboxGeometry]:
+    """
+    Geometry of letterboxing a (height, width) frame into a `size` input.
+
+    Returns:
+        The resized (width, height), the padded input (height, width) and
+        the frame's LetterboxGeometry.
+    """
+    height, width = shape
+    scale = min(size / height, size / width)
+    new_w, new_h = round(width * scale), round(height * scale)
+    pad_w, pad_h = size - new_w, size - new_h
+    if rect:
+        pad_w, pad_h = pad_w % stride, pad_h % stride
+    left, top = round(pad_w / 2 - 0.1), round(pad_h / 2 - 0.1)
+    input_size = (new_h + pad_h, new_w + pad_w)
+    return (new_w, new_h), input_size, LetterboxGeometry(scale, left, top, (height, width), input_size)
+
+
+class Letterboxer:
+    """
+    Prepares batches of BGR frames as one normalized RGB NCHW float tensor
+    in memory allocated once.
+
+    Not meant to be shared between threads running at the same time: the
+    tensor returned by `prepare` is overwritten by the next call. Each
+    VisionEngine owns one, and a MicroBatcher runs it from one thread.
+
+    Args:
+        batch_size: Most frames per call.
+        size: Model input size.
+        stride: Model stride the padded sides are rounded to.
+    """
+
+    def __init__(self, batch_size: int, size: int = INPUT_SIZE, stride: int = INPUT_STRIDE):
+        self.batch_size = max(1, batch_size)
+        self.size = size
+        self.stride = stride
+        self._lock = threading.Lock()
+        self._storage: Optional["torch.Tensor"] = None
+        self._storage_np: Optional[np.ndarray] = None
+        # Resize targets, one per slot, reallocated only when the frame size changes
+        self._resized: List[Optional[np.ndarray]] = [None] * self.batch_size
+
+    def _allocate(self):
+        # torch is already loaded by the model by the time frames arrive
+        import torch
+
+        elements = self.batch_size * 3 * self.size * self.size
+        self._storage = torch.empty(elements, dtype=torch.float32, pin_memory=torch.cuda.is_available())
+        self._storage_np = self._storage.numpy()
+
+    def prepare(self, frames: Sequence[np.ndarray]) -> Tuple["torch.Tensor", List[LetterboxGeometry]]:
+        """
+        Letterboxes `frames` (at most `batch_size`) into the reused input.
+
+        Returns:
+            A (N, 3, H, W) view of the input tensor and each frame's geometry.
+        """
+        if len(frames) > self.batch_size:
+            raise ValueError(f"At most {self.batch_size} frames per batch, got {len(frames)}")
+        with self._lock:
+            if self._storage is None:
+                self._allocate()
+            # A common minimum rectangle when all frames have the same size,
+            # the full square otherwise (as ultralytics does)
+            rect = len({frame.shape[:2] for frame in frames}) == 1
+            plans = [letterbox_geometry(frame.shape[:2], self.size, self.stride, rect) for frame in frames]
+            height, width = plans[0][1]
+            count = len(frames) * 3 * height * width
+            batch = self._storage_np[:count].reshape(len(frames), 3, height, width)
+            for slot, (frame, (new_size, _, geometry)) in enumerate(zip(frames, plans)):
+                self._fill(slot, frame, new_size, geometry, batch[slot])
+            return self._storage[:count].view(len(frames), 3, height, width), [plan[2] for plan in plans]
+
+    def _fill(self, slot: int, frame: np.ndarray, new_size: Tuple[int, int], geometry: LetterboxGeometry,
+              out: np.ndarray):
+        new_w, new_h = new_size
+        if frame.shape[1] == new_w and frame.shape[0] == new_h:
+            resized = frame
+        else:
+            resized = self._resized[slot]
+            if resized is None or resized.shape[:2] != (new_h, new_w):
+                resized = self._resized[slot] = np.empty((new_h, new_w, 3), dtype=np.uint8)
+            cv2.resize(frame, new_size, dst=resized, interpolation=cv2.INTER_LINEAR)
+
+        # Border strips only; the image area is written right after
+        top, left = geometry.top, geometry.left
+        pad = PAD_VALUE / 255.0
+        out[:, :top] = pad
+        out[:, top + new_h:] = pad
+        out[:, top:top + new_h, :left] = pad
+        out[:, top:top + new_h, left + new_w:] = pad
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], straight into the tensor
+        np.multiply(resized[..., ::-1].transpose(2, 0, 1), 1.0 / 255.0,
+                    out=out[:, top:top + new_h, left:left + new_w], casting="unsafe")
+
+
+def restore(detections: Detections, geometry: LetterboxGeometry) -> Detections:
+    """Maps detections on a letterboxed input back onto the original frame."""
+    height, width = geometry.image_size
+    offset = np.array([geometry.left, geometry.top, geometry.left, geometry.top], dtype=np.float32)
+    boxes = (detections.boxes - offset) / geometry.scale
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+
+    keypoints = detections.keypoints
+    if keypoints is not None:
+        input_h, input_w = geometry.input_size
+        keypoints = keypoints.copy()
+        # Normalized to the letterboxed input -> normalized to the frame
+        keypoints[..., 0] = (keypoints[..., 0] * input_w - geometry.left) / geometry.scale / width
+        keypoints[..., 1] = (keypoints[..., 1] * input_h - geometry.top) / geometry.scale / height
+        # Points on the border are clipped to the frame, as ultralytics does
+        np.clip(keypoints[..., :2], 0.0, 1.0, out=keypoints[..., :2])
+
+    return Detections(
+        boxes=boxes.astype(np.float32, copy=False),
+        conf=detections.conf,
+        cls=detections.cls,
+        names=detections.names,
+        keypoints=keypoints,
+        track_ids=detections.track_ids,
+        image_size=(height, width),
+    )
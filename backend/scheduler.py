@@ -0,0 +1,216 @@
+# backend/scheduler.py
+"""
+Fair scheduling of live stream frames onto the shared vision engine.
+
+With many cameras on one node, sampling every stream at the same fixed rate
+either wastes the engine on quiet scenes or lets it fall behind. The
+FairScheduler decides, on every pass of the stream analysis loop, which
+streams get a frame analyzed:
+
+- Each source has an FPS budget (most frames per second it is analyzed at)
+  and a weight. Sources whose next frame is due compete with start-time fair
+  queuing, so when the engine can only take some of them in one pass, each
+  gets a share in proportion to its weight and none can starve the others.
+- The cost of a frame is measured from the passes themselves. When the
+  sampling rates of all sources would need more engine time than
+  STREAM_TARGET_LOAD, quiet sources are slowed down (not below
+  STREAM_MIN_FPS); they recover towards their budget once there is room.
+- Sources that reported an alert event (fire, fall) recently are raised to
+  STREAM_ALERT_FPS and weighted STREAM_ALERT_PRIORITY times more.
+- Frames older than STREAM_MAX_FRAME_AGE_S by the time they would be
+  analyzed are shed instead of analyzed late.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Slowest rate a quiet stream is throttled to when the engine falls behind
+STREAM_MIN_FPS = float(os.getenv("STREAM_MIN_FPS", "0.2"))
+# Rate of streams with an active alert event
+STREAM_ALERT_FPS = float(os.getenv("STREAM_ALERT_FPS", "5.0"))
+# Event types that raise a stream's rate and priority
+STREAM_ALERT_EVENTS = frozenset(
+    name.strip() for name in os.getenv("STREAM_ALERT_EVENTS", "fire,fall").split(",") if name.strip())
+# How long a stream stays raised after its last alert event
+STREAM_ALERT_HOLD_S = float(os.getenv("STREAM_ALERT_HOLD_S", "30"))
+# Weight multiplier of streams with an active alert event
+STREAM_ALERT_PRIORITY = float(os.getenv("STREAM_ALERT_PRIORITY", "4.0"))
+# Share of the engine's time the streams' sampling rates may need before
+# quiet streams are slowed down
+STREAM_TARGET_LOAD = float(os.getenv("STREAM_TARGET_LOAD", "0.9"))
+# Frames older than this are dropped instead of analyzed
+STREAM_MAX_FRAME_AGE_S = float(os.getenv("STREAM_MAX_FRAME_AGE_S", "1.0"))
+# Weight of the newest pass in the frame cost average
+_COST_SMOOTHING = 0.2
+# Quiet streams speed up by this factor per pass while the load is low
+_RECOVERY = 1.25
+
+
+@dataclass
+class SourceState:
+    """Scheduling state of one stream."""
+    budget: float  # frames per second the stream is analyzed at when there is room
+    weight: float
+    fps: float  # current sampling rate
+    next_due: float  # monotonic time the next frame may be analyzed
+    finish: float = 0.0  # virtual finish time of its last scheduled frame
+    alert_until: float = 0.0
+    frames_shed: int = 0
+
+    def alert(self, now: float) -> bool:
+        return now < self.alert_until
+
+
+class FairScheduler:
+    """
+    Weighted fair, load-adaptive frame scheduler over named sources.
+
+    Args:
+        min_fps: Floor of a throttled quiet source.
+        alert_fps: Rate of a source with an active alert event.
+        target_load: Share of engine time the sources' rates may need.
+        max_frame_age: Frames older than this (seconds) are shed.
+    """
+
+    def __init__(self, min_fps: float = STREAM_MIN_FPS, alert_fps: float = STREAM_ALERT_FPS,
+                 target_load: float = STREAM_TARGET_LOAD, max_frame_age: float = STREAM_MAX_FRAME_AGE_S,
+                 alert_events: Iterable[str] = STREAM_ALERT_EVENTS, alert_hold: float = STREAM_ALERT_HOLD_S,
+                 alert_priority: float = STREAM_ALERT_PRIORITY):
+        self.min_fps = max(1e-3, min_fps)
+        self.alert_fps = alert_fps
+        self.target_load = target_load
+        self.max_frame_age = max_frame_age
+        self.alert_events = frozenset(alert_events)
+        self.alert_hold = alert_hold
+        self.alert_priority = alert_priority
+        # Smoothed engine seconds per scheduled frame; None until a pass is measured
+        self.cost: Optional[float] = None
+        self._sources: Dict[str, SourceState] = {}
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def register(self, source_id: str, budget: float, weight: float = 1.0):
+        """Adds a source analyzed at up to `budget` frames per second."""
+        budget = max(self.min_fps, budget)
+        with self._lock:
+            self._sources[source_id] = SourceState(budget=budget, weight=max(1e-3, weight), fps=budget,
+                                                   next_due=time.monotonic(), finish=self._virtual_time)
+
+    def unregister(self, source_id: str):
+        with self._lock:
+            self._sources.pop(source_id, None)
+
+    def state(self, source_id: str) -> Optional[SourceState]:
+        return self._sources.get(source_id)
+
+    def next_due(self) -> Optional[float]:
+        """Earliest time a source is due, or None without sources."""
+        with self._lock:
+            return min((state.next_due for state in self._sources.values()), default=None)
+
+    def capacity(self) -> Optional[int]:
+        """
+        Frames one pass may take so it lasts no longer than the period of the
+        fastest source, or None while the frame cost is unknown.
+        """
+        if self.cost is None or self.cost <= 0:
+            return None
+        with self._lock:
+            fastest = max((state.fps for state in self._sources.values()), default=0.0)
+        if fastest <= 0:
+            return None
+        return max(1, int(1.0 / (fastest * self.cost)))
+
+    def select(self, candidates: Sequence[Tuple[str, float]]) -> Tuple[List[str], List[str]]:
+        """
+        Picks the sources to analyze in this pass.
+
+        Args:
+            candidates: (source id, wall-clock capture time) of every source
+                with a frame that was not analyzed yet.
+
+        Returns:
+            The source ids to analyze, in scheduling order, and those whose
+            frame is too old and should be dropped.
+        """
+        now, wall = time.monotonic(), time.time()
+        capacity = self.capacity()
+        with self._lock:
+            due: List[Tuple[float, int, str, SourceState]] = []
+            shed: List[str] = []
+            for source_id, captured in candidates:
+                state = self._sources.get(source_id)
+                if state is None or now < state.next_due:
+                    continue
+                if wall - captured > self.max_frame_age:
+                    state.frames_shed += 1
+                    shed.append(source_id)
+                    continue
+                start = max(self._virtual_time, state.finish)
+                # Ties go to alerting sources
+                due.append((start, 0 if state.alert(now) else 1, source_id, state))
+            due.sort(key=lambda entry: entry[:2])
+            picked = due if capacity is None else due[:capacity]
+            for start, _, _, state in picked:
+                weight = state.weight * (self.alert_priority if state.alert(now) else 1.0)
+                state.finish = start + 1.0 / weight
+                period = 1.0 / state.fps
+                # Lateness of up to one period is made up, so the average
+                # rate holds despite the loop's wake-up jitter
+                state.next_due = max(state.next_due, now - period) + period
+            if picked:
+                self._virtual_time = max(self._virtual_time, picked[-1][0])
+            return [entry[2] for entry in picked], shed
+
+    def report(self, source_id: str, event_types: Set[str]):
+        """Tells the scheduler which event types a source's last frame showed."""
+        if not event_types & self.alert_events:
+            return
+        with self._lock:
+            state = self._sources.get(source_id)
+            if state is not None:
+                now = time.monotonic()
+                if not state.alert(now):
+                    # Raised right away rather than after the quiet period
+                    state.next_due = min(state.next_due, now)
+                state.alert_until = now + self.alert_hold
+
+    def observe(self, seconds: float, frames: int):
+        """Records how long a pass over `frames` frames took and adapts the sampling rates."""
+        if frames <= 0:
+            return
+        per_frame = seconds / frames
+        self.cost = per_frame if self.cost is None else self.cost + _COST_SMOOTHING * (per_frame - self.cost)
+        self._adapt()
+
+    def load(self) -> float:
+        """Share of the engine's time the current sampling rates need."""
+        with self._lock:
+            return (self.cost or 0.0) * sum(state.fps for state in self._sources.values())
+
+    def _adapt(self):
+        now = time.monotonic()
+        with self._lock:
+            alerting = [state for state in self._sources.values() if state.alert(now)]
+            quiet = [state for state in self._sources.values() if not state.alert(now)]
+            for state in alerting:
+                state.fps = max(state.budget, self.alert_fps)
+            if not quiet:
+                return
+            for state in quiet:
+                # A source whose alert just expired falls back to its budget
+                state.fps = min(state.fps, state.budget)
+            load = self.cost * sum(state.fps for state in self._sources.values())
+            if load > self.target_load:
+                # Quiet sources share what the alerting ones leave, in
+                # proportion to their current rates
+                spare = max(0.0, self.target_load - self.cost * sum(state.fps for state in alerting))
+                factor = spare / (self.cost * sum(state.fps for state in quiet))
+                for state in quiet:
+                    state.fps = max(self.min_fps, state.fps * factor)
+            elif load < self.target_load / _RECOVERY:
+                for state in quiet:
+                    state.fps = min(state.budget, state.fps * _RECOVERY)
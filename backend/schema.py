@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Literal, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field
 
 # This file is a collection of Pydantic models. Each class inherits from BaseModel, which gives it powerful validation and parsing features.
@@ -43,4 +43,77 @@ class AnalyzeResponse(BaseModel):
     recommended_actions: List[str]
     evidence: List[Evidence] = []
     categories: List[EventType] = []
-    events: List[Event] = []
\ No newline at end of file
+    events: List[Event] = []
+
+JobState = Literal["queued", "running", "done", "failed"]
+
+class JobStatus(BaseModel):
+    id: str
+    status: JobState
+    source: str = "file"
+    created_at: float
+    frames_decoded: int = 0
+    frames_analyzed: int = 0
+    frames_skipped: int = 0  # analyzed frames the motion gate answered with earlier detections
+    events: List[Event] = []  # events found so far, in clip order
+    result: Optional[AnalyzeResponse] = None  # set once the job is done
+    error: Optional[str] = None
+
+class StreamRequest(BaseModel):
+    source: str = "webcam"  # "webcam", a device number, a file path or an rtsp:// / http:// URL
+    stream_id: Optional[str] = None
+    loop: bool = False  # replay files forever (handy as a fake camera)
+    mock: bool = False
+    detect_every: Optional[int] = Field(default=None, ge=1)  # run the model on every n-th analyzed frame, track in between
+    motion_gate: Optional[bool] = None  # reuse detections while the scene is static (default: MOTION_GATE)
+    motion_threshold: Optional[float] = Field(default=None, ge=0.0, le=1.0)  # changed-pixel fraction that counts as motion
+    fps: Optional[float] = Field(default=None, gt=0.0)  # FPS budget (default: STREAM_ANALYZE_FPS)
+    priority: float = Field(default=1.0, gt=0.0)  # weight when streams compete for the engine
+    tiled: Optional[bool] = None  # tile high-resolution frames (default: TILED_INFERENCE)
+    roi: Optional[List[List[Tuple[float, float]]]] = None  # zones as polygons of normalized (x, y) points
+
+class StreamStatus(BaseModel):
+    id: str
+    source: str
+    status: Literal["starting", "running", "reconnecting", "ended", "stopped", "error"]
+    error: Optional[str] = None
+    started_at: float
+    frames_read: int = 0
+    frames_dropped: int = 0  # frames replaced by a newer one before being analyzed
+    frames_analyzed: int = 0
+    frames_tracked: int = 0  # analyzed frames answered by the tracker instead of the model
+    frames_skipped: int = 0  # static frames that reused the previous detections
+    skip_ratio: float = 0.0  # frames_skipped / frames the motion gate saw
+    frames_shed: int = 0  # frames dropped for being too old by the time they were due
+    fps_budget: float = 0.0
+    analyze_fps: float = 0.0  # current sampling rate, adapted to load and alerts
+    priority: float = 1.0
+    alert: bool = False  # an alert event raised the stream's rate and priority
+    tiled: bool = False
+    roi: Optional[List[List[Tuple[float, float]]]] = None
+    last_result: Optional[AnalyzeResponse] = None
+    events: List[Event] = []  # most recent events, oldest first
+
+class StoredEvent(BaseModel):
+    id: int
+    source: str  # stream id
+    type: EventType
+    confidence: float
+    timestamp: float  # Unix time the event started
+    window_seconds: float
+    evidence: Optional[Evidence] = None
+
+class StoredDetection(BaseModel):
+    source: str
+    timestamp: float
+    label: str
+    confidence: float
+    box: Box
+    track_id: Optional[int] = None
+
+class EventCount(BaseModel):
+    source: str
+    type: EventType
+    count: int
+    first: float  # Unix time of the first and last event in the range
+    last: float
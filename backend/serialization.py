@@ -0,0 +1,288 @@
+# backend/serialization.py
+"""
+Compact encodings of analysis results, chosen by the request's Accept header.
+
+The default JSON repeats every key for every box and pose keypoint (a pose is
+17 `point_i` objects) and each event's evidence twice, once in `evidence` and
+once inside the event. Clients that handle many results can ask for:
+
+- `application/vnd.safesight.columnar+json` (COLUMNAR): the same content as
+  flat arrays. Evidence is stored once in a table the events and the response
+  point into; boxes are one `[x, y, w, h, ...]` array with a count per
+  evidence; poses are `[x, y, score, ...]` rows under one list of point names;
+  event timestamps are delta-encoded (the first is absolute, each next one is
+  the difference to the previous one). Floats are rounded to
+  COMPACT_DECIMALS.
+- `application/msgpack` (MSGPACK): the columnar payload as MessagePack, when
+  the optional `msgpack` package is installed.
+- `application/x-ndjson` (NDJSON): a summary line, then one line per event
+  with its evidence inline (/analyze only).
+
+Anything else gets the regular JSON. Bodies of at least GZIP_MIN_BYTES are
+gzip-compressed for clients that accept it. Encoding reads the models'
+attributes directly: nothing is validated again on the way out, and JSON is
+written by orjson when it is installed.
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import Response
+
+from metrics import RESPONSE_BYTES
+from schema import AnalyzeResponse, Event, Evidence, JobStatus
+
+try:  # orjson is optional: the standard library encoder is used without it
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+try:  # msgpack is optional: without it MessagePack is not offered
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the deployment
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR = "application/vnd.safesight.columnar+json"
+MSGPACK = "application/msgpack"
+NDJSON = "application/x-ndjson"
+# Other names clients use for the same formats
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK, "application/jsonl": NDJSON}
+# Version of the columnar layout, sent in every columnar payload
+COLUMNAR_VERSION = 1
+
+# Decimals kept of floats (coordinates, scores, seconds) in compact formats
+COMPACT_DECIMALS = int(os.getenv("COMPACT_DECIMALS", "4"))
+# Smallest body that is gzip-compressed (0 disables compression)
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+
+def _round(values: Sequence[float], decimals: int = COMPACT_DECIMALS) -> List[float]:
+    if not len(values):
+        return []
+    return np.round(np.asarray(values, dtype=np.float64), decimals).tolist()
+
+
+class _EvidenceTable:
+    """Evidence objects, each stored once however often it is referenced."""
+
+    def __init__(self):
+        self.rows: List[Evidence] = []
+        self._index: Dict[int, int] = {}
+
+    def add(self, evidence: Evidence) -> int:
+        index = self._index.get(id(evidence))
+        if index is None:
+            index = self._index[id(evidence)] = len(self.rows)
+            self.rows.append(evidence)
+        return index
+
+    def columns(self) -> Dict[str, Any]:
+        counts, boxes = [], []
+        names: Dict[str, int] = {}
+        poses = []
+        for evidence in self.rows:
+            counts.append(len(evidence.boxes or ()))
+            for box in evidence.boxes or ():
+                boxes.extend((box.x, box.y, box.w, box.h))
+            if evidence.pose:
+                for name in evidence.pose:
+                    names.setdefault(name, len(names))
+        for evidence in self.rows:
+            if not evidence.pose:
+                poses.append(None)
+                continue
+            # Points a pose lacks are left at score 0
+            row = np.zeros((len(names), 3))
+            for name, point in evidence.pose.items():
+                row[names[name]] = (point.x, point.y, point.score)
+            poses.append(np.round(row, COMPACT_DECIMALS).ravel().tolist())
+        return {
+            "scene": [evidence.scene for evidence in self.rows],
+            "notes": [evidence.notes for evidence in self.rows],
+            "box_count": counts,
+            "boxes": boxes,
+            "pose_names": list(names),
+            "pose": poses,
+        }
+
+
+def _event_columns(events: Sequence[Event], table: _EvidenceTable) -> Dict[str, Any]:
+    timestamps = np.asarray([event.timestamp for event in events], dtype=np.float64)
+    return {
+        "type": [event.type for event in events],
+        "confidence": _round([event.confidence for event in events]),
+        "window_seconds": _round([event.window_seconds for event in events]),
+        "timestamp": _round(np.diff(timestamps, prepend=0.0)) if len(events) else [],
+        "evidence": [table.add(event.evidence) for event in events],
+    }
+
+
+def columnar_response(response: AnalyzeResponse) -> Dict[str, Any]:
+    """An AnalyzeResponse in the columnar layout."""
+    table = _EvidenceTable()
+    evidence = [table.add(item) for item in response.evidence]
+    events = _event_columns(response.events, table)
+    return {
+        "version": COLUMNAR_VERSION,
+        "severity": response.severity,
+        "explanation": response.explanation,
+        "recommended_actions": response.recommended_actions,
+        "categories": response.categories,
+        "evidence": evidence,
+        "events": events,
+        "evidence_table": table.columns(),
+    }
+
+
+def columnar_job(job: JobStatus) -> Dict[str, Any]:
+    """A JobStatus in the columnar layout; its result is a columnar response."""
+    table = _EvidenceTable()
+    events = _event_columns(job.events, table)
+    return {
+        "version": COLUMNAR_VERSION,
+        "id": job.id,
+        "status": job.status,
+        "source": job.source,
+        "created_at": job.created_at,
+        "frames_decoded": job.frames_decoded,
+        "frames_analyzed": job.frames_analyzed,
+        "frames_skipped": job.frames_skipped,
+        "error": job.error,
+        "events": events,
+        "evidence_table": table.columns(),
+        "result": columnar_response(job.result) if job.result is not None else None,
+    }
+
+
+def _columnar(content: Any) -> Dict[str, Any]:
+    if isinstance(content, AnalyzeResponse):
+        return columnar_response(content)
+    if isinstance(content, JobStatus):
+        return columnar_job(content)
+    raise TypeError(f"No columnar layout for {type(content).__name__}")
+
+
+def _compact_event(event: Event) -> Dict[str, Any]:
+    evidence = event.evidence
+    pose = None
+    if evidence.pose:
+        pose = np.round([(point.x, point.y, point.score) for point in evidence.pose.values()],
+                        COMPACT_DECIMALS).ravel().tolist()
+    return {
+        "type": event.type,
+        "confidence": round(event.confidence, COMPACT_DECIMALS),
+        "window_seconds": round(event.window_seconds, COMPACT_DECIMALS),
+        "timestamp": event.timestamp,
+        "scene": evidence.scene,
+        "boxes": [(box.x, box.y, box.w, box.h) for box in evidence.boxes or ()],
+        "pose_names": list(evidence.pose) if evidence.pose else None,
+        "pose": pose,
+        "notes": evidence.notes,
+    }
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON bytes of plain Python data (and NumPy arrays)."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=str, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _encode_json(content: Any) -> bytes:
+    # Pydantic's own serializer, without FastAPI validating the model again
+    return content.model_dump_json().encode()
+
+
+def _encode_columnar(content: Any) -> bytes:
+    return dumps(_columnar(content))
+
+
+def _encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(_columnar(content), use_bin_type=True, default=str)
+
+
+def _encode_ndjson(content: Any) -> bytes:
+    if not isinstance(content, AnalyzeResponse):
+        raise TypeError(f"No NDJSON layout for {type(content).__name__}")
+    summary = {
+        "severity": content.severity,
+        "explanation": content.explanation,
+        "recommended_actions": content.recommended_actions,
+        "categories": content.categories,
+        "events": len(content.events),
+    }
+    return b"".join(dumps(line) + b"\n" for line in [summary, *map(_compact_event, content.events)])
+
+
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    JSON: _encode_json,
+    COLUMNAR: _encode_columnar,
+    NDJSON: _encode_ndjson,
+}
+if msgpack is not None:
+    ENCODERS[MSGPACK] = _encode_msgpack
+
+
+def _parse_quality(header: Optional[str]) -> List[Tuple[str, float]]:
+    """(value, q) pairs of an Accept-style header, in the order sent."""
+    entries = []
+    for part in (header or "").split(","):
+        value, *params = [item.strip() for item in part.split(";")]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        entries.append((value.lower(), quality))
+    return entries
+
+
+def negotiate(accept: Optional[str], offered: Sequence[str] = (JSON, COLUMNAR, MSGPACK, NDJSON)) -> str:
+    """
+    The offered media type the client prefers, or JSON when it accepts none
+    of them (clients sending `*/*` or no Accept header get JSON).
+    """
+    available = [media_type for media_type in offered if media_type in ENCODERS]
+    best, best_quality = JSON, 0.0
+    for value, quality in _parse_quality(accept):
+        value = _ALIASES.get(value, value)
+        if value in available and quality > best_quality:
+            best, best_quality = value, quality
+    return best
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    return any(value in ("gzip", "*") and quality > 0 for value, quality in _parse_quality(accept_encoding))
+
+
+def render(content: Any, headers: Mapping[str, str], offered: Sequence[str] = (JSON, COLUMNAR, MSGPACK, NDJSON),
+           status_code: int = 200) -> Response:
+    """
+    Encodes a response model in the format the request asks for and
+    compresses it if the client accepts gzip.
+
+    Args:
+        content: An AnalyzeResponse or JobStatus.
+        headers: The request headers (Accept, Accept-Encoding).
+        offered: Media types the endpoint supports.
+        status_code: Status of the response.
+    """
+    media_type = negotiate(headers.get("accept"), offered)
+    body = ENCODERS[media_type](content)
+    response_headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = "identity"
+    if 0 < GZIP_MIN_BYTES <= len(body) and _accepts_gzip(headers.get("accept-encoding")):
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        response_headers["Content-Encoding"] = encoding = "gzip"
+    RESPONSE_BYTES.observe(len(body), format=media_type, encoding=encoding)
+    return Response(body, status_code=status_code, media_type=media_type, headers=response_headers)
@@ -0,0 +1,100 @@
+# backend/serve.py
+"""
+Pre-fork launcher for running several API workers on one machine.
+
+`uvicorn --workers N` starts every worker from scratch, so each one imports
+torch and loads the weights on its own. Here the master process imports the
+app and loads the weights once, then forks the workers: they start with the
+model already in memory, and its tensors stay shared between them
+copy-on-write since inference only reads them. Each worker then starts its
+own batchers and warms its models up before /ready reports it ready.
+
+    python serve.py --workers 4 --port 8000
+
+Nothing in the master may start threads or run inference before the fork:
+threads do not survive it, and a torch thread pool created in the parent
+can deadlock its children.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+from typing import List, Optional
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+# Worker processes to fork
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+
+
+def _run_worker(app, sock: socket.socket, host: str, port: int) -> int:
+    # The master's handlers would forward signals to siblings that do not exist here
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+    server.run(sockets=[sock])
+    return 0
+
+
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = SERVE_WORKERS) -> int:
+    """
+    Loads the models, binds the port and forks `workers` servers sharing it.
+
+    Returns:
+        0 once every worker exited cleanly, 1 otherwise.
+    """
+    # Imported before the fork so the workers share the imported modules too
+    from app import app
+    from classifyEvent import load_vision_engines
+
+    load_vision_engines()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children: List[int] = []
+    for _ in range(max(1, workers)):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(_run_worker(app, sock, host, port))
+        children.append(pid)
+    logger.info("Serving on %s:%d with %d workers", host, port, len(children))
+
+    def forward(signum, _frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    failed = False
+    for pid in children:
+        _, status = os.waitpid(pid, 0)
+        failed = failed or os.waitstatus_to_exitcode(status) != 0
+    sock.close()
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API in several workers forked from a preloaded model.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
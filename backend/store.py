@@ -0,0 +1,410 @@
+# backend/store.py
+"""
+Persistent history of live stream events and detections.
+
+Stream results used to live only in each stream's short in-memory event
+list. The EventStore keeps them in a SQLite file in WAL mode, so questions
+like "all falls on camera 3 in the last hour" can be answered later:
+
+- Writes never block the analysis loop: `record_events` and
+  `record_detections` put the results on a bounded queue, and one writer
+  thread inserts them in batches (one transaction per EVENT_STORE_FLUSH_S).
+  When the writer falls behind, new results are dropped and counted.
+- Events carry their source, time, type, confidence and evidence (as JSON);
+  detections one row per box with its label, confidence and track id.
+  Source names are stored once in a `sources` table. Indexes on (source,
+  type, time), (source, time), (type, time) and time keep time-range
+  queries fast on millions of rows.
+- Readers use their own connections, which WAL lets run while the writer
+  inserts.
+- Every EVENT_STORE_MAINTENANCE_S the writer deletes events older than
+  EVENT_RETENTION_DAYS and detections older than DETECTION_RETENTION_DAYS,
+  then the oldest detections (and, if needed, events) until the file holds
+  at most EVENT_STORE_MAX_BYTES, and gives the freed pages back to the disk.
+
+Only live streams are recorded: upload and job events are timed relative to
+their clip, not on the wall clock.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from detections import Detections
+from schema import Event
+
+logger = logging.getLogger(__name__)
+
+# SQLite file of the stream history; empty disables it
+EVENT_STORE_PATH = os.getenv(
+    "EVENT_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".event_store", "events.db"))
+# Also store every analyzed frame's detections, not only events
+EVENT_STORE_DETECTIONS = os.getenv("EVENT_STORE_DETECTIONS", "1") == "1"
+# How long events and detections are kept
+EVENT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", "30"))
+DETECTION_RETENTION_DAYS = float(os.getenv("DETECTION_RETENTION_DAYS", "3"))
+# The oldest rows are deleted once the file is larger than this (0 = no limit)
+EVENT_STORE_MAX_BYTES = int(os.getenv("EVENT_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Longest time results wait in memory before they are written
+EVENT_STORE_FLUSH_S = float(os.getenv("EVENT_STORE_FLUSH_S", "1.0"))
+# Time between two retention and compaction passes
+EVENT_STORE_MAINTENANCE_S = float(os.getenv("EVENT_STORE_MAINTENANCE_S", "300"))
+# Results waiting for the writer; more are dropped
+EVENT_STORE_QUEUE_SIZE = 10000
+# Most rows one query returns
+EVENT_QUERY_MAX_ROWS = 10000
+# Rows deleted per statement, and statements per table in one maintenance pass,
+# so a large backlog is worked off without holding the writer for long
+_DELETE_CHUNK = 20000
+_DELETE_CHUNKS_PER_PASS = 25
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, source_id INTEGER NOT NULL, ts REAL NOT NULL, "
+    "type TEXT NOT NULL, confidence REAL NOT NULL, window_seconds REAL NOT NULL, evidence TEXT)",
+    "CREATE INDEX IF NOT EXISTS events_source_type_ts ON events (source_id, type, ts)",
+    "CREATE INDEX IF NOT EXISTS events_source_ts ON events (source_id, ts)",
+    "CREATE INDEX IF NOT EXISTS events_type_ts ON events (type, ts)",
+    "CREATE INDEX IF NOT EXISTS events_ts ON events (ts)",
+    "CREATE TABLE IF NOT EXISTS detections (source_id INTEGER NOT NULL, ts REAL NOT NULL, label TEXT NOT NULL, "
+    "confidence REAL NOT NULL, x INTEGER, y INTEGER, w INTEGER, h INTEGER, track_id INTEGER)",
+    "CREATE INDEX IF NOT EXISTS detections_source_ts ON detections (source_id, ts)",
+    "CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts)",
+)
+
+
+def _time_range(since: Optional[float], until: Optional[float], last: Optional[float]) -> Tuple[float, float]:
+    """(since, until) in Unix seconds; `last` means the last so many seconds."""
+    now = time.time()
+    if last is not None:
+        since = now - last if since is None else max(since, now - last)
+    return (since if since is not None else 0.0), (until if until is not None else float("inf"))
+
+
+class EventStore:
+    """
+    Batched, size-bounded SQLite store of stream events and detections.
+
+    Args:
+        path: SQLite file (created with its directory on first use).
+        detections: Store detections besides events.
+        event_retention / detection_retention: Seconds rows are kept.
+        max_bytes: Size the file is compacted to (0 = no limit).
+        flush_interval: Longest time results wait before they are written.
+        maintenance_interval: Time between two retention passes.
+    """
+
+    def __init__(self, path: str = EVENT_STORE_PATH, detections: bool = EVENT_STORE_DETECTIONS,
+                 event_retention: float = EVENT_RETENTION_DAYS * 86400.0,
+                 detection_retention: float = DETECTION_RETENTION_DAYS * 86400.0,
+                 max_bytes: int = EVENT_STORE_MAX_BYTES, flush_interval: float = EVENT_STORE_FLUSH_S,
+                 maintenance_interval: float = EVENT_STORE_MAINTENANCE_S, queue_size: int = EVENT_STORE_QUEUE_SIZE):
+        self.path = path
+        self.store_detections = detections
+        self.event_retention = event_retention
+        self.detection_retention = detection_retention
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.maintenance_interval = maintenance_interval
+        self.events_written = 0
+        self.detections_written = 0
+        self.dropped = 0
+        self.rows_deleted = 0
+        self.last_maintenance: Optional[float] = None
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._local = threading.local()
+
+    @property
+    def pending(self) -> int:
+        """Results waiting for the writer."""
+        return self._queue.qsize()
+
+    # -- writing -------------------------------------------------------------
+
+    def record_events(self, source: str, events: Sequence[Event]):
+        """Queues events of `source` (their timestamps are wall-clock times)."""
+        if events:
+            self._put(("events", source, list(events)))
+
+    def record_detections(self, source: str, timestamp: float, detections: Detections):
+        """Queues one frame's detections of `source`."""
+        if self.store_detections and len(detections):
+            self._put(("detections", source, timestamp, detections))
+
+    def _put(self, item: tuple):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 10.0):
+        """Writes what is queued and stops the writer."""
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout=timeout)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        # Only takes effect on a new, empty file (before the journal mode
+        # writes its header); lets compaction shrink the file
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            if not self._schema_ready:
+                for statement in _SCHEMA:
+                    db.execute(statement)
+                self._schema_ready = True
+        return db
+
+    def _run(self):
+        db = self._connect()
+        sources: Dict[str, int] = {}
+        next_maintenance = time.monotonic()
+        stopping = False
+        while not stopping:
+            batch: List[tuple] = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                if batch:
+                    self._write(db, sources, batch)
+                if time.monotonic() >= next_maintenance:
+                    next_maintenance = time.monotonic() + self.maintenance_interval
+                    self._maintain(db)
+            except Exception:
+                logger.exception("Could not write %d results to the event store", len(batch))
+        db.close()
+
+    @staticmethod
+    def _source_id(db: sqlite3.Connection, sources: Dict[str, int], name: str) -> int:
+        source_id = sources.get(name)
+        if source_id is None:
+            db.execute("INSERT OR IGNORE INTO sources (name) VALUES (?)", (name,))
+            source_id = sources[name] = db.execute("SELECT id FROM sources WHERE name = ?", (name,)).fetchone()[0]
+        return source_id
+
+    def _write(self, db: sqlite3.Connection, sources: Dict[str, int], batch: List[tuple]):
+        events, detections = [], []
+        db.execute("BEGIN")
+        try:
+            for item in batch:
+                source_id = self._source_id(db, sources, item[1])
+                if item[0] == "events":
+                    events.extend(
+                        (source_id, event.timestamp, event.type, event.confidence, event.window_seconds,
+                         event.evidence.model_dump_json(exclude_none=True))
+                        for event in item[2])
+                else:
+                    detections.extend(self._detection_rows(source_id, item[2], item[3]))
+            db.executemany("INSERT INTO events (source_id, ts, type, confidence, window_seconds, evidence) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", events)
+            db.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", detections)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.events_written += len(events)
+        self.detections_written += len(detections)
+
+    @staticmethod
+    def _detection_rows(source_id: int, timestamp: float, detections: Detections) -> Iterable[tuple]:
+        boxes = detections.boxes.astype(np.int32)
+        xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]]).tolist()
+        track_ids = (detections.track_ids.tolist() if detections.track_ids is not None
+                     else [None] * len(detections))
+        for label, confidence, (x, y, w, h), track_id in zip(
+                detections.labels.tolist(), detections.conf.tolist(), xywh, track_ids):
+            yield (source_id, timestamp, label, confidence, x, y, w, h,
+                   track_id if track_id is not None and track_id >= 0 else None)
+
+    # -- retention and compaction -------------------------------------------
+
+    def _maintain(self, db: sqlite3.Connection):
+        now = time.time()
+        deleted = self._delete_oldest(db, "events", now - self.event_retention)
+        deleted += self._delete_oldest(db, "detections", now - self.detection_retention)
+        if self.max_bytes > 0:
+            # Detections go first: they are the bulk of the file and the
+            # least valuable once old
+            for table in ("detections", "events"):
+                while self._live_bytes(db) > self.max_bytes:
+                    removed = self._delete_oldest(db, table, None, chunks=1)
+                    if not removed:
+                        break
+                    deleted += removed
+        if deleted:
+            # Frees one page per step; executescript runs it to the end
+            db.executescript("PRAGMA incremental_vacuum;")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.rows_deleted += deleted
+        self.last_maintenance = now
+
+    @staticmethod
+    def _delete_oldest(db: sqlite3.Connection, table: str, before: Optional[float],
+                       chunks: int = _DELETE_CHUNKS_PER_PASS) -> int:
+        """Deletes rows of `table` older than `before` (or the oldest ones), chunk by chunk."""
+        where = "WHERE ts < ? " if before is not None else ""
+        params: tuple = (before, _DELETE_CHUNK) if before is not None else (_DELETE_CHUNK,)
+        deleted = 0
+        for _ in range(chunks):
+            count = db.execute(f"DELETE FROM {table} WHERE rowid IN "
+                               f"(SELECT rowid FROM {table} {where}ORDER BY ts LIMIT ?)", params).rowcount
+            deleted += count
+            if count < _DELETE_CHUNK:
+                break
+        return deleted
+
+    @staticmethod
+    def _live_bytes(db: sqlite3.Connection) -> int:
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        pages = db.execute("PRAGMA page_count").fetchone()[0] - db.execute("PRAGMA freelist_count").fetchone()[0]
+        return pages * page_size
+
+    # -- queries -------------------------------------------------------------
+
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """This thread's read connection, or None while the file does not exist."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            if not os.path.exists(self.path):
+                return None
+            db = self._local.db = self._connect()
+        return db
+
+    @staticmethod
+    def _find_source(db: sqlite3.Connection, source: str) -> Optional[int]:
+        row = db.execute("SELECT id FROM sources WHERE name = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def events(self, source: Optional[str] = None, event_type: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None, last: Optional[float] = None, limit: int = 100,
+               newest_first: bool = True) -> List[Dict[str, Any]]:
+        """
+        Stored events matching every given filter.
+
+        Args:
+            source: Stream id.
+            event_type: Event type.
+            since / until: Unix time range (inclusive).
+            last: Only the last so many seconds.
+            limit: Most events returned (capped at EVENT_QUERY_MAX_ROWS).
+            newest_first: Order by descending time.
+        """
+        db = self._reader()
+        if db is None:
+            return []
+        start, end = _time_range(since, until, last)
+        clauses, params = ["e.ts >= ?", "e.ts <= ?"], [start, end]
+        if source is not None:
+            source_id = self._find_source(db, source)
+            if source_id is None:
+                return []
+            clauses.append("e.source_id = ?")
+            params.append(source_id)
+        if event_type is not None:
+            clauses.append("e.type = ?")
+            params.append(event_type)
+        params.append(min(max(1, limit), EVENT_QUERY_MAX_ROWS))
+        rows = db.execute(
+            "SELECT e.id, s.name, e.ts, e.type, e.confidence, e.window_seconds, e.evidence "
+            "FROM events e JOIN sources s ON s.id = e.source_id "
+            f"WHERE {' AND '.join(clauses)} ORDER BY e.ts {'DESC' if newest_first else 'ASC'} LIMIT ?",
+            params).fetchall()
+        return [
+            {"id": row[0], "source": row[1], "timestamp": row[2], "type": row[3], "confidence": row[4],
+             "window_seconds": row[5], "evidence": json.loads(row[6]) if row[6] else None}
+            for row in rows
+        ]
+
+    def detections(self, source: str, label: Optional[str] = None, since: Optional[float] = None,
+                   until: Optional[float] = None, last: Optional[float] = None, limit: int = 1000,
+                   newest_first: bool = True) -> List[Dict[str, Any]]:
+        """Stored detections of one stream, filtered like `events`."""
+        db = self._reader()
+        if db is None:
+            return []
+        source_id = self._find_source(db, source)
+        if source_id is None:
+            return []
+        start, end = _time_range(since, until, last)
+        clauses, params = ["source_id = ?", "ts >= ?", "ts <= ?"], [source_id, start, end]
+        if label is not None:
+            clauses.append("label = ?")
+            params.append(label)
+        params.append(min(max(1, limit), EVENT_QUERY_MAX_ROWS))
+        rows = db.execute(
+            "SELECT ts, label, confidence, x, y, w, h, track_id FROM detections "
+            f"WHERE {' AND '.join(clauses)} ORDER BY ts {'DESC' if newest_first else 'ASC'} LIMIT ?",
+            params).fetchall()
+        return [
+            {"source": source, "timestamp": row[0], "label": row[1], "confidence": row[2],
+             "box": {"x": row[3], "y": row[4], "w": row[5], "h": row[6]}, "track_id": row[7]}
+            for row in rows
+        ]
+
+    def counts(self, source: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+               last: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Number of events per source and type in a time range, with the first and last time seen."""
+        db = self._reader()
+        if db is None:
+            return []
+        start, end = _time_range(since, until, last)
+        clauses, params = ["e.ts >= ?", "e.ts <= ?"], [start, end]
+        if source is not None:
+            source_id = self._find_source(db, source)
+            if source_id is None:
+                return []
+            clauses.append("e.source_id = ?")
+            params.append(source_id)
+        rows = db.execute(
+            "SELECT s.name, e.type, COUNT(*), MIN(e.ts), MAX(e.ts) "
+            "FROM events e JOIN sources s ON s.id = e.source_id "
+            f"WHERE {' AND '.join(clauses)} GROUP BY e.source_id, e.type ORDER BY s.name, e.type",
+            params).fetchall()
+        return [{"source": row[0], "type": row[1], "count": row[2], "first": row[3], "last": row[4]}
+                for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "path": self.path,
+            "pending": self.pending,
+            "events_written": self.events_written,
+            "detections_written": self.detections_written,
+            "dropped": self.dropped,
+            "rows_deleted": self.rows_deleted,
+            "last_maintenance": self.last_maintenance,
+            "max_bytes": self.max_bytes,
+        }
+        db = self._reader()
+        if db is not None:
+            stats["bytes"] = self._live_bytes(db)
+            stats["events"] = db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+            stats["detections"] = db.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        return stats
@@ -0,0 +1,500 @@
+# backend/streams.py
+"""
+Live stream ingestion: webcams, video files and RTSP/HTTP URLs.
+
+Every stream keeps one long-lived capture on its own reader thread. Readers
+only ever keep the newest frame (older unread frames are dropped, so
+analysis never falls behind real time), and a single analysis loop pulls
+the latest frame of every stream that is due and runs them through the
+model in one batched forward pass. Which streams are due is decided by the
+FairScheduler (scheduler.py): per-stream FPS budgets and priorities, rates
+adapted to the engine's load and raised on alert events, stale frames shed.
+High-resolution streams can be tiled and restricted to zones (tiling.py).
+Readers also keep a short encoded history of each stream, from which a clip
+is cut around every event (clips.py).
+"""
+
+import collections
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from clips import EVENT_CLIPS, ClipRecorder, ClipWriter
+from detections import Detections
+from metrics import EVENTS, FRAMES, STAGE_ERRORS, STAGE_SECONDS
+from schema import AnalyzeResponse, Event, StreamStatus
+from temporal import TemporalState
+from motion import MOTION_GATE, MOTION_THRESHOLD, MotionGate
+from pipeline import shrink_size
+from preprocess import INPUT_SIZE
+from store import EventStore
+from scheduler import FairScheduler, SourceState
+from tiling import TILED_INFERENCE, Polygon, RegionMask, TiledInference
+from tracker import TRACK_DETECT_EVERY, Tracker
+
+# How many frames per second of each stream get analyzed (its default FPS
+# budget; the scheduler may lower it under load or raise it on alerts)
+STREAM_ANALYZE_FPS = float(os.getenv("STREAM_ANALYZE_FPS", "2.0"))
+# Longest wait before a dropped camera/URL is reopened
+STREAM_MAX_BACKOFF_S = 5.0
+# Events remembered per stream
+STREAM_EVENT_HISTORY = 50
+# Analyzed frames of streams without tiling or zones are shrunk to this
+# longest side before inference (0 keeps the source size), the size the
+# letterbox brings them to anyway; detections are reported in source pixels
+STREAM_MAX_SIDE = int(os.getenv("STREAM_MAX_SIDE", str(INPUT_SIZE)))
+# Shortest sleep of the analysis loop between two passes
+_MIN_PASS_INTERVAL_S = 0.01
+
+_URL_PATTERN = re.compile(r"^[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+# Frame kind in the metrics for each plan of LiveStream.plan
+_FRAME_KINDS = {"detect": "detected", "track": "tracked", "reuse": "skipped"}
+# Default of StreamManager's clips: a ClipWriter of its own when EVENT_CLIPS is set
+_DEFAULT_CLIPS = object()
+
+
+def resolve_source(source: str) -> Union[int, str]:
+    """Maps "webcam" and device numbers to capture indices; leaves paths/URLs alone."""
+    if source == "webcam":
+        return 0
+    if source.isdigit():
+        return int(source)
+    return source
+
+
+def is_live_source(source: Union[int, str]) -> bool:
+    """Devices and URLs are live; anything else is treated as a file."""
+    return isinstance(source, int) or bool(_URL_PATTERN.match(source))
+
+
+class LatestFrame:
+    """Single-slot frame holder: a new frame always replaces the previous one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame: Optional[np.ndarray] = None
+        self._timestamp = 0.0
+        self._seq = 0
+        self._consumed_seq = 0
+        self.dropped = 0
+
+    def put(self, frame: np.ndarray, timestamp: float):
+        with self._lock:
+            if self._seq > self._consumed_seq:
+                # The previous frame was never analyzed: it is stale now
+                self.dropped += 1
+            self._frame = frame
+            self._timestamp = timestamp
+            self._seq += 1
+
+    def peek(self) -> Tuple[int, Optional[np.ndarray], float]:
+        """Returns the newest frame without marking it as consumed."""
+        with self._lock:
+            return self._seq, self._frame, self._timestamp
+
+    def take(self) -> Optional[Tuple[np.ndarray, float]]:
+        """Returns the newest frame if it has not been taken yet."""
+        with self._lock:
+            if self._seq == self._consumed_seq:
+                return None
+            self._consumed_seq = self._seq
+            return self._frame, self._timestamp
+
+    def pending(self) -> Optional[float]:
+        """Capture time of the newest frame if it has not been taken yet."""
+        with self._lock:
+            return self._timestamp if self._seq > self._consumed_seq else None
+
+
+def _shrink(frame: np.ndarray, max_side: int = STREAM_MAX_SIDE) -> Tuple[np.ndarray, float]:
+    """`frame` fitted into `max_side`, and the factor that maps its detections back."""
+    height, width = frame.shape[:2]
+    size = shrink_size(width, height, max_side)
+    if size is None:
+        return frame, 1.0
+    # Linear, like the letterbox this resize stands in for
+    return cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR), width / size[0]
+
+
+class StreamReader:
+    """
+    Keeps one capture open and continuously reads it on a background thread.
+
+    Files are paced at their native frame rate (and can loop forever, which
+    makes a local file a convenient fake camera); devices and URLs are
+    reopened with exponential backoff when they drop.
+    """
+
+    def __init__(self, source: str, loop: bool = False):
+        self.source = source
+        self.target = resolve_source(source)
+        self.live = is_live_source(self.target)
+        self.loop = loop
+        self.latest = LatestFrame()
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.frames_read = 0
+        # Called on the reader thread with every frame read and its time
+        self.on_frame: Optional[Callable[[np.ndarray, float], None]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stream-reader-{source}", daemon=True)
+
+    def start(self) -> "StreamReader":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5.0)
+        if self.status not in ("ended", "error"):
+            self.status = "stopped"
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def _open(self) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(self.target)
+        if cap.isOpened():
+            # Keep the driver from queueing frames we would only drop later
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stop.is_set():
+            cap = self._open()
+            if not cap.isOpened():
+                cap.release()
+                if not self.live:
+                    self.status, self.error = "error", f"Could not open video source: {self.source}"
+                    return
+                self.status = "reconnecting"
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, STREAM_MAX_BACKOFF_S)
+                continue
+
+            self.status, self.error, backoff = "running", None, 0.5
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            next_frame_at = time.monotonic()
+            try:
+                while not self._stop.is_set():
+                    ret, frame = cap.read()
+                    if not ret or frame is None:
+                        break
+                    self.frames_read += 1
+                    timestamp = time.time()
+                    self.latest.put(frame, timestamp)
+                    if self.on_frame is not None:
+                        self.on_frame(frame, timestamp)
+                    if not self.live:
+                        # Play files back in real time, like a camera would
+                        next_frame_at += 1.0 / fps
+                        self._stop.wait(max(0.0, next_frame_at - time.monotonic()))
+            finally:
+                cap.release()
+
+            if self._stop.is_set():
+                return
+            if not self.live and not self.loop:
+                self.status = "ended"
+                return
+            if self.live:
+                self.status = "reconnecting"
+                self._stop.wait(backoff)
+
+
+class LiveStream:
+    """A reader plus the analysis state of one stream."""
+
+    def __init__(self, stream_id: str, source: str, loop: bool = False, mock: bool = False,
+                 detect_every: int = TRACK_DETECT_EVERY, motion_gate: Optional[MotionGate] = None,
+                 fps: float = STREAM_ANALYZE_FPS, priority: float = 1.0, tiled: bool = TILED_INFERENCE,
+                 roi: Optional[Sequence[Polygon]] = None, clips: Optional[ClipWriter] = None):
+        self.id = stream_id
+        self.reader = StreamReader(source, loop=loop)
+        # Cuts a clip around every event when a writer is given
+        self.recorder = ClipRecorder(stream_id, clips) if clips is not None else None
+        if self.recorder is not None:
+            self.reader.on_frame = self.recorder.push
+        self.mock = mock
+        self.fps = fps
+        self.priority = priority
+        self.tiled = tiled
+        # Zones the stream is restricted to; pixels outside are never analyzed
+        self.roi = [[list(point) for point in polygon] for polygon in roi] if roi else None
+        self.region = RegionMask(roi) if roi else None
+        self.detect_every = max(1, detect_every)
+        self.motion_gate = motion_gate
+        self.started_at = time.time()
+        self.frames_analyzed = 0
+        self.frames_tracked = 0
+        self.frames_shed = 0
+        self.tracker = Tracker()
+        # Detections of the last analyzed frame, reused while the scene is static
+        self.last_detections: Optional[Detections] = None
+        self._moving_frames = 0
+        self.temporal = TemporalState()
+        self.last_result: Optional[AnalyzeResponse] = None
+        self.events: Deque[Event] = collections.deque(maxlen=STREAM_EVENT_HISTORY)
+        self._previous_types: set = set()
+
+    @property
+    def active_events(self) -> set:
+        """Event types shown by the last analyzed frame."""
+        return self._previous_types
+
+    def status(self, schedule: Optional[SourceState] = None) -> StreamStatus:
+        return StreamStatus(
+            id=self.id,
+            source=self.reader.source,
+            status=self.reader.status,
+            error=self.reader.error,
+            started_at=self.started_at,
+            frames_read=self.reader.frames_read,
+            frames_dropped=self.reader.latest.dropped,
+            frames_analyzed=self.frames_analyzed,
+            frames_tracked=self.frames_tracked,
+            frames_skipped=self.motion_gate.frames_skipped if self.motion_gate is not None else 0,
+            skip_ratio=self.motion_gate.skip_ratio if self.motion_gate is not None else 0.0,
+            frames_shed=self.frames_shed,
+            fps_budget=self.fps,
+            analyze_fps=schedule.fps if schedule is not None else self.fps,
+            priority=self.priority,
+            alert=schedule is not None and schedule.alert(time.monotonic()),
+            tiled=self.tiled,
+            roi=self.roi,
+            last_result=self.last_result,
+            events=list(self.events),
+        )
+
+    def plan(self, frame: np.ndarray) -> str:
+        """Whether `frame` is "detect"ed, "track"ed or "reuse"s the last detections."""
+        # Nothing to reuse until a frame was analyzed (the first one may have failed)
+        if self.motion_gate is not None and not self.motion_gate.check(frame) and self.last_detections is not None:
+            return "reuse"
+        self._moving_frames += 1
+        return "detect" if (self._moving_frames - 1) % self.detect_every == 0 else "track"
+
+    def record(self, responses: List[AnalyzeResponse], timestamp: float) -> List[Event]:
+        """
+        Keeps the most severe response and the start of every event episode,
+        and returns the episodes that started with this frame.
+        """
+        self.frames_analyzed += 1
+        started: List[Event] = []
+        frame_types = set()
+        best: Optional[AnalyzeResponse] = None
+        for response in responses:
+            for event in response.events:
+                event.timestamp = timestamp
+                if event.type not in self._previous_types | frame_types:
+                    if self.recorder is not None:
+                        self.recorder.trigger(event)
+                    self.events.append(event)
+                    started.append(event)
+                    EVENTS.inc(type=event.type)
+                frame_types.add(event.type)
+            if best is None or response.severity > best.severity:
+                best = response
+        self._previous_types = frame_types
+        self.last_result = best
+        return started
+
+
+class StreamManager:
+    """
+    Owns every live stream and the shared analysis loop.
+
+    Args:
+        infer: Batched inference function (list of frames -> Detections each).
+        reason: Turns one frame's Detections into handler responses, given
+            the mock flag, the stream's TemporalState and the frame time
+            (classifyEvent.route_detections).
+        analyze_fps: Default FPS budget of a stream.
+        scheduler: Decides which streams are analyzed in each pass.
+        tiler: Applies each stream's tiling and zones around `infer`.
+        clips: Writes event clips; None disables them (default: a new ClipWriter
+            when EVENT_CLIPS is set).
+        store: Keeps the history of every stream's events and detections.
+    """
+
+    def __init__(
+        self,
+        infer: Callable[[List[np.ndarray]], List[Detections]],
+        reason: Callable[[Detections, bool, TemporalState, float], List[AnalyzeResponse]],
+        analyze_fps: float = STREAM_ANALYZE_FPS,
+        scheduler: Optional[FairScheduler] = None,
+        tiler: Optional[TiledInference] = None,
+        clips: Optional[ClipWriter] = _DEFAULT_CLIPS,
+        store: Optional[EventStore] = None,
+    ):
+        self.infer = infer
+        self.tiler = tiler if tiler is not None else TiledInference(infer)
+        if clips is _DEFAULT_CLIPS:
+            clips = ClipWriter() if EVENT_CLIPS else None
+        self.clips = clips
+        self.store = store
+        self.reason = reason
+        self.analyze_fps = analyze_fps
+        self.interval = 1.0 / max(analyze_fps, 1e-6)
+        self.scheduler = scheduler if scheduler is not None else FairScheduler()
+        self._streams: Dict[str, LiveStream] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loop: Optional[threading.Thread] = None
+
+    def start(self, source: str, stream_id: Optional[str] = None, loop: bool = False, mock: bool = False,
+              detect_every: int = TRACK_DETECT_EVERY, motion_gate: bool = MOTION_GATE,
+              motion_threshold: float = MOTION_THRESHOLD, fps: Optional[float] = None,
+              priority: float = 1.0, tiled: bool = TILED_INFERENCE,
+              roi: Optional[Sequence[Polygon]] = None) -> LiveStream:
+        """
+        Starts reading `source` (returns the existing stream if the id is taken).
+
+        With `detect_every` > 1 only every n-th analyzed frame goes through
+        the model; the stream's tracker predicts the ones in between. With
+        `motion_gate`, frames changing less than `motion_threshold` of their
+        pixels reuse the previous detections. `fps` is the stream's FPS
+        budget and `priority` its weight when streams compete for the engine.
+        """
+        stream_id = stream_id or uuid.uuid4().hex[:12]
+        with self._lock:
+            existing = self._streams.get(stream_id)
+            if existing is not None and existing.reader.alive:
+                return existing
+            stream = LiveStream(stream_id, source, loop=loop, mock=mock, detect_every=detect_every,
+                                motion_gate=MotionGate(threshold=motion_threshold) if motion_gate else None,
+                                fps=fps or self.analyze_fps, priority=priority, tiled=tiled, roi=roi,
+                                clips=self.clips)
+            self._streams[stream_id] = stream
+            self.scheduler.register(stream_id, stream.fps, stream.priority)
+            self._ensure_loop()
+        stream.reader.start()
+        return stream
+
+    def stop(self, stream_id: str) -> Optional[LiveStream]:
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+            if stream is not None:
+                self.scheduler.unregister(stream_id)
+        if stream is not None:
+            stream.reader.stop()
+            if stream.recorder is not None:
+                # Events near the end get the clip buffered so far
+                stream.recorder.flush()
+        return stream
+
+    def status(self, stream: LiveStream) -> StreamStatus:
+        return stream.status(self.scheduler.state(stream.id))
+
+    def get(self, stream_id: str) -> Optional[LiveStream]:
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def list(self) -> List[LiveStream]:
+        with self._lock:
+            return list(self._streams.values())
+
+    def shutdown(self):
+        self._stop.set()
+        for stream in self.list():
+            self.stop(stream.id)
+        if self._loop is not None:
+            self._loop.join(timeout=5.0)
+        if self.clips is not None:
+            self.clips.shutdown()
+
+    def _ensure_loop(self):
+        if self._loop is None or not self._loop.is_alive():
+            self._stop.clear()
+            self._loop = threading.Thread(target=self._analyze_loop, name="stream-analysis", daemon=True)
+            self._loop.start()
+
+    def _latest_frames(self) -> List[Tuple[LiveStream, np.ndarray, float]]:
+        """Takes the newest frame of every stream the scheduler picks and drops stale ones."""
+        streams = {stream.id: stream for stream in self.list()}
+        candidates = [(stream_id, captured) for stream_id, captured in
+                      ((stream_id, stream.reader.latest.pending()) for stream_id, stream in streams.items())
+                      if captured is not None]
+        picked, shed = self.scheduler.select(candidates)
+        for stream_id in shed:
+            streams[stream_id].reader.latest.take()
+            streams[stream_id].frames_shed += 1
+            FRAMES.inc(source="stream", kind="shed")
+        frames = []
+        for stream_id in picked:
+            taken = streams[stream_id].reader.latest.take()
+            if taken is not None:
+                frames.append((streams[stream_id], taken[0], taken[1]))
+        return frames
+
+    def _analyze_loop(self):
+        # Each pass is a single forward pass over the newest frame of every
+        # stream the scheduler picked; the loop sleeps until the next stream
+        # is due
+        while not self._stop.is_set():
+            next_due = self.scheduler.next_due()
+            wait = self.interval if next_due is None else next_due - time.monotonic()
+            self._stop.wait(max(_MIN_PASS_INTERVAL_S, wait))
+            due = self._latest_frames()
+            if not due:
+                continue
+            started = time.perf_counter()
+            # Static streams reuse their last detections, and streams between
+            # two detection frames are answered by their tracker
+            plans = [stream.plan(frame) for stream, frame, _ in due]
+            detect = [(stream, frame) for (stream, frame, _), plan in zip(due, plans) if plan == "detect"]
+            # Tiles and zones are cut from the full resolution; other frames are
+            # shrunk to the model's input first
+            inputs = [(frame, 1.0) if stream.tiled or stream.region is not None else _shrink(frame)
+                      for stream, frame in detect]
+            scales = iter([scale for _, scale in inputs])
+            try:
+                inferred = iter(self.tiler([frame for frame, _ in inputs],
+                                           regions=[stream.region for stream, _ in detect],
+                                           tiled=[stream.tiled for stream, _ in detect]) if detect else [])
+            except Exception as e:
+                STAGE_ERRORS.inc(stage="inference")
+                for stream, _, _ in due:
+                    stream.reader.error = f"Inference error: {e}"
+                # The gates took these frames as their reference; the next ones must be analyzed
+                for stream, _ in detect:
+                    if stream.motion_gate is not None:
+                        stream.motion_gate.reset()
+                continue
+            for (stream, _, timestamp), plan in zip(due, plans):
+                # One camera's failure must not stop the loop for the others
+                try:
+                    if plan == "reuse":
+                        frame_detections = stream.last_detections
+                    elif plan == "track":
+                        frame_detections = stream.tracker.predict()
+                        stream.frames_tracked += 1
+                    else:
+                        frame_detections, scale = next(inferred), next(scales)
+                        if scale != 1.0:
+                            frame_detections = frame_detections.rescale(scale)
+                        frame_detections = stream.tracker.update(frame_detections)
+                    stream.last_detections = frame_detections
+                    FRAMES.inc(source="stream", kind=_FRAME_KINDS[plan])
+                    reasoning = time.perf_counter()
+                    responses = self.reason(frame_detections, stream.mock, stream.temporal, timestamp)
+                    STAGE_SECONDS.observe(time.perf_counter() - reasoning, stage="reasoning")
+                    started_events = stream.record(responses, timestamp)
+                    if self.store is not None:
+                        # Reused detections were stored with an earlier frame
+                        if plan != "reuse":
+                            self.store.record_detections(stream.id, timestamp, frame_detections)
+                        self.store.record_events(stream.id, started_events)
+                    self.scheduler.report(stream.id, stream.active_events)
+                except Exception as e:
+                    STAGE_ERRORS.inc(stage="stream")
+                    stream.reader.error = f"Analysis error: {e}"
+            self.scheduler.observe(time.perf_counter() - started, len(due))
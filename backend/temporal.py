@@ -0,0 +1,240 @@
+# backend/temporal.py
+"""
+Temporal reasoning over a sliding window of detections.
+
+One TemporalState follows one stream (or one uploaded clip). For every
+frame it updates small per-track records and a sliding fire-area trend in
+O(1) per detection, and annotates the detections with how long a person
+has been horizontal or motionless and how fast the fire area is growing.
+The event handlers use those durations instead of judging single frames,
+so one noisy box no longer raises an alert and sampling can be sparser.
+"""
+
+import collections
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detections import Detections
+
+# Recent observations kept per track: (timestamp, cx, cy, w, h, conf)
+TRACK_HISTORY = 32
+# Tracks not seen for this long are forgotten
+TRACK_TTL_S = 5.0
+# A person whose center moves less than this fraction of their box
+# diagonal is considered motionless
+MOTION_TOLERANCE = 0.05
+# Seconds of fire-area history the growth trend is fitted over
+FIRE_GROWTH_WINDOW_S = 10.0
+
+Observation = Tuple[float, float, float, float, float, float]
+
+
+class SlidingTrend:
+    """
+    Least-squares slope of (t, y) samples over a sliding time window.
+
+    Running sums are updated as samples enter and leave the window, so each
+    update is O(1) amortized regardless of the window length.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window = window_seconds
+        self._samples: Deque[Tuple[float, float]] = collections.deque()
+        self._origin: Optional[float] = None
+        self._n = 0
+        self._st = self._sy = self._stt = self._sty = 0.0
+
+    def add(self, t: float, y: float):
+        if self._origin is None:
+            # Sums are kept relative to the first sample for precision
+            self._origin = t
+        self._samples.append((t, y))
+        self._accumulate(t - self._origin, y, 1)
+        while t - self._samples[0][0] > self.window:
+            old_t, old_y = self._samples.popleft()
+            self._accumulate(old_t - self._origin, old_y, -1)
+
+    def _accumulate(self, t: float, y: float, sign: int):
+        self._n += sign
+        self._st += sign * t
+        self._sy += sign * y
+        self._stt += sign * t * t
+        self._sty += sign * t * y
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def span(self) -> float:
+        """Seconds between the oldest and newest sample in the window."""
+        return self._samples[-1][0] - self._samples[0][0] if self._samples else 0.0
+
+    @property
+    def first(self) -> float:
+        return self._samples[0][1] if self._samples else 0.0
+
+    @property
+    def last(self) -> float:
+        return self._samples[-1][1] if self._samples else 0.0
+
+    @property
+    def slope(self) -> float:
+        """Change of y per second; 0.0 until there are two distinct times."""
+        denominator = self._n * self._stt - self._st * self._st
+        if self._n < 2 or abs(denominator) < 1e-12:
+            return 0.0
+        return (self._n * self._sty - self._st * self._sy) / denominator
+
+
+class TrackState:
+    """Incrementally maintained state of one tracked person."""
+
+    __slots__ = ("history", "first_seen", "last_seen", "horizontal_since",
+                 "anchor", "still_since")
+
+    def __init__(self, timestamp: float, center: Tuple[float, float]):
+        self.history: Deque[Observation] = collections.deque(maxlen=TRACK_HISTORY)
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.horizontal_since: Optional[float] = None
+        # Position the person has stayed close to since `still_since`
+        self.anchor = center
+        self.still_since = timestamp
+
+
+@dataclass
+class FrameTemporal:
+    """
+    Temporal annotations of one frame, as arrays aligned with its detection
+    rows. Person columns are -1 / 0 on rows that are not persons.
+    """
+    track_ids: np.ndarray
+    seen_seconds: np.ndarray
+    horizontal_seconds: np.ndarray
+    motionless_seconds: np.ndarray
+    horizontal: np.ndarray
+    # Fire-area trend, empty until there are two samples
+    fire: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def empty(cls, rows: int) -> "FrameTemporal":
+        return cls(
+            track_ids=np.full(rows, -1, dtype=np.int64),
+            seen_seconds=np.zeros(rows),
+            horizontal_seconds=np.zeros(rows),
+            motionless_seconds=np.zeros(rows),
+            horizontal=np.zeros(rows, dtype=bool),
+        )
+
+    def annotations(self, labels: np.ndarray) -> List[Dict[str, Any]]:
+        """Per-row dicts in the shape the legacy event handlers read."""
+        annotations: List[Dict[str, Any]] = [{} for _ in range(len(labels))]
+        for row in np.flatnonzero(labels == "person").tolist():
+            annotations[row].update({
+                "track_id": int(self.track_ids[row]),
+                "seen_seconds": float(self.seen_seconds[row]),
+                "horizontal_seconds": float(self.horizontal_seconds[row]),
+                "horizontal": bool(self.horizontal[row]),
+                "motionless_seconds": float(self.motionless_seconds[row]),
+            })
+        if self.fire:
+            for row in np.flatnonzero(labels == "fire").tolist():
+                annotations[row].update(self.fire)
+        return annotations
+
+
+class TemporalState:
+    """
+    Per-stream temporal state engine.
+
+    Persons are keyed by the detections' track ids when a tracker provides
+    them, otherwise by their rank among the frame's persons (left to right),
+    which is only reliable for a single person in view.
+    """
+
+    def __init__(self, fire_window_seconds: float = FIRE_GROWTH_WINDOW_S, track_ttl: float = TRACK_TTL_S):
+        self.track_ttl = track_ttl
+        self.tracks: Dict[int, TrackState] = {}
+        self.fire_area = SlidingTrend(fire_window_seconds)
+
+    def history(self, track_id: int) -> List[Observation]:
+        """Recent (timestamp, cx, cy, w, h, conf) observations of a track."""
+        track = self.tracks.get(track_id)
+        return list(track.history) if track is not None else []
+
+    def update(self, detections: Detections, timestamp: float,
+               horizontal: Optional[np.ndarray] = None) -> FrameTemporal:
+        """
+        Folds one frame into the state.
+
+        Args:
+            detections: The frame's detections.
+            timestamp: Time of the frame in seconds.
+            horizontal: (N,) mask of the rows lying down, from the enabled
+                analyzers' posture test (see analyzers.py). None when no
+                analyzer needs it: then nobody is timed as horizontal.
+
+        Returns:
+            The frame's temporal annotations, aligned with its rows.
+        """
+        frame = FrameTemporal.empty(len(detections))
+        labels = detections.labels
+        wh = detections.wh
+        centers = detections.centers
+
+        # Fire: one trend sample per frame (0 when there is no fire)
+        fire_rows = np.flatnonzero(labels == "fire")
+        self.fire_area.add(timestamp, float((wh[fire_rows, 0] * wh[fire_rows, 1]).sum()))
+        if len(self.fire_area) >= 2:
+            first = self.fire_area.first
+            frame.fire = {
+                "fire_area": self.fire_area.last,
+                "fire_growth_rate": self.fire_area.slope,
+                "fire_growth_ratio": self.fire_area.last / first if first > 0 else None,
+                "fire_window_seconds": self.fire_area.span,
+            }
+
+        # Persons: O(1) update of each one's track
+        person_rows = np.flatnonzero(labels == "person")
+        if detections.track_ids is not None:
+            keys = detections.track_ids[person_rows].tolist()
+        else:
+            keys = np.argsort(np.argsort(centers[person_rows, 0])).tolist()
+        if horizontal is not None:
+            frame.horizontal[person_rows] = horizontal[person_rows]
+        horizontal = frame.horizontal[person_rows].tolist()
+        diagonals = np.hypot(wh[person_rows, 0], wh[person_rows, 1]).tolist()
+
+        for row, key, is_horizontal, diagonal in zip(person_rows.tolist(), keys, horizontal, diagonals):
+            cx, cy = centers[row].tolist()
+            track = self.tracks.get(key)
+            if track is None:
+                track = self.tracks[key] = TrackState(timestamp, (cx, cy))
+            track.last_seen = timestamp
+            track.history.append((timestamp, cx, cy, *wh[row].tolist(), float(detections.conf[row])))
+
+            if is_horizontal:
+                if track.horizontal_since is None:
+                    track.horizontal_since = timestamp
+            else:
+                track.horizontal_since = None
+
+            if np.hypot(cx - track.anchor[0], cy - track.anchor[1]) > MOTION_TOLERANCE * diagonal:
+                track.anchor = (cx, cy)
+                track.still_since = timestamp
+
+            frame.track_ids[row] = key
+            frame.seen_seconds[row] = timestamp - track.first_seen
+            if track.horizontal_since is not None:
+                frame.horizontal_seconds[row] = timestamp - track.horizontal_since
+            frame.motionless_seconds[row] = timestamp - track.still_since
+
+        self._expire(timestamp)
+        return frame
+
+    def _expire(self, timestamp: float):
+        stale = [key for key, track in self.tracks.items() if timestamp - track.last_seen > self.track_ttl]
+        for key in stale:
+            del self.tracks[key]
@@ -0,0 +1,6 @@
+# backend/tests/conftest.py
+import os
+import sys
+
+# The backend's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+# backend/tests/test_frame_cache.py
+import numpy as np
+import pytest
+
+import classifyEvent
+from cache import LRUCache, frame_digest
+from detections import Detections
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """Frames that reached the (fake) model, with a fresh frame cache."""
+    calls = []
+
+    def analyze_frames(frames):
+        calls.extend(frames)
+        return [Detections.empty({0: "person"}) for _ in frames]
+
+    monkeypatch.setattr(classifyEvent, "analyze_frames", analyze_frames)
+    monkeypatch.setattr(classifyEvent, "cache_namespace", lambda: "test")
+    monkeypatch.setattr(classifyEvent, "frame_cache", LRUCache(16 * 1024 * 1024))
+    return calls
+
+
+def _frame(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(40, 90, size=(720, 1280, 3), dtype=np.uint8)
+
+
+def test_identical_frame_hits_the_cache(model_calls):
+    frame = _frame()
+    classifyEvent.cached_analyze_frames([frame])
+    classifyEvent.cached_analyze_frames([frame.copy()])
+    assert len(model_calls) == 1
+
+
+def test_frame_with_a_small_added_object_misses_the_cache(model_calls):
+    empty = _frame()
+    with_object = empty.copy()
+    # A distant flame: 40x60 px of orange in a 720p frame
+    with_object[400:460, 900:940] = (0, 140, 255)
+
+    classifyEvent.cached_analyze_frames([empty])
+    classifyEvent.cached_analyze_frames([with_object])
+    assert len(model_calls) == 2
+    assert model_calls[1] is with_object
+
+
+def test_frame_digest_covers_shape_and_views():
+    frame = _frame()
+    assert frame_digest(frame) != frame_digest(frame.reshape(1280, 720, 3))
+    # A non-contiguous view hashes like the copy of its pixels
+    assert frame_digest(frame[:, 100:400]) == frame_digest(frame[:, 100:400].copy())
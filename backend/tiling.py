@@ -0,0 +1,317 @@
+# backend/tiling.py
+"""
+Tiled inference and region-of-interest masks for high-resolution frames.
+
+The models see every frame letterboxed to 640 pixels, so on a 4K camera a
+distant person or a small flame shrinks to a handful of pixels and is
+missed. TiledInference cuts large frames into overlapping tiles of about
+the model's input size, sends all tiles of all frames to the model in one
+call (so they share forward passes), and merges the detections back onto
+the frame. A pass over the whole frame is added by default, so objects
+larger than a tile are still found in one piece.
+
+A RegionMask restricts a camera to the zones that matter (the pool of a
+pool camera): only the bounding box of its zones is cut out, tiles that
+miss every zone are never sent to the model, pixels outside the zones are
+blanked before inference, and detections centered outside are dropped.
+
+Across tiles, duplicates are merged by intersection over the smaller box,
+not IoU: an object cut by a tile border yields a truncated box that
+overlaps the full one by a small IoU but lies almost entirely inside it.
+The merged box is the union of both.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from preprocess import PAD_VALUE
+
+# Tile frames whose longest side is above TILE_MIN_SIDE (streams can override it)
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "0") == "1"
+# Side of a tile in pixels; the model's input size keeps tiles at full resolution
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+# Fraction of a tile shared with its neighbours
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+# Frames (or ROI boxes) up to this longest side are analyzed whole
+TILE_MIN_SIDE = int(os.getenv("TILE_MIN_SIDE", "1280"))
+# Also analyze the whole frame, for objects larger than a tile
+TILE_FULL_FRAME = os.getenv("TILE_FULL_FRAME", "1") == "1"
+# Detections of the same class from different tiles that overlap by more
+# than this fraction of the smaller box are merged
+TILE_MERGE_IOS = float(os.getenv("TILE_MERGE_IOS", "0.6"))
+
+# (x, y, width, height) of a crop in frame pixels
+Window = Tuple[int, int, int, int]
+Polygon = Sequence[Sequence[float]]
+
+
+def tile_windows(width: int, height: int, size: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                 origin: Tuple[int, int] = (0, 0)) -> List[Window]:
+    """
+    Overlapping tiles covering a width x height area. All tiles have the
+    same size (the last row and column are shifted back inside the area),
+    so they letterbox into one rectangular batch.
+    """
+    def starts(length: int) -> List[int]:
+        if length <= size:
+            return [0]
+        step = max(1, int(size * (1.0 - overlap)))
+        positions = list(range(0, length - size, step))
+        return positions + [length - size]
+
+    tile_w, tile_h = min(size, width), min(size, height)
+    x0, y0 = origin
+    return [(x0 + x, y0 + y, tile_w, tile_h) for y in starts(height) for x in starts(width)]
+
+
+class RegionMask:
+    """
+    Zones of a camera as polygons in normalized [0, 1] (x, y) coordinates.
+
+    Args:
+        polygons: One or more polygons of at least three points each.
+    """
+
+    def __init__(self, polygons: Sequence[Polygon]):
+        self.polygons = [np.asarray(polygon, dtype=np.float32).reshape(-1, 2) for polygon in polygons]
+        if not self.polygons or any(len(polygon) < 3 for polygon in self.polygons):
+            raise ValueError("A region needs at least one polygon of three or more points")
+        self._masks: Dict[Tuple[int, int], Tuple[np.ndarray, Window]] = {}
+        # Crops of a frame size and tiling setup; the zones never change
+        self.plans: Dict[tuple, List["_Crop"]] = {}
+        self._lock = threading.Lock()
+
+    def mask(self, height: int, width: int) -> Tuple[np.ndarray, Window]:
+        """(height, width) uint8 mask of the zones and its bounding box, cached per frame size."""
+        with self._lock:
+            cached = self._masks.get((height, width))
+            if cached is None:
+                mask = np.zeros((height, width), dtype=np.uint8)
+                scale = np.array([width, height], dtype=np.float32)
+                cv2.fillPoly(mask, [np.round(polygon * scale).astype(np.int32) for polygon in self.polygons], 1)
+                cached = self._masks[(height, width)] = (mask, cv2.boundingRect(mask))
+            return cached
+
+    def contains(self, points: np.ndarray, height: int, width: int) -> np.ndarray:
+        """Whether each (x, y) pixel point lies inside a zone."""
+        mask, _ = self.mask(height, width)
+        xs = np.clip(points[:, 0].astype(np.int64), 0, width - 1)
+        ys = np.clip(points[:, 1].astype(np.int64), 0, height - 1)
+        return mask[ys, xs].astype(bool)
+
+
+@dataclass
+class _Crop:
+    window: Window
+    # Zone mask of the window when only part of it is inside a zone
+    mask: Optional[np.ndarray] = None
+
+
+def _plan(shape: Tuple[int, int], region: Optional[RegionMask], tiled: bool, size: int, overlap: float,
+          min_side: int, full_frame: bool) -> List[_Crop]:
+    if region is None:
+        return _plan_crops(shape, None, tiled, size, overlap, min_side, full_frame)
+    key = (shape, tiled, size, overlap, min_side, full_frame)
+    plan = region.plans.get(key)
+    if plan is None:
+        plan = region.plans[key] = _plan_crops(shape, region, tiled, size, overlap, min_side, full_frame)
+    return plan
+
+
+def _plan_crops(shape: Tuple[int, int], region: Optional[RegionMask], tiled: bool, size: int, overlap: float,
+                min_side: int, full_frame: bool) -> List[_Crop]:
+    height, width = shape
+    area: Window = (0, 0, width, height)
+    mask = None
+    if region is not None:
+        mask, area = region.mask(height, width)
+        if area[2] == 0 or area[3] == 0:
+            return []
+    x, y, w, h = area
+    windows = [area]
+    if tiled and max(w, h) > min_side:
+        tiles = tile_windows(w, h, size, overlap, origin=(x, y))
+        if len(tiles) > 1:
+            windows = tiles + ([area] if full_frame else [])
+
+    crops = []
+    for window in windows:
+        if mask is None:
+            crops.append(_Crop(window))
+            continue
+        wx, wy, ww, wh = window
+        inside = mask[wy:wy + wh, wx:wx + ww]
+        covered = int(np.count_nonzero(inside))
+        if covered == 0:
+            continue
+        crops.append(_Crop(window, None if covered == inside.size else inside))
+    return crops
+
+
+def _cut(frame: np.ndarray, crop: _Crop) -> np.ndarray:
+    x, y, w, h = crop.window
+    pixels = frame[y:y + h, x:x + w]
+    if crop.mask is None:
+        return pixels
+    blanked = np.full_like(pixels, PAD_VALUE)
+    cv2.copyTo(pixels, crop.mask, blanked)
+    return blanked
+
+
+def _to_frame(detections: Detections, window: Window, image_size: Tuple[int, int]) -> Detections:
+    """Moves a crop's detections onto the full frame."""
+    x, y, w, h = window
+    if (x, y) == (0, 0) and (h, w) == image_size:
+        return detections
+    height, width = image_size
+    keypoints = detections.keypoints
+    if keypoints is not None:
+        keypoints = keypoints.copy()
+        keypoints[..., 0] = (keypoints[..., 0] * w + x) / width
+        keypoints[..., 1] = (keypoints[..., 1] * h + y) / height
+    return Detections(
+        boxes=detections.boxes + np.array([x, y, x, y], dtype=np.float32),
+        conf=detections.conf,
+        cls=detections.cls,
+        names=detections.names,
+        keypoints=keypoints,
+        track_ids=detections.track_ids,
+        image_size=image_size,
+    )
+
+
+def _ios(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """Intersection of `box` with each of `boxes` over the smaller of the two areas."""
+    top_left = np.maximum(box[:2], boxes[:, :2])
+    bottom_right = np.minimum(box[2:], boxes[:, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    smaller = np.minimum(np.prod(box[2:] - box[:2]), np.prod(boxes[:, 2:] - boxes[:, :2], axis=1))
+    return intersection / np.maximum(smaller, 1e-6)
+
+
+def cross_tile_merge(detections: Detections, sources: np.ndarray,
+                     merge_ios: float = TILE_MERGE_IOS) -> Detections:
+    """
+    Merges detections of the same object found in several crops.
+
+    Rows are visited by decreasing confidence (larger boxes first on ties);
+    a row absorbs every lower ranked row of the same class from another
+    crop whose box lies more than `merge_ios` inside the smaller of the
+    two, and its box grows to cover them (then absorbs again, so the pieces
+    of an object cut by several tile borders end up as one box). Rows from
+    the same crop are left alone: the model's own NMS already ran there,
+    and what remains are distinct objects.
+
+    Args:
+        detections: Detections of all crops of one frame, in frame pixels.
+        sources: (N,) index of the crop each row came from.
+        merge_ios: Intersection over the smaller box above which two rows
+            are the same object.
+    """
+    if len(detections) < 2 or len(np.unique(sources)) < 2:
+        return detections
+    area = np.prod(detections.wh, axis=1)
+    order = np.lexsort((-area, -detections.conf))
+    detections = detections.select(order)
+    sources = sources[order]
+    boxes = detections.boxes.copy()
+    cls = detections.cls
+
+    # Pairwise overlaps of all rows at once; only rows that overlap another
+    # crop's row of their class need the merge loop below
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    ios = intersection / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-6)
+    overlapping = (ios > merge_ios) & (cls[:, None] == cls[None, :]) & (sources[:, None] != sources[None, :])
+
+    keep = np.ones(len(detections), dtype=bool)
+    for row in np.flatnonzero(overlapping.any(axis=1)):
+        if not keep[row]:
+            continue
+        members = [sources[row]]
+        while True:
+            candidates = keep & (cls == cls[row]) & ~np.isin(sources, members)
+            candidates[:row + 1] = False
+            candidates = np.flatnonzero(candidates)
+            absorbed = candidates[_ios(boxes[row], boxes[candidates]) > merge_ios] if len(candidates) else candidates
+            if not len(absorbed):
+                break
+            boxes[row, :2] = np.minimum(boxes[row, :2], boxes[absorbed, :2].min(axis=0))
+            boxes[row, 2:] = np.maximum(boxes[row, 2:], boxes[absorbed, 2:].max(axis=0))
+            members.extend(sources[absorbed].tolist())
+            keep[absorbed] = False
+
+    merged = detections.select(keep)
+    merged.boxes = boxes[keep]
+    return merged
+
+
+class TiledInference:
+    """
+    Wraps a batched inference function with tiling and region masks.
+
+    Frames without a region and below the tiling threshold go through as
+    they are, so wrapping costs nothing when neither is used.
+
+    Args:
+        infer: Batched inference function (list of frames -> Detections each).
+        size: Tile side in pixels.
+        overlap: Fraction of a tile shared with its neighbours.
+        min_side: Frames (or region boxes) up to this longest side are not tiled.
+        full_frame: Also analyze the whole frame (or region box) when tiling.
+        merge_ios: See `cross_tile_merge`.
+    """
+
+    def __init__(self, infer: Callable[[List[np.ndarray]], List[Detections]], size: int = TILE_SIZE,
+                 overlap: float = TILE_OVERLAP, min_side: int = TILE_MIN_SIDE, full_frame: bool = TILE_FULL_FRAME,
+                 merge_ios: float = TILE_MERGE_IOS):
+        self.infer = infer
+        self.size = size
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.min_side = min_side
+        self.full_frame = full_frame
+        self.merge_ios = merge_ios
+
+    def __call__(self, frames: List[np.ndarray], regions: Optional[Sequence[Optional[RegionMask]]] = None,
+                 tiled: Optional[Sequence[bool]] = None) -> List[Detections]:
+        """
+        Analyzes `frames`, each with its own region (or None) and tiling flag.
+
+        Returns:
+            One Detections per frame, in frame pixels.
+        """
+        regions = regions if regions is not None else [None] * len(frames)
+        tiled = tiled if tiled is not None else [TILED_INFERENCE] * len(frames)
+        plans = [_plan(frame.shape[:2], region, tile, self.size, self.overlap, self.min_side, self.full_frame)
+                 for frame, region, tile in zip(frames, regions, tiled)]
+        if all(len(plan) == 1 and plan[0].mask is None and plan[0].window == (0, 0, frame.shape[1], frame.shape[0])
+               for frame, plan in zip(frames, plans)):
+            return self.infer(frames)
+
+        crops = [_cut(frame, crop) for frame, plan in zip(frames, plans) for crop in plan]
+        inferred = iter(self.infer(crops) if crops else [])
+        results = []
+        for frame, plan, region in zip(frames, plans, regions):
+            image_size = frame.shape[:2]
+            parts = [_to_frame(next(inferred), crop.window, image_size) for crop in plan]
+            if not parts:
+                # The region lies outside this frame
+                empty = Detections.empty()
+                empty.image_size = image_size
+                results.append(empty)
+                continue
+            merged = Detections.concat(parts)
+            sources = np.repeat(np.arange(len(parts)), [len(part) for part in parts])
+            merged = cross_tile_merge(merged, sources, self.merge_ios)
+            if region is not None and len(merged):
+                merged = merged.select(region.contains(merged.centers, *image_size))
+            results.append(merged)
+        return results
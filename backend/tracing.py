@@ -0,0 +1,165 @@
+# backend/tracing.py
+"""
+Per-request stage timings and an on-demand sampling profiler.
+
+A Trace collects how long one request spent in each stage (upload, queue,
+open, decode, inference, reasoning...). Requests that send `X-Trace: 1` get
+it back in a `Server-Timing` header, which browser dev tools show as a
+waterfall. Stages that overlap (the upload is still arriving while frames
+are decoded) are reported as they are, not cut to fit.
+
+The SamplingProfiler snapshots the stacks of every thread at a fixed
+interval while it runs and aggregates them in the "collapsed stacks"
+format flamegraph tools read. It is started and stopped at runtime through
+the /debug/profiler endpoints (when PROFILER_ENDPOINTS=1).
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Request header that turns tracing on for one request
+TRACE_HEADER = "x-trace"
+# Serve the /debug/profiler endpoints
+PROFILER_ENDPOINTS = os.getenv("PROFILER_ENDPOINTS", "0") == "1"
+# Default time between two profiler samples
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+# Longest a profile may run before it stops by itself
+PROFILER_MAX_SECONDS = 300.0
+# Deepest stack kept per sample
+_MAX_DEPTH = 64
+
+
+class Trace:
+    """Stage durations of one request. Safe to update from several threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._spans: Dict[str, List[float]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            span = self._spans.setdefault(stage, [0.0, 0])
+            span[0] += seconds
+            span[1] += 1
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def spans(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            spans = {stage: {"ms": seconds * 1000.0, "count": count}
+                     for stage, (seconds, count) in self._spans.items()}
+        spans["total"] = {"ms": (time.perf_counter() - self.started) * 1000.0, "count": 1}
+        return spans
+
+    def server_timing(self) -> str:
+        """The spans as a Server-Timing header value."""
+        entries = [f"{stage};dur={span['ms']:.1f}" for stage, span in self.spans().items()]
+        if self.error:
+            # Header values must be Latin-1; error messages may hold anything
+            description = self.error.replace('"', "'").replace("\n", " ")[:200]
+            description = description.encode("ascii", "replace").decode()
+            entries.append(f'error;desc="{description}"')
+        return ", ".join(entries)
+
+
+def wants_trace(headers: Any) -> bool:
+    return (headers.get(TRACE_HEADER) or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler over all threads of the process.
+
+    Args:
+        interval_ms: Time between two samples.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = max(0.5, interval_ms) / 1000.0
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._stacks: "collections.Counter[str]" = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, max_seconds: float = PROFILER_MAX_SECONDS) -> "SamplingProfiler":
+        if self.running:
+            return self
+        self._stop.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._thread = threading.Thread(target=self._run, args=(max_seconds,), name="sampling-profiler",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        return self
+
+    def _run(self, max_seconds: float):
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            collapsed = []
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < _MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                collapsed.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(collapsed)
+                self.samples += 1
+        self.stopped_at = time.time()
+
+    def collapsed(self) -> str:
+        """One "thread;outer;...;inner count" line per distinct stack."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def top(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """Functions seen most often at the top of a stack, with their sample counts."""
+        leaves: "collections.Counter[str]" = collections.Counter()
+        with self._lock:
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000.0,
+            "samples": self.samples,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "top": [{"frame": frame, "samples": count} for frame, count in self.top(10)],
+        }
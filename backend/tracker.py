@@ -0,0 +1,245 @@
+# backend/tracker.py
+"""
+SORT-style multi-object tracker.
+
+Every track is a constant-velocity Kalman filter over its box center, area
+and aspect ratio (Bewley et al., "Simple Online and Realtime Tracking").
+All tracks are predicted and corrected together as NumPy arrays, and each
+frame's detections are matched to tracks of the same class by IoU. Besides
+giving every person and fire/smoke region a stable id, the predictions can
+stand in for the model on frames it does not see, so a fixed camera only
+needs a forward pass every few analyzed frames.
+"""
+
+import os
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from detections import Detections
+
+try:  # SciPy gives optimal matching; greedy matching is used without it
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # pragma: no cover - depends on the deployment
+    linear_sum_assignment = None
+
+# Run the model on every K-th analyzed frame and track in between (1 = every frame)
+TRACK_DETECT_EVERY = int(os.getenv("TRACK_DETECT_EVERY", "1"))
+# Classes that get track ids
+TRACKED_CLASSES = ("person", "fire", "smoke")
+# Least IoU between a track's predicted box and a detection to match them
+TRACK_IOU_THRESHOLD = 0.3
+# Detection frames a track may go unmatched before it is dropped
+TRACK_MAX_AGE = 3
+# Matches a track needs before its predictions stand in for detections
+# once it has missed a detection frame
+TRACK_MIN_HITS = 2
+
+# Kalman model: state (cx, cy, area, aspect, vx, vy, v_area), measurement
+# (cx, cy, area, aspect); noise levels as in the SORT reference code
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1.0
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 1e-2, 1e-2, 1e-4])
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes, as an (N, M) array."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = np.clip(a[:, 2:] - a[:, :2], 0, None).prod(axis=1)
+    area_b = np.clip(b[:, 2:] - b[:, :2], 0, None).prod(axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _assign(iou: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Matched (row, column) index arrays, keeping only pairs with IoU >= threshold."""
+    if iou.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+    else:
+        # Greedy: best-overlapping pairs first
+        flat = iou.ravel()
+        candidates = np.flatnonzero(flat >= threshold)
+        candidates = candidates[np.argsort(-flat[candidates], kind="stable")]
+        used_rows, used_cols, rows, cols = set(), set(), [], []
+        for row, col in zip(*np.unravel_index(candidates, iou.shape)):
+            if row not in used_rows and col not in used_cols:
+                used_rows.add(row)
+                used_cols.add(col)
+                rows.append(row)
+                cols.append(col)
+        rows, cols = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+    keep = iou[rows, cols] >= threshold
+    return rows[keep], cols[keep]
+
+
+def _to_measurements(boxes: np.ndarray) -> np.ndarray:
+    wh = boxes[:, 2:4] - boxes[:, 0:2]
+    centers = boxes[:, 0:2] + wh / 2
+    area = wh[:, 0] * wh[:, 1]
+    aspect = wh[:, 0] / np.maximum(wh[:, 1], 1e-6)
+    return np.column_stack([centers, area, aspect]).astype(np.float64)
+
+
+def _to_boxes(state: np.ndarray) -> np.ndarray:
+    area = np.maximum(state[:, 2], 0.0)
+    w = np.sqrt(area * np.maximum(state[:, 3], 0.0))
+    h = area / np.maximum(w, 1e-6)
+    cx, cy = state[:, 0], state[:, 1]
+    return np.column_stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]).astype(np.float32)
+
+
+class Tracker:
+    """
+    Tracks the objects of one stream (or one clip) across frames.
+
+    Call `update` with the model's detections on frames that went through
+    it, and `predict` on frames that did not. Each call advances the tracks
+    by one frame, so both must be called for every analyzed frame, in order.
+
+    Args:
+        classes: Labels that are tracked; other rows get track id -1.
+        iou_threshold: Least IoU for a detection to continue a track.
+        max_age: Detection frames a track survives without a match.
+        min_hits: Matches before `predict` keeps reporting a track that
+            missed the last detection frame.
+    """
+
+    def __init__(
+        self,
+        classes: Sequence[str] = TRACKED_CLASSES,
+        iou_threshold: float = TRACK_IOU_THRESHOLD,
+        max_age: int = TRACK_MAX_AGE,
+        min_hits: int = TRACK_MIN_HITS,
+    ):
+        self.classes = tuple(classes)
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self._names: Dict[int, str] = {}
+        self._next_id = 1
+        # One row per live track
+        self._x = np.zeros((0, 7))
+        self._p = np.zeros((0, 7, 7))
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._cls = np.zeros(0, dtype=np.int32)
+        self._conf = np.zeros(0, dtype=np.float32)
+        self._hits = np.zeros(0, dtype=np.int64)
+        self._misses = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return int(self._ids.shape[0])
+
+    def predict(self) -> Detections:
+        """
+        Advances every track one frame without a detection.
+
+        Returns:
+            The predicted boxes of the tracks matched on the last detection
+            frame or confirmed earlier, with their last confidence and their
+            track ids.
+        """
+        self._advance()
+        keep = (self._hits >= self.min_hits) | (self._misses == 0)
+        return Detections(
+            boxes=_to_boxes(self._x[keep]),
+            conf=self._conf[keep],
+            cls=self._cls[keep],
+            names=self._names,
+            track_ids=self._ids[keep],
+        )
+
+    def update(self, detections: Detections) -> Detections:
+        """
+        Advances every track one frame and matches it to `detections`.
+
+        Returns:
+            The same detections with `track_ids` set (-1 for rows of classes
+            that are not tracked).
+        """
+        self._advance()
+        if detections.names:
+            self._names = detections.names
+
+        rows_tracked = np.flatnonzero(np.isin(detections.labels, self.classes))
+        boxes = detections.boxes[rows_tracked]
+        classes = detections.cls[rows_tracked]
+
+        iou = iou_matrix(_to_boxes(self._x), boxes)
+        iou[self._cls[:, None] != classes[None, :]] = 0.0
+        matched, columns = _assign(iou, self.iou_threshold)
+
+        track_ids = np.full(len(detections), -1, dtype=np.int64)
+        track_ids[rows_tracked[columns]] = self._ids[matched]
+        self._correct(matched, _to_measurements(boxes[columns]))
+        self._conf[matched] = detections.conf[rows_tracked[columns]]
+        self._hits[matched] += 1
+        unmatched_tracks = np.ones(len(self), dtype=bool)
+        unmatched_tracks[matched] = False
+        self._misses[matched] = 0
+        self._misses[unmatched_tracks] += 1
+
+        fresh = np.ones(len(rows_tracked), dtype=bool)
+        fresh[columns] = False
+        new_rows = rows_tracked[fresh]
+        track_ids[new_rows] = self._spawn(detections.boxes[new_rows], detections.cls[new_rows],
+                                          detections.conf[new_rows])
+
+        alive = self._misses <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+
+        return Detections(
+            boxes=detections.boxes,
+            conf=detections.conf,
+            cls=detections.cls,
+            names=detections.names,
+            keypoints=detections.keypoints,
+            track_ids=track_ids,
+            image_size=detections.image_size,
+        )
+
+    def _advance(self):
+        if not len(self):
+            return
+        # Keep the predicted area from going negative
+        shrinking = self._x[:, 2] + self._x[:, 6] <= 0
+        self._x[shrinking, 6] = 0.0
+        self._x = self._x @ _F.T
+        self._p = _F @ self._p @ _F.T + _Q
+
+    def _correct(self, rows: np.ndarray, z: np.ndarray):
+        if not len(rows):
+            return
+        x, p = self._x[rows], self._p[rows]
+        innovation = z - x[:, :4]
+        s = p[:, :4, :4] + _R
+        gain = p[:, :, :4] @ np.linalg.inv(s)
+        self._x[rows] = x + np.einsum("tij,tj->ti", gain, innovation)
+        self._p[rows] = p - gain @ p[:, :4, :]
+
+    def _spawn(self, boxes: np.ndarray, classes: np.ndarray, conf: np.ndarray) -> np.ndarray:
+        count = len(boxes)
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._next_id += count
+        state = np.zeros((count, 7))
+        state[:, :4] = _to_measurements(boxes)
+        self._x = np.concatenate([self._x, state])
+        self._p = np.concatenate([self._p, np.broadcast_to(_P0, (count, 7, 7))])
+        self._ids = np.concatenate([self._ids, ids])
+        self._cls = np.concatenate([self._cls, classes.astype(np.int32)])
+        self._conf = np.concatenate([self._conf, conf.astype(np.float32)])
+        self._hits = np.concatenate([self._hits, np.ones(count, dtype=np.int64)])
+        self._misses = np.concatenate([self._misses, np.zeros(count, dtype=np.int64)])
+        return ids
+
+    def _keep(self, mask: np.ndarray):
+        self._x, self._p = self._x[mask], self._p[mask]
+        self._ids, self._cls, self._conf = self._ids[mask], self._cls[mask], self._conf[mask]
+        self._hits, self._misses = self._hits[mask], self._misses[mask]
@@ -1,7 +1,17 @@
 # backend/vision.py
-from typing import List, Dict, Any
+import logging
+import os
+from typing import List, Any, Optional, Sequence
 import cv2
-from ultralytics import YOLO
+import numpy as np
+from detections import Detections
+from backends import DEFAULT_BACKEND, DEFAULT_INT8, load_model
+from preprocess import PREPROCESS_BUFFERS, Letterboxer, restore
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of frames sent through the model in one forward pass
+DEFAULT_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
 
 class VisionEngine:
     """
@@ -9,16 +19,69 @@ class VisionEngine:
     This separates the model from the API, improving
     maintainability and testability.
     """
-    def __init__(self, model_name: str = 'yolov8n.pt'):
+    def __init__(self, model_name: str = 'yolov8n.pt', batch_size: int = DEFAULT_BATCH_SIZE,
+                 classes: Optional[Sequence[str]] = None, backend: str = DEFAULT_BACKEND,
+                 int8: bool = DEFAULT_INT8, preallocate: bool = PREPROCESS_BUFFERS, validate: bool = True):
         """
         Loads the YOLO model during object initialization.
+
+        Args:
+            model_name: Weights to load.
+            batch_size: Most frames per forward pass.
+            classes: Labels to keep; others are dropped inside the model's
+                NMS. None keeps every class.
+            backend: "torch", "onnx" or "openvino". Exported backends fall
+                back to torch when they cannot be used (see backends.py).
+            int8: Run an INT8-quantized export.
+            preallocate: Letterbox frames into a reused input tensor instead
+                of letting ultralytics allocate new arrays on every call.
+            validate: Check an exported backend's runtime while loading.
+                False leaves it to `warmup`, which then falls back to torch
+                (see load_model).
         """
-        self.model = YOLO(model_name)
+        self.batch_size = max(1, batch_size)
+        self.model, self.backend = load_model(model_name, backend, int8=int8, batch_size=self.batch_size,
+                                              validate=validate)
+        self.model_name = model_name
         # Note: 'yolov8n.pt' is a good general-purpose model.
         # 'yolov8n-pose.pt' is for pose estimation (falls, drowning).
-        # We can switch models easily here.
+        # Which analyzer uses which model is configured in analyzers.py.
+        self.classes = classes
+        self.class_ids = self._class_ids()
+        self.letterboxer = Letterboxer(self.batch_size) if preallocate else None
+
+    def _class_ids(self) -> Optional[List[int]]:
+        if self.classes is None:
+            return None
+        wanted = set(self.classes)
+        return [i for i, name in self.model.names.items() if name in wanted]
+
+    def warmup(self, size: int = 640):
+        """
+        Runs one blank frame through the model, so one-time setup (layer
+        fusion, runtime sessions, allocator growth) happens before the
+        first real request instead of during it. An exported backend that
+        was not validated while loading and fails here is replaced by torch.
+        """
+        blank = np.zeros((size, size, 3), dtype=np.uint8)
+        try:
+            self._run_blank(blank)
+        except Exception as e:
+            if self.backend == "torch":
+                raise
+            logger.warning("%s backend failed for %s (%s); using torch", self.backend, self.model_name, e)
+            self.model, self.backend = load_model(self.model_name, "torch")
+            self.class_ids = self._class_ids()
+            self._run_blank(blank)
 
-    def analyze_frame(self, frame) -> List[Dict[str, Any]]:
+    def _run_blank(self, blank: np.ndarray):
+        if self.letterboxer is not None:
+            # Also allocates the reused input tensor
+            self.model(self.letterboxer.prepare([blank])[0], verbose=False)
+        else:
+            self.model(blank, verbose=False)
+
+    def analyze_frame(self, frame) -> Detections:
         """
         Analyzes a single video frame for objects and poses.
         
@@ -26,36 +89,40 @@ class VisionEngine:
             frame: A numpy array representing the video frame.
             
         Returns:
-            A list of structured detections, ready to be converted
-            into our Pydantic schema.
+            The frame's detections as arrays; call `to_dicts()` on them
+            to get the structured dicts our Pydantic schema is built from.
+        """
+        return self.analyze_frames([frame])[0]
+
+    def analyze_frames(self, frames: List[Any]) -> List[Detections]:
         """
-        # The stream=True argument is key for real-time video processing.
-        # It's a generator object that is memory-efficient. avoids loading all result object (for each video frame) into memory at once, 
-        results = self.model(frame, stream=True, verbose=False) 
+        Analyzes several frames, running up to `batch_size` of them through
+        the model in a single forward pass.
         
-        detections = []
-        for r in results:
-            if r.boxes: # Check for object detections
-                for box in r.boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    detections.append({
-                        "type": self.model.names[int(box.cls)],
-                        "confidence": float(box.conf),
-                        "box": {"x": x1, "y": y1, "w": x2 - x1, "h": y2 - y1}
-                    })
+        Args:
+            frames: A list of numpy arrays (BGR video frames).
             
-            if r.keypoints: # Check for pose detections
-                for i, keypoints in enumerate(r.keypoints.xyn):
-                    pose_points = {}
-                    for j, p in enumerate(keypoints[0]):
-                        pose_points[f"point_{j}"] = {
-                            "x": float(p[0]),
-                            "y": float(p[1]),
-                            "score": float(r.keypoints.conf[0][i])
-                        }
-                    detections.append({
-                        "type": "pose",
-                        "confidence": float(r.keypoints.conf[0][i]),
-                        "pose": pose_points
-                    })
-        return detections
\ No newline at end of file
+        Returns:
+            One Detections container per input frame, in the same order.
+        """
+        if self.class_ids == []:
+            # None of the requested labels exist in this model
+            return [Detections.empty(self.model.names) for _ in frames]
+        detections = []
+        for start in range(0, len(frames), self.batch_size):
+            chunk = frames[start:start + self.batch_size]
+            if self.letterboxer is None:
+                # A list source is letterboxed and stacked into one batch tensor,
+                # so the per-call overhead is paid once per chunk, not per frame.
+                results = self.model(chunk, classes=self.class_ids, verbose=False)
+                detections.extend(Detections.from_result(r, self.model.names) for r in results)
+                continue
+            # The chunk is letterboxed into the engine's reused input tensor,
+            # which the model takes as is
+            batch, geometries = self.letterboxer.prepare(chunk)
+            results = self.model(batch, classes=self.class_ids, verbose=False)
+            detections.extend(
+                restore(Detections.from_result(r, self.model.names), geometry)
+                for r, geometry in zip(results, geometries)
+            )
+        return detections